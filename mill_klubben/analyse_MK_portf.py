@@ -23,17 +23,13 @@
 import pandas as pd
 import numpy as np
 import os
-import glob
-import dateutil.parser as dparser
 import datetime as dt
 import streamlit as st
 
 import matplotlib.pyplot as plt
 import plotly.express as px
-import matplotlib.dates as mdates
-import matplotlib.patches as patches
 
-from mystocks import retrievals, conversions
+from mk import cache, pricedb, plots, corporate_actions, fx, portfolio, tables, metrics, render, analytics, pricematrix, consensus
 
 # %matplotlib inline
 # -
@@ -42,8 +38,12 @@ from mystocks import retrievals, conversions
 #base_path = os.path.abspath('') 
 # easier with fixed path
 base_path = '/home/pi/projects/investment/mill_klubben/'
-data_path = base_path + 'data/'
+## MK_DATA overrides the data path like for `python -m mk`, e.g. when run from Streamlit's pages/ directory
+data_path = os.environ.get('MK_DATA', base_path + 'data').rstrip('/') + '/'
 sql_db_path = 'sqlite:///'+str(data_path)+'MK_PRICES.db'
+db_file = pricedb.db_file(sql_db_path)
+## load, valuation and render time of every run (rerun) in data/metrics/ (mk/metrics.py), one log line per rerun
+run = metrics.Run('dashboard', data_path, per_stage=False)
 
 
 
@@ -63,221 +63,240 @@ mycolors=[
 st.title("Millionærklubben portfolios")
 
 # # Prepare data from website downloads
+# - the nightly build (`python -m mk.tables`, after the price download) materializes the value per investor, the
+#   positions and the recent buys and sells in data/tables/; the dashboard only reads them
+# - without fresh tables or for another start date the stages are computed here and cached with `st.cache_data`
+# - the cache key is the newest stored snapshot and the version of MK_PRICES.db (the last write of prices), so a widget change
+#   like the start date or the investor only recomputes the cheap filtered views
+# - the price matrices come from the nightly export in data/matrix/ when it matches the stored data; they are
+#   mapped read-only once per process and shared by all sessions (`st.cache_resource`)
 
 today = dt.date.today()
 yesterday = (today - dt.timedelta(days=1))
 #round to decimals in pandas tables output
 pd.options.display.float_format = '{:,.2f}'.format
 
-# +
-# use glob to get all the csv files in the folder path = os.getcwd()
-csv_files = glob.glob(os.path.join(data_path, "*.csv"))
-
-#print("Data path is", data_path)
-#print("SQL path is", sql_db_path)
-#print("CSV files are", csv_files)
-
+first_day = portfolio.FIRST_DAY
+newest_snapshot, db_version = cache.data_version(data_path, db_file)
+actions_version = corporate_actions.version()
+tables_state = tables.read_state(data_path)
+materialized = tables.is_fresh(tables_state, newest_snapshot, actions_version)
+## the price matrices of the nightly build if they were exported from the stored data, else None
+matrix_version = pricematrix.current(data_path, pricematrix.data_key(newest_snapshot, db_version, actions_version))
+
+st.sidebar.header("Data")
+st.sidebar.text("Newest snapshot: "+str(pd.Timestamp(newest_snapshot).date()))
+if materialized:
+    st.sidebar.text("Tables built: "+tables_state['built'])
+else:
+    st.sidebar.text("Tables not built for the newest snapshot")
+if st.sidebar.button("Reload data"):
+    st.cache_data.clear() # explicit invalidation, the stages below are recomputed in this run
 
-# +
-## create dataframe from daily scraped website CSV files  
-df = pd.DataFrame()
-dates = []
-# loop over the list of csv files
-for f in csv_files:
-    # print the location and filename
-    #print('Reading file:', f.split("\\")[-1]) #debug. Will be read in non-order. 
-      
-    # read the csv file
-    x = pd.read_csv(f, sep=';', index_col=[0])
-    extracted_date = dparser.parse(f, fuzzy=True) # date parser from file name. No date in the CSV. Maybe add this in 2024?
-    x['Date'] = extracted_date
-    dates.append(extracted_date.isoformat()) 
-    df = pd.concat([x,df], axis=0)
-
-df = df.drop_duplicates()
-# -
+# # Select Start Date
 
+sd = st.date_input("Start date of analysis", value=first_day, min_value=first_day, 
+                   max_value=dt.datetime.today(), 
+                   format="YYYY-MM-DD", disabled=False, label_visibility="visible")
 
-# fix naming errors on website
-df.loc[(df.Instrument == 'AKERBP'), 'Instrument'] = 'AKRBP'
-df.loc[(df.Instrument == 'ALKb'), 'Instrument'] = 'ALK_B'
-df.loc[(df.Instrument == 'BEL'), 'Instrument'] = 'BELCO'
-df.loc[(df.Instrument == 'ATOS'), 'Instrument'] = 'ATO'
-df.loc[(df.Instrument == 'NOVOb'), 'Instrument'] = 'NOVO_B'
-df.loc[(df.Instrument == 'NOVO-B'), 'Instrument'] = 'NOVO_B'
-df.loc[(df.Instrument == 'NZYMb'), 'Instrument'] = 'NZYM_B'
-df.loc[(df.Instrument == 'NZYM-B'), 'Instrument'] = 'NZYM_B'
-df.loc[(df.Instrument == 'MAERSKb'), 'Instrument'] = 'MAERSK_B'
-#df.loc[(df.Instrument == 'GOMX_TR'), 'Antal'] = df.Antal/3 # was a 1/3 split (Lau)
-df.loc[(df.Instrument == 'GOMX_TR'), 'Instrument'] = 'GOMX'
-df.loc[(df.Ticker == 'GOMX-TR.ST'), 'Ticker'] = 'GOMX.ST'
-df.loc[(df.Instrument == 'CARLb'), 'Instrument'] = 'CARL_B'
-df.loc[(df.Ticker == 'CARLb.CO'), 'Ticker'] = 'CARL-B.CO'
-df.loc[(df.Ticker == 'TEN-NEW'), 'Ticker'] = 'TEN'
-df.loc[(df.Instrument == 'TEN_NEW'), 'Instrument'] = 'TEN'
-df.loc[(df.Ticker == 'SKFb.ST'), 'Ticker'] = 'SKF-B.ST'
-df.loc[(df.Instrument == 'SKFb'), 'Instrument'] = 'SKF_B'
 
 # +
-## Delisted must be removed it is just simpler this way
-delisted = ['VOYG', 'EURN', 'TEST', 'ALCC', 'LOCK-A017']
-df = df[~df.Instrument.isin(delisted)].dropna()
-## remove all Instruments that made it in the df, but actually were not traded and Antal is therefore 0 (aktie bytte)
-df = df.loc[~( (df.Antal.isna()) | (df.Antal==0) ) ]
+@st.cache_data(show_spinner="Loading tables ...")
+def load_tables(data_path, built):
+    """The materialized tables of the nightly build, cached until the next build."""
+    return tables.read_tables(data_path)
 
-# the price in Milan is the same as in Germany
-df.Instrument = df.Instrument.replace({'INRG':'IQQH'}) # cannot download data for iShares Clean energy from Milan
-#df = df.drop(df[df.Instrument == 'INRG'].index) # cannot download data for iShares Clean energy from Milan
-df = df.sort_values('Date').reset_index(drop=True)
 
-# +
-##sorted(df.Instrument.unique())
+@st.cache_data(show_spinner="Loading portfolio snapshots ...")
+def load_portfolios(data_path, newest_snapshot, actions_version):
+    """All snapshots since the first day, cleaned. Returns df (all investors) and m (my investors)."""
+    df = portfolio.load_snapshots(data_path, first_day, newest_snapshot)
+    return df, portfolio.my_portfolios(df)
 
-# +
-#df.tail()
-# -
-
-# ## FX for DKK conversion
 
-# +
-## this is made during each websitedownload
-#df['Amount'] = df.Antal * df.Åbningspris
+@st.cache_data(show_spinner="Loading prices ...")
+def load_prices(instruments, db_file, start, end, db_version):
+    """Close prices from the long `prices` table of MK_PRICES.db, only the rows between start and end.
 
-fx = {'USD':7.058, 'EUR':7.456, 'DKK':1, 'SEK':0.645, 'AUD':4.49, 'CAD':5.19, 'NOK':0.657}
+    Read-only connection, the DB is in WAL mode so the cronjob can write at the same time; cached until new prices are written.
+    """
+    return portfolio.load_prices(db_file, instruments, start, end)
 
-df['FX'] = df['Currency'].map(fx)
 
-#df.tail()
-# -
+@st.cache_data(show_spinner="Loading FX rates ...")
+def load_fx(currencies, db_file, start, end, db_version):
+    """Daily DKK rates per currency (stored as FX_<currency> in MK_PRICES.db)."""
+    return portfolio.load_rates(db_file, currencies, start, end)
 
-# ## Add Anders Bæk (fix)
-# From Dec 28 to Jan 4 the webpage was not updated. I make a df adjustment from Jan 1st to Jan 4th to compensate.
 
-# +
-anders_start_portfolio = df[(df.Investor ==  'Anders Bæk') & (df.Date == '2024-01-05')].sort_values('Ticker')#.loc[:,['Ticker', 'PurchaseDKK']]
+@st.cache_data(show_spinner="Valuing portfolios ...")
+def build_valuation(data_path, db_file, newest_snapshot, db_version, actions_version):
+    """DKK prices, the value per investor and the daily performance table (mk/analytics.py) over the whole history."""
+    df, m = load_portfolios(data_path, newest_snapshot, actions_version)
+    held = tuple(sorted(m.Instrument.unique()))
+    ## the splits the stored histories still show, kept on disk until a new corporate action (or a replaced history);
+    ## the prices are cached by load_prices until new ones are written, applying the splits to them is cheap
+    raw_prices = load_prices(held, db_file, first_day, newest_snapshot, db_version)
+    splits = cache.cached_frame(data_path+'cache/unadjusted_splits.parquet',
+                                (held, actions_version, pricedb.version(db_file, pricedb.HISTORIES)),
+                                lambda: corporate_actions.unadjusted_splits(raw_prices))
+    prices = corporate_actions.apply_splits(raw_prices, splits)
 
-## duplicate Anders' portfolio from the 5th for all dates prior; from 1st to 4th all is the same, dirty fix, but works
-to_add = pd.DataFrame()
-for i in range(1,5):
-    df_temp = anders_start_portfolio.drop(columns='Date').reset_index(drop=True)
-    df_temp['Date'] = dt.datetime(2024,1,i)
-    to_add = pd.concat([to_add, df_temp], ignore_index=True)
+    ## DKK prices with the FX rate of each day, matched on date and instrument labels
+    currency_of = portfolio.currencies(m)
+    rates = load_fx(tuple(sorted(currency_of.unique())), db_file, first_day, newest_snapshot, db_version)
+    dkk_prices = fx.to_dkk(prices, currency_of, rates).dropna(how='all')
 
-df = pd.concat([to_add, df], axis=0).reset_index(drop=True).sort_index()
-# -
+    cube = portfolio.holdings_cube(m, dkk_prices)
+    value_per_investor = portfolio.drop_unchanged(cube.value_per_investor(dkk_prices))
+    return prices, dkk_prices, value_per_investor, rates, analytics.daily(cube, dkk_prices)
 
-# ## Master df 'm' with all dates
-# - Remove Mads Christensen, I do not find his strategy and actions relevant
 
-## remove Mads Christiansen - since Jan 2024 anyway no longer in MK
-my_investors = ['Lars Persson', 'Lau Svenssen', 'Michael Friis Jørgensen', 'Anders Bæk']
-m = df.loc[df.Investor.isin(my_investors)].sort_values('Investor').sort_index()
-#m.tail()
-#m.loc[m.Instrument == 'SVITZR']
-#Investor	Instrument	Antal	Åbningspris	Amount	Currency	Stockexchange	Ticker	FX	Date	BuyDate	LastSeen
-m = m.rename(columns={'Åbningspris':'OpeningPrice', 'Antal':'Quantity'})
+@st.cache_resource(show_spinner="Mapping price matrices ...", max_entries=2)
+def map_prices(data_path, version):
+    """prices, dkk_prices and rates of the nightly export (mk/pricematrix.py) as read-only views into the mapped files.
 
-# # Select Start Date
+    A resource, not data: all sessions share the same mapping instead of unpickling their own copy; a new export
+    is a new version and mapped on the next run.
+    """
+    return pricematrix.open_matrix(data_path, version)
 
-sd = st.date_input("Start date of analysis", value=dt.datetime(2024,1,1), min_value=dt.datetime(2024,1,1), 
-                   max_value=dt.datetime.today(), 
-                   format="YYYY-MM-DD", disabled=False, label_visibility="visible")
-# show table with the selected start date
-m = m[m.Date >= pd.to_datetime(sd)]
-#m.tail()
 
-# Group by 'Instrument' and find the first appearing and last date
-## MAGIC !! first and last are applied functions??
-buy_sell_dates = m.reset_index().groupby(['Investor','Instrument']).agg({'Date': ['first', 'last']})
-buy_sell_dates.columns = buy_sell_dates.columns.droplevel(0)
-buy_sell_dates = buy_sell_dates.rename(columns={'last':'LastSeen', 'first':'BuyDate'})
-#buy_sell_dates.tail()
+@st.cache_data(show_spinner="Valuing portfolios ...")
+def value_from_matrix(data_path, newest_snapshot, actions_version, version, _dkk_prices):
+    """The value per investor and the daily performance table from the mapped DKK prices of export `version`."""
+    df, m = load_portfolios(data_path, newest_snapshot, actions_version)
+    cube = portfolio.holdings_cube(m, _dkk_prices)
+    return portfolio.drop_unchanged(cube.value_per_investor(_dkk_prices)), analytics.daily(cube, _dkk_prices)
 
-## add the first and last seen dates
-mbs = m.set_index(['Investor', 'Instrument']).merge(
-    buy_sell_dates, right_index=True, left_index=True, how='outer').reset_index()
 
-# ## Prices
-# have this here, so the streamlit is loaded
+@st.cache_data(show_spinner="Calculating returns ...")
+def build_positions(sd, data_path, db_file, newest_snapshot, db_version, actions_version, _mbs, _prices):
+    """curr_all: one row per investor and instrument with buy date, last seen and return since sd.
 
-# +
-prices = retrievals.sql_price(list(m.Instrument.unique()), sql_db_path )
-prices = prices.sort_index()
+    Cached per start date; mbs and prices are derived from the same keys and therefore not hashed.
+    """
+    return portfolio.positions(_mbs, _prices)
 
-## make consecutive, because I have some Buys that are on weekends (website update)
-prices = conversions.create_full_date_df(prices).loc[sd:] # also limit to selected date 'sd'
 
-prices = prices.reindex(sorted(prices.columns), axis=1)
+@st.cache_data(show_spinner="Comparing portfolios ...")
+def build_consensus(sd, data_path, newest_snapshot, db_version, actions_version, _m, _dkk_prices):
+    """consensus, overlap and consensus_events since sd (mk/consensus.py), cached per start date like the positions."""
+    return consensus.compute(_m, _dkk_prices)
 
-## create df that contains the FX for multiplying later with prices
-fx_df = pd.DataFrame(data=m[['Instrument', 'FX']]).drop_duplicates().set_index('Instrument').sort_index()
 
 # -
 
-len(prices.columns)
-
-## multiplying did not work as I wanted, this is a method that works 
-## IMPORTANT that the dfs are sorted and same length
-dkk_prices = pd.DataFrame(prices.values*fx_df.T.values, columns=prices.columns, index=prices.index).dropna(how='all')
-
-# ## Quantity
-
-## create pivot df that has all stock quantity per date
-q = mbs.pivot_table(index='Date', columns=['Investor', 'Instrument'], values='Quantity').sort_index().dropna(how='all', axis=1)
-#q.tail()
-
-
-# ## Value
-
-# +
-## create value df and the sum of invested stocks per investor per date
-## this is in stock currency still
-value = q.multiply(dkk_prices, level=1, axis='columns').drop_duplicates().dropna(how='all').sort_index()
-
-value_per_investor = value.T.groupby(level=0).sum().T.sort_index()
-# -
+if materialized and pd.Timestamp(sd) == first_day:
+    ## nightly tables, the time to read them does not grow with the history
+    with run.stage('load', source='tables') as s:
+        mt = load_tables(data_path, tables_state['built'])
+        value_per_investor, curr_all = mt['value_per_investor'], mt['positions']
+        rec_sold, rec_buy = mt['recent_sold'], mt['recent_bought']
+        performance, investor_metrics = mt['daily_performance'], mt['investor_metrics']
+        consensus_table, overlap_table, consensus_events = mt['consensus'], mt['overlap'], mt['consensus_events']
+        s['rows'] = len(curr_all)
+    ## the matplotlib figures of the tables are images in data/figures/ (mk/render.py), usually already
+    ## rendered by the cronjob; only drawn here if the tables changed since
+    with run.stage('render', figure='cached') as s:
+        s['rows'] = len(render.render(data_path, mt))
+    cached_figures = True
+else:
+    cached_figures = False
+    with run.stage('load', source='snapshots') as s:
+        df, m = load_portfolios(data_path, newest_snapshot, actions_version)
+        s['rows'] = len(df)
+    with run.stage('valuation') as s:
+        if matrix_version is not None:
+            ## the matrices exported by the nightly build, mapped once for all sessions
+            mapped = map_prices(data_path, matrix_version)
+            prices, dkk_prices, rates = mapped['prices'], mapped['dkk_prices'], mapped['rates']
+            value_per_investor, performance = value_from_matrix(data_path, newest_snapshot, actions_version, matrix_version, dkk_prices)
+        else:
+            prices, dkk_prices, value_per_investor, rates, performance = build_valuation(data_path, db_file, newest_snapshot, db_version, actions_version)
+        ## FX rate to DKK on each snapshot day, e.g. for the invested amount
+        m['FX'] = fx.lookup_rates(rates, m.Date, m.Currency)
+        s['rows'] = len(value_per_investor)
+
+    # show table with the selected start date
+    m = m[m.Date >= pd.to_datetime(sd)]
+    prices = prices.loc[sd:] # also limit to selected date 'sd'
+    value_per_investor = value_per_investor.loc[sd:]
+
+    ## add the first and last seen dates
+    with run.stage('positions') as s:
+        mbs = portfolio.holding_periods(m)
+        curr_all = build_positions(sd, data_path, db_file, newest_snapshot, db_version, actions_version, mbs, prices)
+        curr_all = analytics.position_metrics(curr_all, newest_snapshot)
+        rec_sold, rec_buy = portfolio.recent_trades(curr_all)
+        s['rows'] = len(curr_all)
+    with run.stage('analytics') as s:
+        investor_metrics = analytics.summary(performance, curr_all, start=sd)
+        s['rows'] = len(investor_metrics)
+    with run.stage('consensus') as s:
+        cons = build_consensus(sd, data_path, newest_snapshot, db_version, actions_version, m, dkk_prices)
+        consensus_table, overlap_table, consensus_events = cons['consensus'], cons['overlap'], cons['consensus_events']
+        s['rows'] = len(consensus_table)
 
-## make some lists
-all_tickers = df.Ticker.unique()
-all_investors = df.Investor.unique()
 ## I originally deselected Mads Christiansen 
-my_investors = m.Investor.unique()
-my_tickers = m.Ticker.unique()
-my_instruments = m.Instrument.unique()
+my_investors = curr_all.Investor.unique()
 
 # # Overview all investors
 
 st.subheader("Overview all investors")
 
-fig, ax = plt.subplots(figsize=[12,6])
-ax.plot(value_per_investor)
-ax.set_title('Value of investments without Cash')
-ax.legend(value_per_investor.columns)
-ax.set_ylabel('DKK')
-fig.show();
-st.pyplot(fig)
-
-# +
-## Now with all investors
-curr_all = mbs.groupby(['Investor','Instrument']).last()
-curr_all['InvestedDKK'] = curr_all.Amount * curr_all.FX
-
-curr_all = curr_all.loc[curr_all.Date == curr_all['LastSeen']].reset_index()
+if cached_figures:
+    st.image(str(render.figure_file(data_path, 'value_per_investor')), use_container_width=True)
+else:
+    fig = plots.value_per_investor(value_per_investor)
+    st.pyplot(fig)
 
-for i in range(0, len(curr_all)):
-    buy_price = prices.loc[curr_all.BuyDate[i], curr_all.Instrument[i]]
-    sell_price = prices.loc[curr_all.LastSeen[i], curr_all.Instrument[i]]
-    #print("Buy price of", trans.Instrument[i], "was", round(buy_price, 2), "on", trans.Buy[i])
-    curr_all.loc[i, 'BuyPrice'] = buy_price
-    curr_all.loc[i, 'LastPrice'] = sell_price
-    curr_all.loc[i, 'Return'] = ((float(sell_price)-buy_price)/buy_price)       
+# ## Performance
 
-## NVIDIA fix split during holding this stock
-curr_all.loc[curr_all.Instrument == 'NVDA', 'BuyPrice' ] = curr_all['BuyPrice'].loc[curr_all.Instrument == 'NVDA'] /10 
+# +
+## time- and money-weighted return since the start date, drawdown, volatility and hit rate (mk/analytics.py)
+st.subheader("Performance")
+st.dataframe(investor_metrics.style.format({c: '{:.1%}' for c in ['TWR', 'MWR', 'MaxDrawdown', 'Vol30', 'Vol90', 'HitRate']}))
+performance_series = analytics.series(performance, None if cached_figures else sd)
+col1, col2 = st.columns(2)
+col1.caption("Time-weighted return (growth of 1)")
+col1.line_chart(performance_series['TWR'])
+col2.caption("Drawdown")
+col2.area_chart(performance_series['Drawdown'])
+selected_vol = st.radio("Volatility window", ['Vol30', 'Vol90'], horizontal=True, format_func=lambda c: c[3:] + ' days')
+st.caption("Rolling volatility p.a.")
+st.line_chart(performance_series[selected_vol])
+# -
 
-curr_all['AfkastDKK'] = curr_all.InvestedDKK * curr_all.Return
-curr_all['Days'] = curr_all.LastSeen - curr_all.BuyDate
+# ## Overlap and consensus
 
+# +
+## investors holding the same instruments (mk/consensus.py): the pairwise overlap on the newest day and the
+## number of holders per instrument over time
+st.subheader("Overlap and consensus")
+overlap_measure = st.radio("Overlap", ['Jaccard', 'ValueOverlap'], horizontal=True,
+                           format_func=lambda c: {'Jaccard': 'Shared instruments (Jaccard)', 'ValueOverlap': 'Value weighted'}[c])
+overlap_day = overlap_table[overlap_table.Date == overlap_table.Date.max()]
+## both orders of every pair, 1 on the diagonal
+pairs = pd.concat([overlap_day, overlap_day.rename(columns={'InvestorA': 'InvestorB', 'InvestorB': 'InvestorA'})])
+overlap_investors = sorted(set(pairs.InvestorA))
+heat = pairs.pivot(index='InvestorA', columns='InvestorB', values=overlap_measure).reindex(index=overlap_investors, columns=overlap_investors)
+heat = heat.where(~np.eye(len(overlap_investors), dtype=bool), 1.0)
+if overlap_day.empty:
+    st.text("No two investors to compare!")
+else:
+    fig = px.imshow(heat, text_auto='.2f', zmin=0, zmax=1, color_continuous_scale='Blues',
+                    labels={'x': '', 'y': '', 'color': overlap_measure})
+    st.plotly_chart(fig, use_container_width=True)
+
+## only the instruments that were held by several investors at some point
+shared_instruments = consensus_table.loc[consensus_table.Holders >= consensus.MIN_HOLDERS, 'Instrument'].unique()
+holders = consensus_table[consensus_table.Instrument.isin(shared_instruments)].pivot(index='Instrument', columns='Date', values='Holders').fillna(0)
+fig = px.imshow(holders, aspect='auto', color_continuous_scale='Reds', labels={'x': '', 'y': '', 'color': 'Holders'})
+st.plotly_chart(fig, use_container_width=True)
+st.text("New consensus: instruments that another investor started to hold")
+st.dataframe(consensus_events.sort_values('Date', ascending=False)[['Date', 'Instrument', 'Holders', 'PrevHolders', 'Investors', 'Value']])
+# -
 
 # +
 data = curr_all[['Investor','Instrument','Return']].copy().sort_values('Return')
@@ -323,52 +342,14 @@ st.dataframe(curr_si[['Instrument', 'Quantity', 'InvestedDKK', 'Days', 'ReturnPc
 
 # +
 # Plot the Buy and Sell bar chart
-investor_colors = {'Lars Persson': 'c', 'Lau Svenssen': 'm', 'Mads Christiansen': 'y', 'Michael Friis Jørgensen': 'b', 'Anders Bæk': 'orange'}
-
-## PLOT
-fig = plt.figure(figsize=[14,12])
-ax0 = plt.subplot(121)
-
-for index, row in curr_all.iterrows():
-    ax0.barh(y=row['Instrument'], width=row['Days'], left=row['BuyDate'], color=investor_colors[row['Investor']])
-
-# Make ticks on occurrences of each month:
-ax0.set_title('Holding period')
-ax0.xaxis.set_major_locator(mdates.MonthLocator())
-# Get only the month to show in the x-axis:
-ax0.xaxis.set_major_formatter(mdates.DateFormatter('%b'))
-ax0.set_xlabel('Timeline')
-ylim = ax0.get_ylim()
-ax0.vlines(today, ylim[0], ylim[1], colors='r')
-ax0.xaxis.grid(True, alpha=0.5)
-
-#------ second plot
-ax1 = plt.subplot(122, sharey=ax0)
-
-## the trades
-for index, row in curr_all.iterrows():
-    ax1.barh(y=row['Instrument'], width=row['InvestedDKK']/1000, left=0, color='grey', alpha=0.6)
-
-## only the currently helt stocks
-for index, row in curr_all.loc[curr_all.LastSeen == today.strftime('%Y-%m-%d')].iterrows():
-    ax1.barh(y=row['Instrument'], width=row['InvestedDKK']/1000, left=0, color=investor_colors[row['Investor']], alpha=0.9)
-
-ax1.set_title("Invested for DKK")
-ax1.xaxis.grid(True, alpha=0.5)
-ax1.yaxis.tick_right()
-ax1.set_xlabel('TDKK')
-
-plt.gca().invert_yaxis()
-
-# Adding a legend
-patch = []
-for i in investor_colors:
-    patch.append(patches.Patch(color=investor_colors[i]))
-ax1.legend(handles=patch, labels=investor_colors.keys(), fontsize=11)
-
-plt.savefig(fname=str(base_path)+'/portfolio_movements.png', dpi=150, transparent=None)
-plt.show();
-st.pyplot(fig=plt, clear_figure=None, use_container_width=True)
+## PLOT holding periods and invested amounts, the currently held stocks in colour (mk/plots.py)
+if cached_figures:
+    st.image(str(render.figure_file(data_path, 'portfolio_movements')), use_container_width=True)
+else:
+    with run.stage('render', figure='portfolio_movements') as s:
+        fig = plots.portfolio_movements(curr_all, today)
+        s['rows'] = len(curr_all)
+    st.pyplot(fig=fig, clear_figure=None, use_container_width=True)
 # -
 
 bs = curr_all.copy()
@@ -379,24 +360,8 @@ bs = curr_all.copy()
 
 st.header("Sold and Bought")
 
-# +
-# get first and last datetime for final week of data
-days = 14
-range_max = bs['LastSeen'].max()# - dt.timedelta(days=1) # that should be today, or yesterday, if the cronjob runs as expected and I run this in the evening or during the day, respectively
-range_min = range_max - dt.timedelta(days=days)
-
-# take slice with final week of data
-rec_sold = bs[(bs['LastSeen'] >= range_min) &
-              (bs['LastSeen'] <= range_max) &
-              (bs['Quantity'] == 0)].reset_index(drop=True)
-
-range_max = bs['BuyDate'].max() # that should be today, or yesterday, if the cronjob runs as expected and I run this in the evening or during the day, respectively
-range_min = range_max - dt.timedelta(days=days)
-
-# take slice with final week of data
-rec_buy = bs[(bs['BuyDate'] >= range_min) & 
-             (bs['BuyDate'] <= range_max) &
-             (bs['Quantity'] > 0)].reset_index(drop=True)
+## rec_sold and rec_buy come with curr_all (nightly tables or portfolio.recent_trades)
+days = portfolio.RECENT_DAYS
 
 # +
 cols = ['Investor', 'Instrument', 'Days', 'Quantity', 'InvestedDKK', 'Return']
@@ -424,8 +389,15 @@ date_frame_days = 10 # days before and after
 range_min = bs['BuyDate'].min() - dt.timedelta(days=date_frame_days)
 range_max = bs['LastSeen'].max() + dt.timedelta(days=date_frame_days)
 
+## only the sold instruments; the whole history, so the split adjustment sees both sides of a split
+sold = tuple(sorted(rec_sold.Instrument.unique()))
+if matrix_version is not None:
+    ## the sold instruments were held, so they are columns of the exported matrix
+    prices = map_prices(data_path, matrix_version)['prices'].reindex(columns=list(sold))
+else:
+    prices = corporate_actions.adjusted_prices(load_prices(sold, db_file, first_day, newest_snapshot, db_version)) if sold else pd.DataFrame(index=pd.DatetimeIndex([]))
 mask = (prices.index >= range_min) & (prices.index < range_max)
-masked_prices = prices.loc[mask, rec_sold.Instrument].sort_index().dropna(how='all') ########## use this df for masked price analysis
+masked_prices = prices.loc[mask].reindex(columns=rec_sold.Instrument).sort_index().dropna(how='all') ########## use this df for masked price analysis
 # -
 
 for i in rec_sold.index:
@@ -440,11 +412,4 @@ fig.show();
 ## problem, if nothing sold, then the last figure (the big plot) is shown instead of the plot form the code above
 #st.pyplot(fig=fig, clear_figure=None, use_container_width=True)
 
-
-
-
-
-
-
-
-
+run.finish()
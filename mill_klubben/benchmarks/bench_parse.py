@@ -0,0 +1,66 @@
+# Benchmark and check of the Saxo page parsers on the saved pages in benchmarks/fixtures/
+# - run from mill_klubben/ with `python -m benchmarks.bench_parse`
+# - both parsers must return the table in the CSV next to each page, then both are timed on the page
+#   as saved and with 100 and 1,000 blocks of unrelated page content around the tables
+# - `python -m benchmarks.bench_parse --write-fixtures` renders the pages again from the daily CSV files in data/
+# - the fixtures are rendered by mk.standin, so they only show that both parsers read the same markup; the pages
+#   captured from home.saxo by the scraper (data/pages/, mk.archive) are checked too: both parsers must agree on
+#   every archived page
+
+import sys
+import timeit
+from pathlib import Path
+
+import pandas as pd
+
+from mk import saxo, standin, store, archive
+
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+DATA_PATH = Path(__file__).parent.parent / 'data'
+FIXTURE_DATES = ['2024-01-05', '2024-06-10', '2024-10-07']
+
+
+def write_fixtures(data_path=DATA_PATH):
+    FIXTURES.mkdir(exist_ok=True)
+    for d in FIXTURE_DATES:
+        snapshot = store.read_csv_snapshot(Path(data_path) / ('mill_klubben_portf-' + d + '.csv'))
+        html = standin.render_page(snapshot)
+        (FIXTURES / ('saxo-' + d + '.html')).write_text(html)
+        saxo.parse_page_bs4(html.encode()).to_csv(FIXTURES / ('saxo-' + d + '.csv'), sep=';', index=False)
+
+
+def check(content, expected):
+    for parse in (saxo.parse_page, saxo.parse_page_bs4):
+        pd.testing.assert_frame_equal(parse(content)[expected.columns], expected, check_dtype=False, obj=parse.__name__)
+
+
+def check_archive(data_path=DATA_PATH):
+    """Compare both parsers on the last captured page of every archived day; the number of pages checked."""
+    pages = archive.daily_pages(archive.read_index(data_path)).File.unique()
+    for file in pages:
+        content = archive.read_page(data_path, file)
+        pd.testing.assert_frame_equal(saxo.parse_page(content), saxo.parse_page_bs4(content), check_dtype=False, obj=file)
+    return len(pages)
+
+
+def run(fillers=(0, 100, 1000), repeat=5):
+    rows = []
+    for file in sorted(FIXTURES.glob('saxo-*.html')):
+        expected = pd.read_csv(file.with_suffix('.csv'), sep=';')
+        check(file.read_bytes(), expected)
+        for filler in fillers:
+            content = file.read_bytes() if filler == 0 else standin.render_page(expected, filler).encode()
+            check(content, expected)
+            bs4 = min(timeit.repeat(lambda: saxo.parse_page_bs4(content), number=1, repeat=repeat))
+            lxml = min(timeit.repeat(lambda: saxo.parse_page(content), number=1, repeat=repeat))
+            rows.append({'Page': file.stem, 'KB': len(content) / 1024, 'Positions': len(expected),
+                         'BS4_read_html_s': bs4, 'lxml_s': lxml, 'Speedup': bs4 / lxml})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    if '--write-fixtures' in sys.argv:
+        write_fixtures()
+    print(run().to_string(index=False, float_format='{:,.4f}'.format))
+    print(check_archive(), 'archived pages parsed alike by both parsers')
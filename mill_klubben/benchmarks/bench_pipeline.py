@@ -0,0 +1,155 @@
+# Benchmark of the whole scrape -> price -> analyse pipeline on synthetic data (benchmarks/synthetic.py)
+# - run from mill_klubben/ with `python -m benchmarks.bench_pipeline [--days 280 1000 ...] [--investors 4] [--instruments 60]`
+# - every stage is timed as the scripts run it: the page scrape and the price download against the local
+#   stand-ins (mk.standin), snapshot loading, normalization, SQLite price reads, the DKK valuation,
+#   the curr_all returns and the rendering of the portfolio_movements chart
+# - the best of `--repeat` runs per stage is appended to benchmarks/results/pipeline.csv with the git commit;
+#   stages more than THRESHOLD times slower than in the last run of the same size are flagged
+#   (`--check` exits with 1 then, e.g. before merging)
+
+import io
+import sys
+import timeit
+import argparse
+import tempfile
+import subprocess
+import datetime as dt
+from pathlib import Path
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from mk import saxo, store, pricedb, instruments, download, portfolio, fx, plots, standin
+from benchmarks import synthetic
+
+
+RESULTS = Path(__file__).parent / 'results' / 'pipeline.csv'
+SIZE = ['Investors', 'Instruments', 'Days']
+THRESHOLD = 1.5
+INVESTOR_COLORS = ['c', 'm', 'y', 'b', 'orange', 'g', 'r', 'k']
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        return ''
+
+
+def best(f, repeat):
+    return min(timeit.repeat(f, number=1, repeat=repeat))
+
+
+def scrape(url):
+    content, _ = saxo.fetch(url, validators={})
+    return instruments.normalize(saxo.parse_page(content), drop_delisted=True)
+
+
+def download_prices(url, ins, db_file):
+    con = pricedb.connect(db_file)
+    tickers = dict(zip(ins.Ticker, ins.Instrument))
+    tickers.update(fx.fx_instruments(ins.Currency.unique()))
+    summary = pricedb.update(con, tickers, download.YahooFetcher(url), full_refresh=True, retries=0)
+    con.close()
+    return summary
+
+
+def render(curr_all, today):
+    colors = dict(zip(curr_all.Investor.unique(), INVESTOR_COLORS))
+    fig = plots.portfolio_movements(curr_all, today, colors)
+    fig.savefig(io.BytesIO(), format='png', dpi=150)
+    plt.close(fig)
+
+
+def run_size(data_path, n_investors, n_instruments, n_days, repeat=3, seed=0):
+    """Seconds per stage for one synthetic data set."""
+    ins, closes, snapshots = synthetic.generate(data_path, n_investors, n_instruments, n_days, seed=seed)
+    db_file = Path(data_path) / 'MK_PRICES.db'
+    last = snapshots.loc[snapshots.Date == snapshots.Date.max()]
+    times = {}
+
+    with standin.PageServer(standin.render_page(last)) as url:
+        times['scrape'] = best(lambda: scrape(url), repeat)
+    server = standin.PriceServer(synthetic.price_frames(ins, closes), today=closes.index.max())
+    with server as url:
+        times['download_prices'] = best(lambda: download_prices(url, ins, Path(data_path) / 'download.db'), repeat)
+
+    times['load_snapshots'] = best(lambda: store.load_snapshots(data_path), repeat)
+    raw = store.load_snapshots(data_path)
+    times['normalize'] = best(lambda: instruments.normalize(raw, drop_delisted=True), repeat)
+    times['clean_snapshots'] = best(lambda: portfolio.load_snapshots(data_path), repeat)
+    m = portfolio.my_portfolios(portfolio.load_snapshots(data_path))
+    end = m.Date.max()
+
+    held = sorted(m.Instrument.unique())
+    currency_of = portfolio.currencies(m)
+    currencies = tuple(sorted(currency_of.unique()))
+    times['read_prices'] = best(lambda: (portfolio.load_prices(db_file, held, portfolio.FIRST_DAY, end),
+                                         portfolio.load_rates(db_file, currencies, portfolio.FIRST_DAY, end)), repeat)
+    prices = portfolio.load_prices(db_file, held, portfolio.FIRST_DAY, end)
+    rates = portfolio.load_rates(db_file, currencies, portfolio.FIRST_DAY, end)
+    m['FX'] = fx.lookup_rates(rates, m.Date, m.Currency)
+
+    def valuation():
+        dkk_prices = fx.to_dkk(prices, currency_of, rates).dropna(how='all')
+        return portfolio.drop_unchanged(portfolio.value_per_investor(m, dkk_prices))
+    times['valuation'] = best(valuation, repeat)
+    times['curr_all'] = best(lambda: portfolio.positions(portfolio.holding_periods(m), prices), repeat)
+    curr_all = portfolio.positions(portfolio.holding_periods(m), prices)
+    times['render_chart'] = best(lambda: render(curr_all, end), repeat)
+
+    rows = pd.DataFrame({'Stage': list(times), 'Seconds': list(times.values())})
+    return rows.assign(Investors=n_investors, Instruments=n_instruments, Days=n_days,
+                       Rows=len(snapshots), Positions=len(curr_all))
+
+
+def compare(results, previous):
+    """Results with the seconds of the last earlier run of the same size and stage, and the ratio."""
+    if previous is None or previous.empty:
+        return results.assign(Previous=float('nan'), Ratio=float('nan'))
+    last = previous.sort_values('Run').drop_duplicates(SIZE + ['Stage'], keep='last')
+    res = results.merge(last[SIZE + ['Stage', 'Seconds']].rename(columns={'Seconds': 'Previous'}), on=SIZE + ['Stage'], how='left')
+    return res.assign(Ratio=res.Seconds / res.Previous)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the pipeline stages on synthetic data.')
+    parser.add_argument('--days', type=int, nargs='+', default=[280, 1000])
+    parser.add_argument('--investors', type=int, default=4)
+    parser.add_argument('--instruments', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', default=RESULTS, help='CSV the results are appended to')
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--check', action='store_true', help='exit with 1 if a stage is slower than THRESHOLD x the last run')
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_days in args.days:
+        with tempfile.TemporaryDirectory() as tmp:
+            results.append(run_size(tmp, args.investors, args.instruments, n_days, args.repeat, args.seed))
+    results = pd.concat(results, ignore_index=True)
+    results.insert(0, 'Run', dt.datetime.now().isoformat(timespec='seconds'))
+    results.insert(1, 'Commit', git_commit())
+
+    file = Path(args.results)
+    previous = pd.read_csv(file, sep=';') if file.exists() else None
+    res = compare(results, previous)
+    res['Slower'] = res.Ratio > THRESHOLD
+    print(res[SIZE + ['Rows', 'Positions', 'Stage', 'Seconds', 'Previous', 'Ratio', 'Slower']]
+          .to_string(index=False, float_format='{:,.4f}'.format))
+
+    if not args.no_save:
+        file.parent.mkdir(parents=True, exist_ok=True)
+        results.to_csv(file, sep=';', index=False, mode='a', header=not file.exists())
+    if args.check and res.Slower.any():
+        print('slower than', THRESHOLD, 'x the last run:', ', '.join(res.loc[res.Slower, 'Stage'].unique()))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+# Micro-benchmark: per-row loop vs. vectorized lookup for BuyPrice / LastPrice / Return
+# - run from mill_klubben/ with `python -m benchmarks.bench_returns`
+# - synthetic price matrix (calendar days x instruments) and random positions, 100 to 10,000 rows
+
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from mk import valuation
+
+
+def make_data(n_positions, n_instruments=200, n_days=730, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2024-01-01', periods=n_days, name='Date')
+    instruments = ['I%03d' % i for i in range(n_instruments)]
+    prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, .01, (n_days, n_instruments)), axis=0)),
+                          index=dates, columns=instruments)
+    buy = rng.integers(0, n_days - 1, n_positions)
+    held = rng.integers(1, n_days, n_positions)
+    positions = pd.DataFrame({'Instrument': rng.choice(instruments, n_positions),
+                              'BuyDate': dates[buy], 'LastSeen': dates[np.minimum(buy + held, n_days - 1)]})
+    return positions, prices
+
+
+def loop_returns(curr_all, prices):
+    ## the former per-row implementation of analyse_MK_portf.py
+    for i in range(0, len(curr_all)):
+        buy_price = prices.loc[curr_all.BuyDate[i], curr_all.Instrument[i]]
+        sell_price = prices.loc[curr_all.LastSeen[i], curr_all.Instrument[i]]
+        curr_all.loc[i, 'BuyPrice'] = buy_price
+        curr_all.loc[i, 'LastPrice'] = sell_price
+        curr_all.loc[i, 'Return'] = ((float(sell_price)-buy_price)/buy_price)
+    return curr_all
+
+
+def run(sizes=(100, 1000, 10000), repeat=3):
+    rows = []
+    for n in sizes:
+        positions, prices = make_data(n)
+        loop = min(timeit.repeat(lambda: loop_returns(positions.copy(), prices), number=1, repeat=repeat))
+        vect = min(timeit.repeat(lambda: valuation.add_returns(positions.copy(), prices), number=1, repeat=repeat))
+        a = loop_returns(positions.copy(), prices)
+        b = valuation.add_returns(positions.copy(), prices)
+        assert np.allclose(a.Return, b.Return)
+        rows.append({'Positions': n, 'Loop_s': loop, 'Vectorized_s': vect, 'Speedup': loop / vect})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or (100, 1000, 10000)
+    print(run(sizes).to_string(index=False, float_format='{:,.4f}'.format))
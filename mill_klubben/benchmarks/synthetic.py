@@ -0,0 +1,112 @@
+# Synthetic snapshot histories and price databases for the benchmarks
+# - `n_investors` portfolios of about `positions` stocks each, drawn from `n_instruments` instruments on four
+#   exchanges (DKK, USD, EUR, SEK); on weekdays an investor sells or buys a position with probability `trade_rate`,
+#   at weekends the page is unchanged like the real one
+# - the first investors are the ones the dashboard follows (portfolio.MY_INVESTORS), the rest are named 'Investor NN'
+# - close prices are random walks on weekdays, stored like the download does (pricedb) together with the FX_ rates
+# - everything depends on the seed only, `python -m benchmarks.synthetic PATH [investors instruments days]` writes a data dir
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from mk import store, pricedb, instruments, fx, portfolio
+
+
+EXCHANGES = [('xcse', 'DKK'), ('xnys', 'USD'), ('xetr', 'EUR'), ('xome', 'SEK')]
+RATES = {'USD': 6.9, 'EUR': 7.46, 'SEK': 0.64}
+
+
+def make_instruments(n_instruments):
+    """Instrument, Stockexchange, Currency and Yahoo Ticker of the synthetic instruments."""
+    ins = pd.DataFrame({'Instrument': ['SYN%03d' % i for i in range(n_instruments)],
+                        'Stockexchange': [EXCHANGES[i % len(EXCHANGES)][0] for i in range(n_instruments)],
+                        'Currency': [EXCHANGES[i % len(EXCHANGES)][1] for i in range(n_instruments)]})
+    ins['Ticker'] = instruments.yahoo_ticker(ins.Instrument, ins.Stockexchange)
+    return ins
+
+
+def make_closes(ins, dates, seed=0):
+    """Date x Instrument closes on weekdays (random walks), plus the FX_ rate series."""
+    rng = np.random.default_rng(seed + 1)
+    days = dates[dates.dayofweek < 5]
+    walk = np.exp(np.cumsum(rng.normal(0, .015, (len(days), len(ins))), axis=0))
+    closes = pd.DataFrame(rng.uniform(20, 500, len(ins)) * walk, index=days, columns=ins.Instrument)
+    for c, rate in RATES.items():
+        closes[fx.fx_instrument(c)] = rate * np.exp(np.cumsum(rng.normal(0, .003, len(days))))
+    return closes.rename_axis('Date')
+
+
+def make_snapshots(ins, closes, dates, n_investors, positions=10, trade_rate=0.15, seed=0):
+    """One portfolio table per investor and calendar day in the layout of the stored snapshots."""
+    rng = np.random.default_rng(seed)
+    investors = (portfolio.MY_INVESTORS + ['Investor %02d' % i for i in range(n_investors)])[:n_investors]
+    last_close = closes[ins.Instrument].reindex(dates, method='ffill').bfill().to_numpy()
+    held = {inv: {} for inv in investors} # instrument position -> (Antal, Åbningspris)
+
+    def buy(h, day):
+        free = np.setdiff1d(np.arange(len(ins)), list(h))
+        if len(free):
+            i = rng.choice(free)
+            h[i] = (int(rng.integers(1, 50)) * 10, round(float(last_close[day, i]), 2))
+
+    frames = []
+    for day, date in enumerate(dates):
+        for inv in investors:
+            h = held[inv]
+            if day == 0:
+                while len(h) < positions and len(h) < len(ins):
+                    buy(h, day)
+            elif date.dayofweek < 5 and rng.random() < trade_rate:
+                if h and (len(h) >= positions * 1.5 or rng.random() < 0.5):
+                    del h[rng.choice(list(h))]
+                else:
+                    buy(h, day)
+            i = np.fromiter(h, dtype=int, count=len(h))
+            frames.append(pd.DataFrame({'Date': date, 'Investor': inv,
+                                        'Instrument': ins.Instrument.to_numpy()[i],
+                                        'Antal': [h[k][0] for k in i], 'Åbningspris': [h[k][1] for k in i],
+                                        'Currency': ins.Currency.to_numpy()[i],
+                                        'Stockexchange': ins.Stockexchange.to_numpy()[i],
+                                        'Ticker': ins.Ticker.to_numpy()[i]}))
+    df = pd.concat(frames, ignore_index=True)
+    df['Amount'] = df.Antal * df.Åbningspris
+    return df
+
+
+def write_prices(closes, db_file):
+    con = pricedb.connect(db_file)
+    for instrument in closes.columns:
+        pricedb.write_closes(con, instrument, closes[instrument].reset_index().rename(columns={instrument: 'Close'}))
+        pricedb.set_watermark(con, instrument)
+    con.close()
+
+
+def price_frames(ins, closes):
+    """{Yahoo ticker: DataFrame(Date, Close)} of all instruments and rates, as served by standin.PriceServer."""
+    tickers = dict(zip(ins.Instrument, ins.Ticker))
+    tickers.update({v: k for k, v in fx.fx_instruments(RATES).items()})
+    return {tickers[c]: closes[c].reset_index().rename(columns={c: 'Close'}) for c in closes.columns}
+
+
+def generate(data_path, n_investors=4, n_instruments=60, n_days=280, positions=10, seed=0, start=portfolio.FIRST_DAY):
+    """Write a snapshot store and MK_PRICES.db into data_path; returns the instruments, closes and snapshots."""
+    data_path = Path(data_path)
+    data_path.mkdir(parents=True, exist_ok=True)
+    dates = pd.date_range(start, periods=n_days, name='Date')
+    ins = make_instruments(n_instruments)
+    closes = make_closes(ins, dates, seed)
+    snapshots = make_snapshots(ins, closes, dates, n_investors, positions=positions, seed=seed)
+    store.write_snapshots(snapshots, data_path)
+    ## unchanged days (weekends, no trades) become manifest entries like in the real store
+    store.compact(data_path)
+    write_prices(closes, data_path / 'MK_PRICES.db')
+    return ins, closes, snapshots
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[2:5]]
+    ins, closes, snapshots = generate(sys.argv[1], *sizes)
+    print(len(snapshots), 'snapshot rows over', snapshots.Date.nunique(), 'days and', len(closes.columns), 'price series in', sys.argv[1])
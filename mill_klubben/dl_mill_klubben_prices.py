@@ -18,114 +18,60 @@
 # - dowload price data with Yahooquery and update the SQL
 
 import os
-import glob
-import dateutil.parser as dparser
+from pathlib import Path
 import pandas as pd
-from time import sleep
 import datetime as dt
-import numpy as np
-from mystocks import retrievals, definitions, conversions
-
-
-ex_dict = {
-    'xcse': '.CO',
-    'xmil': '.MI', # eigentlich Milan
-    'xosl': '.OL',
-    'xome': '.ST',
-    'xhel': '.HE',
-    'xetr': '.DE',
-    'xams': '.AS',
-    'xpar': '.PA',
-    'xnys': '',
-    'xtse': '.TO',
-    'xtsx': '',
-    'xasx': '.AX',
-    'xlon': '.L',
-    'xnas': ''
-          }
+from mk import download, pricedb, metrics, jobs
 
 # +
-#base_path = Path(__file__).parent
-#data_path = base_path / 'data'
-
-
-base_path = os.path.abspath('')
-data_path = base_path + '/data'
-sql_db_path = 'sqlite:///'+str(data_path)+'/MK_PRICES.db'
+base_path = Path(__file__).parent
+data_path = base_path / 'data'
 
 today = dt.date.today()
 yesterday = (today - dt.timedelta(days=1))
 #round to decimals in pandas tables output
 pd.options.display.float_format = '{:,.2f}'.format
-
-# +
-#sql_db_path
-
-# +
-# use glob to get all the csv files in the folder path = os.getcwd()
-csv_files = glob.glob(os.path.join(data_path, "*.csv"))
-
-df = pd.DataFrame()
-dates = []
-# loop over the list of csv files
-for f in csv_files:
-    # print the location and filename
-    #print('Reading file:', f.split("\\")[-1]) #debug. Will be read in non-order. 
-      
-    # read the csv file
-    x = pd.read_csv(f, sep=';', index_col=[0])
-    extracted_date = dparser.parse(f, fuzzy=True) # date parser from file name. No date in the CSV. Maybe add this in 2024?
-    x['Date'] = extracted_date
-    dates.append(extracted_date.isoformat()) 
-    
-    df = pd.concat([x,df], axis=0)
-
-dates.sort()
-df = df.sort_values('Date').reset_index(drop=True)
-
-# -
-
-# fix naming errors on website
-df.loc[(df.Instrument == 'AKERBP'), 'Instrument'] = 'AKRBP'
-df.loc[(df.Instrument == 'ALKb'), 'Instrument'] = 'ALK_B'
-df.loc[(df.Instrument == 'BEL'), 'Instrument'] = 'BELCO'
-df.loc[(df.Instrument == 'ATOS'), 'Instrument'] = 'ATO'
-df.loc[(df.Instrument == 'NOVOb'), 'Instrument'] = 'NOVO_B'
-df.loc[(df.Instrument == 'NOVO-B'), 'Instrument'] = 'NOVO_B'
-df.loc[(df.Instrument == 'NZYMb'), 'Instrument'] = 'NZYM_B'
-df.loc[(df.Instrument == 'NZYM-B'), 'Instrument'] = 'NZYM_B'
-df.loc[(df.Instrument == 'MAERSKb'), 'Instrument'] = 'MAERSK_B'
-df.loc[(df.Instrument == 'INRGxmil'), 'Instrument'] = 'IQQH' # cannot download original Milan data of this ETF
-df.loc[(df.Instrument == 'INRG'), 'Instrument'] = 'IQQH' # cannot download original Milan data of this ETF
-df.loc[(df.Instrument == 'IQQH'), 'Stockexchange'] = 'xetr' # but the IQQH is the same approx.
-df.loc[(df.Instrument == 'IQQH'), 'Ticker'] = 'IQQH.DE'
-df.loc[(df.Instrument == 'GOMX_TR'), 'Antal'] = df.Antal/3 # was a 1/3 split (Lau)
-df.loc[(df.Instrument == 'GOMX_TR'), 'Instrument'] = 'GOMX'
-df.loc[(df.Ticker == 'GOMX-TR.ST'), 'Ticker'] = 'GOMX.ST'
-df.loc[(df.Instrument == 'CARLb'), 'Instrument'] = 'CARL_B'
-df.loc[(df.Ticker == 'CARLb.CO'), 'Ticker'] = 'CARL-B.CO'
-df.loc[(df.Ticker == 'TEN-NEW'), 'Ticker'] = 'TEN'
-df.loc[(df.Instrument == 'TEN_NEW'), 'Instrument'] = 'TEN'
-df.loc[(df.Ticker == 'SKFb.ST'), 'Ticker'] = 'SKF-B.ST'
-df.loc[(df.Instrument == 'SKFb'), 'Instrument'] = 'SKF_B'
-
-# +
-#df.loc[df.Date == dt.date.today().strftime('%Y-%m-%d')]
 # -
 
-df.loc[df.Ticker == 'NDA-DK.CO']
+# ## Download
+# - CONCURRENT_DOWNLOAD: batched Yahoo requests from a thread pool into the `prices` table of MK_PRICES.db,
+#   with a per-host rate limit and retries; MK_PRICE_URL can point to a local stand-in server (mk.standin)
+# - only the days after each instrument's watermark are fetched; FULL_REFRESH reloads every history
+# - the same as `python -m mk prices` (mk/jobs.py), with wall time, rows and bytes per ticker in data/metrics/
+# - otherwise one `yq_price_importer` call per ticker as before, copied into the `prices` table afterwards
 
-print(sorted(df.Ticker.unique()))
-
-# make a new dataframe 'dl' which contains only the unique tickers for stock price downloading
-dl = df[['Instrument', 'Ticker']].copy().drop_duplicates().reset_index(drop=True)
+CONCURRENT_DOWNLOAD = True
+WORKERS = 4
+RATE_LIMIT = 2 # requests per second and host
+RETRIES = 3
+FULL_REFRESH = False
+PRICE_URL = os.environ.get('MK_PRICE_URL', download.YAHOO_URL)
 
 # +
-## test
-#dl = dl[:4]
-
-for i in range(0,len(dl)):
-    res = retrievals.yq_price_importer(dl.loc[i,'Ticker'], dl.loc[i,'Instrument'], db_path=sql_db_path)
+if CONCURRENT_DOWNLOAD:
+    ## daily DKK rates of all traded currencies go into the same table, e.g. USDDKK=X as FX_USD
+    summary = jobs.prices(data_path, PRICE_URL, full_refresh=FULL_REFRESH, workers=WORKERS, rate_limit=RATE_LIMIT, retries=RETRIES)
+    print(summary.Status.value_counts().to_string())
+    print(summary.Rows.sum(), 'rows stored,', summary.Refreshed.sum(), 'full histories (new, requested or adjusted)')
+    print(summary.loc[summary.Status != 'ok'].to_string())
+else:
+    from mystocks import retrievals
+    sql_db_path = 'sqlite:///' + str(jobs.db_file(data_path))
+    # the tickers of all instruments ever held, loaded and normalized as in `python -m mk prices`
+    run = metrics.Run('prices', data_path)
+    df = jobs.price_instruments(data_path, run)
+    print(sorted(df.Ticker.unique()))
+    # make a new dataframe 'dl' which contains only the unique tickers for stock price downloading
+    dl = df[['Instrument', 'Ticker']].copy().drop_duplicates().reset_index(drop=True)
+    ## test
+    #dl = dl[:4]
+    for i in range(0,len(dl)):
+        res = retrievals.yq_price_importer(dl.loc[i,'Ticker'], dl.loc[i,'Instrument'], db_path=sql_db_path)
+    ## the dashboard reads the long table
+    con = pricedb.connect(pricedb.db_file(sql_db_path))
+    pricedb.import_legacy(con, sql_db_path, dl.Instrument.unique())
+    con.close()
+    run.finish()
 # -
 
 print("")
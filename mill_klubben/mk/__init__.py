@@ -0,0 +1,2 @@
+# Shared helpers for the Millionærklubben scripts
+# - the jupytext notebooks import the modules like `from mk import store`
@@ -0,0 +1,112 @@
+# Command line of the nightly jobs: `python -m mk [--data PATH] scrape|prices|build|render|nightly|backtest|reparse`
+# - the data path comes from --data, else MK_DATA, else mill_klubben/data next to the package
+# - a command only imports the modules of its job (mk.jobs); `nightly` runs all four in one process
+#   and stops at the first failing job, like the former `a && b && c` cron line
+
+import os
+import sys
+import argparse
+import datetime as dt
+from pathlib import Path
+
+
+DATA = Path(__file__).parent.parent / 'data'
+
+
+def _print(*args):
+    print(dt.datetime.now().isoformat(timespec='seconds'), *args, flush=True)
+
+
+def scrape(args):
+    from mk import jobs
+    status, new_events = jobs.scrape(args.data, url=args.page_url)
+    _print('page', status + ',', len(new_events), 'trade events logged')
+    if len(new_events):
+        print(new_events[['Investor', 'Instrument', 'Event', 'Quantity', 'Price']].to_string(index=False))
+
+
+def prices(args):
+    from mk import jobs
+    summary = jobs.prices(args.data, url=args.price_url, full_refresh=args.full_refresh, workers=args.workers)
+    _print(summary.Rows.sum(), 'price rows stored,', summary.Refreshed.sum(), 'full histories,',
+           (summary.Status != 'ok').sum(), 'tickers failed')
+    if (summary.Status != 'ok').any():
+        print(summary.loc[summary.Status != 'ok'].to_string(index=False))
+
+
+def build(args):
+    from mk import jobs
+    n, full = jobs.build(args.data, full=args.full)
+    _print(n, 'snapshot dates added to the tables', '(full build)' if full else '')
+
+
+def render(args):
+    from mk import jobs
+    drawn = jobs.render(args.data, force=args.force)
+    _print(len(drawn), 'figures rendered', drawn)
+
+
+def backtest(args):
+    from mk import jobs
+    comparison = jobs.backtest(args.data, delays=args.delays, amount=args.amount, workers=args.workers)
+    _print(len(comparison), 'scenarios backtested')
+    print(comparison.round(3).to_string(index=False))
+
+
+def reparse(args):
+    from mk import jobs
+    days, rows, failed = jobs.reparse(args.data, workers=args.workers)
+    _print(days, 'archived days parsed again,', rows, 'rows stored,', len(failed), 'days kept their rows (parse failed)')
+    if len(failed):
+        print(failed.to_string(index=False))
+    if days:
+        args.full = True
+        build(args)
+
+
+def nightly(args):
+    for command in (scrape, prices, build, render):
+        command(args)
+
+
+def parser():
+    p = argparse.ArgumentParser(prog='python -m mk', description='Nightly jobs of the Millionærklubben scripts.')
+    p.add_argument('--data', type=Path, default=Path(os.environ.get('MK_DATA', DATA)), help='data directory (default: MK_DATA or %(default)s)')
+    p.add_argument('--page-url', default=os.environ.get('MK_PAGE_URL'), help='Millionærklubben page, e.g. a local mk.standin.PageServer')
+    p.add_argument('--price-url', default=os.environ.get('MK_PRICE_URL'), help='Yahoo base URL, e.g. a local mk.standin.PriceServer')
+    sub = p.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('scrape', help='store today\'s portfolios and trade events').set_defaults(func=scrape)
+    sp = sub.add_parser('prices', help='download the missing close prices and FX rates')
+    sp.set_defaults(func=prices)
+    sp = sub.add_parser('build', help='update the tables of data/tables/')
+    sp.set_defaults(func=build)
+    sp = sub.add_parser('render', help='draw the changed figures of data/figures/')
+    sp.set_defaults(func=render)
+    sp = sub.add_parser('nightly', help='scrape, prices, build and render in one process')
+    sp.set_defaults(func=nightly)
+    sp = sub.add_parser('backtest', help='copy-trade every investor with delays, into data/backtest/')
+    sp.set_defaults(func=backtest)
+    sp.add_argument('--delays', type=lambda v: [int(d) for d in v.split(',')], help='trading days, e.g. 0,1,2,5')
+    sp.add_argument('--amount', type=float, help='DKK per position of the fixed sizing (default 10000)')
+    sp = sub.add_parser('reparse', help='parse the archived pages again, then rebuild the snapshot store and the tables')
+    sp.set_defaults(func=reparse)
+    for name in ('prices', 'nightly'):
+        sub.choices[name].add_argument('--full-refresh', action='store_true', help='download every price history again')
+    for name in ('prices', 'nightly', 'backtest', 'reparse'):
+        sub.choices[name].add_argument('--workers', type=int, default=4)
+    for name in ('build', 'nightly'):
+        sub.choices[name].add_argument('--full', action='store_true', help='rebuild the tables from the first day')
+    for name in ('render', 'nightly'):
+        sub.choices[name].add_argument('--force', action='store_true', help='draw all figures')
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    args.func(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
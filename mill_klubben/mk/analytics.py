@@ -0,0 +1,112 @@
+# Performance analytics per investor and per position, as array operations over all investors at once
+# - `daily`: per snapshot day and investor the Value of the holdings, the Gain of the previous day's holdings on
+#   their Base value and the net Flow into the portfolio (buys - sells at the day's DKK price), from the holdings cube
+# - from these: time-weighted return (chained daily returns of the previous day's holdings, so deposits and new
+#   purchases do not count as performance), money-weighted return (IRR of the flows, Newton steps for all investors
+#   together), maximum drawdown of the TWR index and the rolling 30 / 90 day volatility
+# - the daily table is additive per day, the nightly build only appends the new days (mk.tables)
+# - hit rate: share of the closed positions (holding episodes) with a positive return
+
+import numpy as np
+import pandas as pd
+
+
+VOL_WINDOWS = (30, 90)
+DAYS_PER_YEAR = 365 # the snapshots are calendar days, weekends repeat Friday
+DAILY_COLUMNS = ['Date', 'Investor', 'Value', 'Base', 'Gain', 'Flow']
+
+
+def daily(cube, prices):
+    """Long table Date, Investor, Value, Base, Gain, Flow from a holdings.Holdings cube and a DKK price matrix.
+
+    An instrument only counts for the gain of a day if it has a price on both days; the first day's Flow is its Value.
+    """
+    p = prices.reindex(index=cube.dates, columns=cube.instruments).to_numpy(dtype=float)
+    q = cube.qty.astype(float)
+    known = ~np.isnan(p)
+    p0 = np.where(known, p, 0.0)
+    both = known[1:] & known[:-1]
+
+    value = np.einsum('din,dn->di', q, p0)
+    base = np.einsum('din,dn->di', q[:-1], np.where(both, p[:-1], 0.0))
+    gain = np.einsum('din,dn->di', q[:-1], np.where(both, p[1:] - p[:-1], 0.0))
+    flow = np.einsum('din,dn->di', q[1:] - q[:-1], p0[1:])
+    zero = np.zeros((1, q.shape[1]))
+    cols = {'Value': value, 'Base': np.vstack([zero, base]), 'Gain': np.vstack([zero, gain]),
+            'Flow': np.vstack([value[:1], flow])}
+
+    idx = pd.MultiIndex.from_product([cube.dates, cube.investors], names=['Date', 'Investor'])
+    return pd.DataFrame({k: v.reshape(-1) for k, v in cols.items()}, index=idx).reset_index()
+
+
+def _wide(d, start=None):
+    ## Date x Investor matrices of the daily table; the first day starts the accounts
+    if start is not None:
+        d = d.loc[d.Date >= pd.Timestamp(start)]
+    w = d.pivot(index='Date', columns='Investor', values=['Value', 'Base', 'Gain', 'Flow']).sort_index().fillna(0)
+    w.columns.names = [None, None]
+    first = w.index[0]
+    w.loc[first, 'Base'] = 0
+    w.loc[first, 'Gain'] = 0
+    w.loc[first, 'Flow'] = w.loc[first, 'Value'].to_numpy()
+    return w
+
+
+def daily_returns(w):
+    base = w['Base'].to_numpy()
+    r = np.divide(w['Gain'].to_numpy(), base, out=np.zeros_like(base), where=base > 0)
+    return pd.DataFrame(r, index=w.index, columns=w['Base'].columns)
+
+
+def series(d, start=None):
+    """{'TWR', 'Drawdown', 'Vol30', 'Vol90'}: Date x Investor frames, TWR as growth of 1 since the start."""
+    r = daily_returns(_wide(d, start))
+    twr = (1 + r).cumprod()
+    res = {'TWR': twr, 'Drawdown': twr / twr.cummax() - 1}
+    for days in VOL_WINDOWS:
+        res['Vol%d' % days] = r.rolling('%dD' % days, min_periods=days // 2).std() * np.sqrt(DAYS_PER_YEAR)
+    return res
+
+
+def mwr(w, iterations=50):
+    """Money-weighted return p.a. per investor: the IRR of the flows and the final value (Newton, all investors at once)."""
+    t = ((w.index - w.index[0]).days / DAYS_PER_YEAR).to_numpy()[:, None]
+    cf = -w['Flow'].to_numpy()
+    cf[-1] += w['Value'].to_numpy()[-1]
+    r = np.full(cf.shape[1], 0.1)
+    for _ in range(iterations):
+        disc = (1 + r) ** -t
+        f = (cf * disc).sum(axis=0)
+        df = (-t * cf * disc / (1 + r)).sum(axis=0)
+        step = np.divide(f, df, out=np.zeros_like(f), where=df != 0)
+        r = np.maximum(r - step, -0.99)
+    r[(np.abs(cf).sum(axis=0) == 0) | (t[-1, 0] == 0)] = np.nan
+    return pd.Series(r, index=w['Flow'].columns)
+
+
+def position_metrics(curr_all, end):
+    """Closed (not held on `end`, the newest snapshot date) and Hit (closed with a positive return) per position."""
+    closed = curr_all.LastSeen < pd.Timestamp(end)
+    return curr_all.assign(Closed=closed, Hit=closed & (curr_all.Return > 0))
+
+
+def performance(d, start=None):
+    """Per investor (column of the daily table): TWR and MWR since start, maximum drawdown and current volatility."""
+    w = _wide(d, start)
+    s = series(d, start)
+    res = pd.DataFrame({'TWR': s['TWR'].iloc[-1] - 1, 'MWR': mwr(w), 'MaxDrawdown': s['Drawdown'].min()})
+    for days in VOL_WINDOWS:
+        res['Vol%d' % days] = s['Vol%d' % days].iloc[-1]
+    return res
+
+
+def summary(d, positions, start=None):
+    """Per investor: TWR and MWR since start, maximum drawdown, current 30 / 90 day volatility and the hit rate."""
+    res = performance(d, start)
+    closed = positions.loc[positions.Closed]
+    if start is not None:
+        closed = closed.loc[closed.BuyDate >= pd.Timestamp(start)]
+    hits = closed.groupby('Investor').agg(ClosedTrades=('Hit', 'size'), HitRate=('Hit', 'mean'))
+    res = res.join(hits, how='left').fillna({'ClosedTrades': 0})
+    res['ClosedTrades'] = res.ClosedTrades.astype(int)
+    return res.rename_axis('Investor')
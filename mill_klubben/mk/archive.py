@@ -0,0 +1,182 @@
+# Archive of the raw scraped pages and offline re-parse of the whole scrape history
+# - every fetched page is kept gzip compressed in data/pages/<month>/, index.csv records each fetch with the
+#   snapshot date, fetch time, URL, HTTP status, validators, SHA-1 and sizes; a page equal to an archived one
+#   is not stored again, a 304 answer points to the last archived page of the URL
+# - `reparse` runs the current parser and name normalization (mk.saxo, mk.instruments) over the last page of
+#   every archived day in a process pool, without network access, and regenerates the snapshot store;
+#   days before the archive keep their stored rows, so do days whose page the parser rejects (reported)
+# - the new store is written complete next to the old one, data/snapshots is a symlink swapped to it in one step
+# - run `python -m mk reparse` after a parser fix or a new entry in mk/instruments.csv
+
+import os
+import gzip
+import shutil
+import hashlib
+import datetime as dt
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from mk import store, saxo, instruments
+
+
+PAGES_DIR = 'pages'
+INDEX = 'index.csv'
+INDEX_COLUMNS = ['Date', 'Fetched', 'Url', 'Status', 'File', 'Sha1', 'Bytes', 'StoredBytes', 'ETag', 'LastModified']
+WORKERS = 4
+LEVEL = 6 # gzip level, a page of ~1 MB packs to a few percent of it
+
+
+def pages_path(data_path):
+    return Path(data_path) / PAGES_DIR
+
+
+def read_index(data_path):
+    """All archived fetches, oldest first; File is relative to data/pages/."""
+    file = pages_path(data_path) / INDEX
+    if not file.exists():
+        return pd.DataFrame(columns=INDEX_COLUMNS).astype({'Date': 'datetime64[ns]', 'Fetched': 'datetime64[ns]'})
+    index = pd.read_csv(file, sep=';', parse_dates=['Date', 'Fetched'], dtype={'File': str, 'Sha1': str, 'ETag': str, 'LastModified': str})
+    return index.sort_values('Fetched', kind='stable').reset_index(drop=True)
+
+
+def save(data_path, date, url, content, validators=None, fetched=None):
+    """Archive one fetch of the page for snapshot `date`; content None is a 304 answer. The bytes written."""
+    fetched = pd.Timestamp(fetched or dt.datetime.now()).floor('s')
+    validators = validators or {}
+    index = read_index(data_path)
+    previous = index.loc[(index.Url == url) & index.File.notna()]
+    row = {'Date': pd.Timestamp(date).normalize(), 'Fetched': fetched, 'Url': url, 'Status': 200 if content is not None else 304,
+           'ETag': validators.get('ETag'), 'LastModified': validators.get('Last-Modified'), 'StoredBytes': 0}
+    written = 0
+    if content is None:
+        if previous.empty:
+            return 0
+        last = previous.iloc[-1]
+        row.update(File=last.File, Sha1=last.Sha1, Bytes=last.Bytes)
+    else:
+        sha1 = hashlib.sha1(content).hexdigest()
+        same = index.loc[index.Sha1 == sha1]
+        if not same.empty:
+            file = same.File.iloc[-1]
+        else:
+            file = '%s/%s-%s.html.gz' % (fetched.strftime('%Y-%m'), fetched.strftime('%Y-%m-%dT%H%M%S'), sha1[:8])
+            target = pages_path(data_path) / file
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_name(target.name + '.tmp')
+            tmp.write_bytes(gzip.compress(content, compresslevel=LEVEL))
+            tmp.replace(target)
+            written = target.stat().st_size
+        row.update(File=file, Sha1=sha1, Bytes=len(content), StoredBytes=written)
+
+    index = pd.concat([index, pd.DataFrame([row])], ignore_index=True)
+    index = index.assign(Date=index.Date.dt.strftime('%Y-%m-%d'), Fetched=index.Fetched.dt.strftime('%Y-%m-%dT%H:%M:%S'))
+    store.write_atomic(index[INDEX_COLUMNS], pages_path(data_path) / INDEX)
+    return written
+
+
+def read_page(data_path, file):
+    return gzip.decompress((pages_path(data_path) / file).read_bytes())
+
+
+def daily_pages(index, start=None, end=None):
+    """Date, File of the last archived page of every snapshot date."""
+    pages = index.loc[index.File.notna()].drop_duplicates('Date', keep='last')
+    if start is not None:
+        pages = pages.loc[pages.Date >= pd.Timestamp(start)]
+    if end is not None:
+        pages = pages.loc[pages.Date <= pd.Timestamp(end)]
+    return pages[['Date', 'File']].sort_values('Date').reset_index(drop=True)
+
+
+def parse_archived(path):
+    """The normalized portfolio table of an archived page, as the scraper stores it."""
+    df = saxo.parse_page(gzip.decompress(Path(path).read_bytes()))
+    return instruments.normalize(df, drop_delisted=True).drop(columns='Delisted').reset_index(drop=True)
+
+
+def _parse_or_error(path):
+    ## one page the current parser rejects must not cost the whole run
+    try:
+        return parse_archived(path), None
+    except Exception as e:
+        return None, '%s: %s' % (type(e).__name__, e)
+
+
+def _version_path(data_path, time):
+    return Path(data_path) / (store.STORE_DIR + '.' + time.strftime('%Y%m%dT%H%M%S%f'))
+
+
+def _versions(data_path):
+    return sorted(Path(data_path).glob(store.STORE_DIR + '.2*'))
+
+
+def _point_to(data_path, target):
+    ## data/snapshots is a symlink to the current version, swapped in one os.replace
+    link = Path(data_path) / (store.STORE_DIR + '.link.tmp')
+    link.unlink(missing_ok=True)
+    link.symlink_to(target.name, target_is_directory=True)
+    os.replace(link, store.store_path(data_path))
+
+
+def recover(data_path):
+    """Point data/snapshots at the newest complete store version if a reparse stopped before the swap."""
+    current = store.store_path(data_path)
+    if not current.exists() and _versions(data_path):
+        current.unlink(missing_ok=True) # a dangling link
+        _point_to(data_path, _versions(data_path)[-1])
+
+
+def reparse(data_path, workers=WORKERS, start=None, end=None):
+    """Parse the archived pages again and regenerate the snapshot store.
+
+    Every distinct page is parsed once; days outside the archive (or outside start..end) keep their rows, and so do
+    the days whose page fails to parse. Returns the number of days and rows parsed and the failed days
+    (Date, File, Error).
+    """
+    recover(data_path)
+    failed = pd.DataFrame(columns=['Date', 'File', 'Error'])
+    pages = daily_pages(read_index(data_path), start, end)
+    if pages.empty:
+        return 0, 0, failed
+    files = list(pages.File.unique())
+    paths = [str(pages_path(data_path) / f) for f in files]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = dict(zip(files, pool.map(_parse_or_error, paths, chunksize=8)))
+    else:
+        parsed = dict(zip(files, map(_parse_or_error, paths)))
+    errors = pages.File.map(lambda f: parsed[f][1])
+    failed = pages.loc[errors.notna()].assign(Error=errors[errors.notna()]).reset_index(drop=True)
+    pages = pages.loc[errors.isna()]
+    if pages.empty:
+        return 0, 0, failed
+    new = pd.concat([parsed[p.File][0].assign(Date=p.Date) for p in pages.itertuples()], axis=0, ignore_index=True)
+
+    old = store.load_snapshots(data_path)
+    keep = old.loc[~old.Date.isin(pages.Date)]
+
+    ## write the whole store into data/reparse.tmp/snapshots/, store repeated days as entries, move it to
+    ## data/snapshots.<time>/ and only then point data/snapshots at it; the old store stays complete until then
+    tmp = Path(data_path) / 'reparse.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    store.write_snapshots(pd.concat([keep, new], axis=0, ignore_index=True), tmp)
+    store.compact(tmp)
+    target = _version_path(data_path, dt.datetime.now())
+    store.store_path(tmp).rename(target)
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    current = store.store_path(data_path)
+    if current.is_symlink():
+        previous = current.resolve()
+    elif current.exists():
+        ## a store from before the versions becomes the older version, recover() repairs a stop between the two steps
+        previous = _version_path(data_path, dt.datetime.fromtimestamp((current / store.MANIFEST).stat().st_mtime))
+        current.rename(previous)
+    else:
+        previous = None
+    _point_to(data_path, target)
+    if previous is not None and previous != target:
+        shutil.rmtree(previous, ignore_errors=True)
+    return len(pages), len(new), failed
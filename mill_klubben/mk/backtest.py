@@ -0,0 +1,163 @@
+# Delayed copy-trade backtest: what following a panel member would have returned
+# - the page is likely delayed compared to the investors' own accounts; the follower sees a snapshot `delay` trading
+#   days late and trades to its holdings at that day's close in DKK (prices of MK_PRICES.db, split adjusted, mk.fx)
+# - the price matrices are calendar-day and forward filled; only the trading sessions (dates with a stored close)
+#   count as days of the follower, so nothing is traded on weekends at stale closes
+# - sizing ('mirror', k): k times the investor's quantities; ('fixed', amount): `amount` DKK per new position,
+#   the investor's later partial buys and sells change it in proportion
+# - the follower's holdings become a holdings cube with one column per scenario, valued as in mk.analytics
+# - sweeps over investors x delays x sizings run in a process pool; quantities and prices are written once as
+#   .npy files that the workers map read-only, so every worker shares the same pages
+# - run `python -m mk backtest` (comparison table and equity curves in data/backtest/)
+
+import tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from mk import store, holdings, analytics, portfolio, corporate_actions, fx, pricematrix
+
+
+BACKTEST_DIR = 'backtest'
+DELAYS = (0, 1, 2, 3, 5, 10) # trading days
+SIZINGS = (('mirror', 1), ('fixed', 10000))
+WORKERS = 4
+
+## the arrays of the running sweep, mapped by _attach in each worker
+_shared = {}
+
+
+def backtest_path(data_path):
+    return Path(data_path) / BACKTEST_DIR
+
+
+def sizing_label(sizing):
+    kind, size = sizing
+    return '%s %g' % (kind, size)
+
+
+def load_inputs(data_path, db_file, start=portfolio.FIRST_DAY, end=None):
+    """Holdings cube of the snapshots from start, the DKK close prices of the instruments held and their sessions.
+
+    The prices are a view into the nightly price matrix export if it is up to date (mk.pricematrix).
+    """
+    m = portfolio.my_portfolios(portfolio.load_snapshots(data_path, start, end))
+    end = m.Date.max()
+    held = sorted(m.Instrument.unique())
+    sessions = portfolio.load_sessions(db_file, held, start, end)
+    mapped = pricematrix.load(data_path, db_file) if pd.Timestamp(start) >= portfolio.FIRST_DAY else None
+    if mapped is not None:
+        return holdings.Holdings.from_snapshots(m), mapped['dkk_prices'].loc[start:end], sessions
+    prices = corporate_actions.adjusted_prices(portfolio.load_prices(db_file, held, start, end))
+    currency_of = portfolio.currencies(m)
+    rates = portfolio.load_rates(db_file, tuple(sorted(currency_of.unique())), start, end)
+    dkk_prices = fx.to_dkk(prices, currency_of, rates).dropna(how='all')
+    return holdings.Holdings.from_snapshots(m), dkk_prices, sessions
+
+
+def trading_days(prices, sessions, start):
+    """The dates of the price matrix from start that are trading sessions."""
+    return prices.index[(prices.index >= pd.Timestamp(start)) & prices.index.isin(pd.DatetimeIndex(sessions))]
+
+
+def observed(snap_dates, trade_dates, delay):
+    """Per trading day the index of the snapshot the follower acts on, -1 before the first one is seen."""
+    seen = np.searchsorted(snap_dates.to_numpy(), trade_dates.to_numpy(), side='right') - 1
+    delay = min(delay, len(seen))
+    return np.concatenate([np.full(delay, -1), seen[:len(seen) - delay]])
+
+
+def follower_holdings(q, p, obs, sizing):
+    """Trading day x instrument quantities of the follower.
+
+    q is the investor's snapshot x instrument quantity matrix, p the trading day x instrument DKK prices
+    (forward filled, NaN before the first close) and obs the snapshot seen on each trading day (see observed).
+    """
+    kind, size = sizing
+    target = np.where((obs >= 0)[:, None], q[np.maximum(obs, 0)], 0.0)
+    ## nothing is bought before the instrument has a price
+    tradeable = (target > 0) & ~np.isnan(p)
+    if kind == 'mirror':
+        return np.where(tradeable, target * size, 0.0)
+    if kind != 'fixed':
+        raise ValueError('unknown sizing %r' % kind)
+    ## the amount buys the position on its first tradeable day; the ratio to the investor's quantity is kept
+    ## until the position is closed
+    entry = tradeable & ~np.vstack([np.zeros((1, p.shape[1]), dtype=bool), tradeable[:-1]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(entry, size / (target * p), np.nan)
+    ratio = pd.DataFrame(ratio).ffill().to_numpy()
+    return np.where(tradeable, target * ratio, 0.0)
+
+
+def _attach(files, snap_dates, trade_dates, instruments):
+    ## pool initializer: map the arrays of the sweep read-only
+    _shared.update(q=np.load(files[0], mmap_mode='r'), p=np.load(files[1], mmap_mode='r'),
+                   snap_dates=snap_dates, trade_dates=trade_dates, instruments=instruments)
+
+
+def _simulate(task):
+    ## one investor and delay with all sizings: the daily table of the scenarios and their number of trades
+    investor, delay, scenarios, sizings = task
+    q, p = _shared['q'][:, investor, :], np.asarray(_shared['p'])
+    obs = observed(_shared['snap_dates'], _shared['trade_dates'], delay)
+    h = np.stack([follower_holdings(q, p, obs, sizing) for sizing in sizings], axis=1)
+    trades = (np.diff(h, axis=0, prepend=0) != 0).sum(axis=(0, 2))
+    cube = holdings.Holdings(h, _shared['trade_dates'], pd.Index(scenarios), _shared['instruments'])
+    d = analytics.daily(cube, pd.DataFrame(p, index=_shared['trade_dates'], columns=_shared['instruments']))
+    return d, pd.Series(trades, index=scenarios)
+
+
+def sweep(cube, prices, sessions, investors=None, delays=DELAYS, sizings=SIZINGS, workers=WORKERS):
+    """Backtest every investor x delay x sizing.
+
+    cube is a holdings.Holdings of the snapshots, prices the Date x Instrument DKK closes (calendar days are fine)
+    and sessions the trading days (see pricedb.sessions), the only days the follower trades. Returns the comparison
+    table (one row per scenario: Investor, Delay, Sizing, the mk.analytics performance, PnL and peak Invested DKK
+    and the number of Trades) and the equity curves {'TWR', 'PnL'} as Date x (Investor, Delay, Sizing) frames.
+    """
+    trade_dates = trading_days(prices, sessions, cube.dates[0])
+    p = prices.reindex(index=trade_dates, columns=cube.instruments).ffill().to_numpy(dtype=float)
+    investors = list(cube.investors if investors is None else investors)
+    sizings = [tuple(s) for s in sizings]
+    scen = pd.DataFrame([(inv, delay, sizing_label(s)) for inv in investors for delay in delays for s in sizings],
+                        columns=['Investor', 'Delay', 'Sizing'])
+    n = len(sizings)
+    tasks = [(cube.investors.get_loc(inv), delay, list(range(k * n, (k + 1) * n)), sizings)
+             for k, (inv, delay) in enumerate((inv, delay) for inv in investors for delay in delays)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [str(Path(tmp) / 'qty.npy'), str(Path(tmp) / 'prices.npy')]
+        np.save(files[0], cube.qty)
+        np.save(files[1], p)
+        init = (files, cube.dates, trade_dates, cube.instruments)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=init) as pool:
+                results = list(pool.map(_simulate, tasks))
+        else:
+            _attach(*init)
+            results = [_simulate(task) for task in tasks]
+            _shared.clear()
+
+    d = pd.concat([r[0] for r in results], ignore_index=True)
+    w = d.pivot(index='Date', columns='Investor', values=['Value', 'Flow']).fillna(0)
+    ## cash starts at 0 and pays every buy, so value + cash is the profit in DKK
+    pnl = w['Value'] - w['Flow'].cumsum()
+    comparison = scen.join(analytics.performance(d)).assign(
+        PnL=pnl.iloc[-1], Invested=w['Flow'].cumsum().max(),
+        Trades=pd.concat([r[1] for r in results]))
+    columns = pd.MultiIndex.from_frame(scen)
+    curves = {'TWR': analytics.series(d)['TWR'], 'PnL': pnl}
+    curves = {k: v[scen.index].set_axis(columns, axis=1).rename_axis(index='Date') for k, v in curves.items()}
+    return comparison, curves
+
+
+def write_results(comparison, curves, data_path):
+    """comparison.csv and the equity curves as long Parquet table equity.parquet in data/backtest/."""
+    path = backtest_path(data_path)
+    path.mkdir(parents=True, exist_ok=True)
+    store.write_atomic(comparison, path / 'comparison.csv')
+    equity = pd.concat({k: v.stack(['Investor', 'Delay', 'Sizing'], future_stack=True) for k, v in curves.items()}, axis=1)
+    store.write_atomic(equity.reset_index(), path / 'equity.parquet')
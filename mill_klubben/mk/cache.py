@@ -0,0 +1,42 @@
+# Freshness keys for caching the dashboard stages
+# - the cached results stay valid until the cronjobs store a newer snapshot or write prices to MK_PRICES.db
+# - `cached_frame` keeps derived matrices on disk between processes
+
+import os
+import hashlib
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from mk import store, pricedb
+
+
+def data_version(data_path, db_file):
+    """Newest stored snapshot date and the time prices were last written to the price DB (pricedb.version)."""
+    dates = store.snapshot_dates(data_path)
+    newest_snapshot = dates[-1] if dates else None
+    return newest_snapshot, pricedb.version(db_file)
+
+
+def cached_frame(file, key, compute):
+    """DataFrame from a Parquet cache file if it was written for `key`, else compute() it and store it."""
+    file = Path(file)
+    key_file = file.with_name(file.name + '.key')
+    key = hashlib.sha1(str(key).encode()).hexdigest()
+    if file.exists() and key_file.exists() and key_file.read_text() == key:
+        return pd.read_parquet(file)
+    frame = compute()
+    file.parent.mkdir(parents=True, exist_ok=True)
+    ## the frame before its key, so a matching key file always comes with a whole frame written for it
+    _write_atomic(file, frame.to_parquet)
+    _write_atomic(key_file, lambda f: f.write(key.encode()))
+    return frame
+
+
+def _write_atomic(file, write):
+    ## write(f) into a temporary file of its own next to the target and swap it in; sessions and the nightly job
+    ## writing at the same time never share a file
+    with tempfile.NamedTemporaryFile(dir=file.parent, prefix=file.name + '.', suffix='.tmp', delete=False) as f:
+        write(f)
+    os.replace(f.name, file)
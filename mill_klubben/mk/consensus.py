@@ -0,0 +1,78 @@
+# Overlap and consensus across the investors, computed on sparse holdings
+# - the holdings are kept sparse as coordinate rows (Date, Investor, Instrument, DKK Value and portfolio Weight),
+#   only the held positions exist; the dense date x investor x instrument cube is mostly zeros
+# - consensus: per date and instrument the number of investors holding it and their DKK value
+# - overlap: per date and pair of investors the shared instruments, the Jaccard index (shared / held by either)
+#   and the value-weighted overlap (sum of the smaller portfolio weight over the shared instruments); the pairs
+#   are a self-join of the rows on date and instrument, i.e. the sparse product H x H' per date
+# - new consensus: an instrument is held by at least MIN_HOLDERS investors and had fewer on the snapshot before
+# - a date only needs its own rows and the snapshot before, so the nightly build only computes the new days
+#   (mk.tables)
+
+import numpy as np
+import pandas as pd
+
+from mk import valuation
+
+
+MIN_HOLDERS = 2
+POSITION = ['Date', 'Investor', 'Instrument']
+
+
+def sparse_holdings(m, dkk_prices):
+    """Coordinate rows Date, Investor, Instrument, Quantity, Value (DKK) and Weight of the held positions."""
+    h = m.loc[m.Quantity > 0].groupby(POSITION, as_index=False).Quantity.sum()
+    h['Value'] = h.Quantity * valuation.lookup_prices(dkk_prices, h.Date, h.Instrument)
+    total = h.groupby(['Date', 'Investor']).Value.transform('sum').to_numpy()
+    value = h.Value.fillna(0).to_numpy()
+    ## a position without a price has no weight
+    h['Weight'] = np.divide(value, total, out=np.zeros_like(value), where=total > 0)
+    return h
+
+
+def consensus(h):
+    """Per Date and Instrument: the number of Holders, their Investors and their DKK Value."""
+    h = h.sort_values(POSITION)
+    return h.groupby(['Date', 'Instrument'], as_index=False).agg(
+        Holders=('Investor', 'size'), Investors=('Investor', ', '.join), Value=('Value', 'sum'))
+
+
+def overlap(h):
+    """Per Date and pair of investors (InvestorA < InvestorB): Shared instruments, Jaccard and ValueOverlap."""
+    held = h.groupby(['Date', 'Investor']).size().rename('Held').reset_index()
+    ## every pair of investors with a portfolio on the date, also those without a shared instrument
+    pairs = held.merge(held, on='Date', suffixes=('A', 'B'))
+    pairs = pairs.loc[pairs.InvestorA < pairs.InvestorB]
+
+    cols = ['Date', 'Investor', 'Instrument', 'Weight']
+    shared = h[cols].merge(h[cols], on=['Date', 'Instrument'], suffixes=('A', 'B'))
+    shared = shared.loc[shared.InvestorA < shared.InvestorB]
+    shared = shared.assign(Min=np.minimum(shared.WeightA, shared.WeightB))
+    shared = shared.groupby(['Date', 'InvestorA', 'InvestorB'], as_index=False).agg(
+        Shared=('Instrument', 'size'), ValueOverlap=('Min', 'sum'))
+
+    res = pairs.merge(shared, on=['Date', 'InvestorA', 'InvestorB'], how='left').fillna({'Shared': 0, 'ValueOverlap': 0.0})
+    res['Shared'] = res.Shared.astype(int)
+    res['Jaccard'] = res.Shared / (res.HeldA + res.HeldB - res.Shared)
+    return res[['Date', 'InvestorA', 'InvestorB', 'HeldA', 'HeldB', 'Shared', 'Jaccard', 'ValueOverlap']] \
+        .sort_values(['Date', 'InvestorA', 'InvestorB']).reset_index(drop=True)
+
+
+def new_consensus(c, dates, min_holders=MIN_HOLDERS):
+    """Rows of c where an instrument reached min_holders, with PrevHolders on the snapshot date before.
+
+    dates are the snapshot dates of c; the first one has no date before and gives no events.
+    """
+    dates = pd.DatetimeIndex(dates).sort_values()
+    x = c.assign(PrevDate=c.Date.map(dict(zip(dates[1:], dates[:-1]))))
+    before = c[['Date', 'Instrument', 'Holders']].rename(columns={'Date': 'PrevDate', 'Holders': 'PrevHolders'})
+    ev = x.loc[x.PrevDate.notna()].merge(before, on=['PrevDate', 'Instrument'], how='left').fillna({'PrevHolders': 0})
+    ev = ev.loc[(ev.Holders >= min_holders) & (ev.PrevHolders < min_holders)]
+    return ev.assign(PrevHolders=ev.PrevHolders.astype(int)).drop(columns='PrevDate').reset_index(drop=True)
+
+
+def compute(m, dkk_prices):
+    """{'consensus', 'overlap', 'consensus_events'} of the snapshots in m (Date, Investor, Instrument, Quantity)."""
+    h = sparse_holdings(m, dkk_prices)
+    c = consensus(h)
+    return {'consensus': c, 'overlap': overlap(h), 'consensus_events': new_consensus(c, m.Date.unique())}
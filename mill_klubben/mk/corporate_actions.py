@@ -0,0 +1,92 @@
+# Corporate actions (splits) for quantities and prices
+# - mk/corporate_actions.csv lists Instrument, Date (first trading day on the new basis) and Ratio (new shares per old share)
+# - quantities before a split are multiplied by the ratio and opening prices divided, so a position is in today's shares;
+#   the website switches its numbers a few days around the split, that day is detected per position
+# - stored price histories that are not yet split adjusted (old downloads) are divided by the ratio before the date
+# - `unadjusted_splits` finds the actions a stored history still shows, `apply_splits` divides the closes before them;
+#   the dashboard keeps the splits on disk until the actions (or a price history) are replaced, applying them to
+#   fresh prices is one multiplication
+
+import hashlib
+from fractions import Fraction
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+ACTIONS_FILE = Path(__file__).parent / 'corporate_actions.csv'
+SWITCH_WINDOW = pd.Timedelta(days=7) # website numbers change within this window around the split date
+TOLERANCE = 0.01
+
+
+def read_actions(file=ACTIONS_FILE):
+    actions = pd.read_csv(file, sep=';', parse_dates=['Date'], keep_default_na=False)
+    actions['Ratio'] = actions.Ratio.map(lambda r: float(Fraction(str(r)))) # also written like 1/3
+    return actions.sort_values('Date').reset_index(drop=True)
+
+
+def version(file=ACTIONS_FILE):
+    """Content hash of the actions table, part of every cache key that depends on it."""
+    return hashlib.sha1(Path(file).read_bytes()).hexdigest()[:12]
+
+
+def quantity_factors(snapshots, actions, qty='Antal'):
+    """Factor per snapshot row that brings its quantity onto the basis after all splits."""
+    factor = np.ones(len(snapshots))
+    dates = pd.to_datetime(snapshots.Date).to_numpy()
+    for a in actions.itertuples():
+        sel = (snapshots.Instrument == a.Instrument).to_numpy()
+        if not sel.any():
+            continue
+        ## quantity per date and investor; the website switch shows as a jump by the ratio near the split date
+        q = snapshots.loc[sel].groupby(['Date', 'Investor'])[qty].sum().unstack('Investor').sort_index()
+        jump = (q / q.shift(1) / a.Ratio - 1).abs() < TOLERANCE
+        near = (q.index >= a.Date - SWITCH_WINDOW) & (q.index <= a.Date + SWITCH_WINDOW)
+        jump = jump.loc[near]
+        switch = {inv: (jump.index[jump[inv]][0] if jump[inv].any() else a.Date) for inv in q.columns}
+        before = dates < snapshots.Investor.map(switch).to_numpy(dtype='datetime64[ns]')
+        factor[sel & before] *= a.Ratio
+    return factor
+
+
+def adjust_quantities(snapshots, actions=None, qty='Antal', price='Åbningspris'):
+    """Split adjusted copy of a snapshot frame (quantities times, opening prices divided by the factor)."""
+    actions = read_actions() if actions is None else actions
+    snapshots = snapshots.copy()
+    factor = quantity_factors(snapshots, actions, qty)
+    snapshots[qty] = snapshots[qty] * factor
+    if price in snapshots.columns:
+        snapshots[price] = snapshots[price] / factor
+    return snapshots
+
+
+def unadjusted(prices, instrument, date, ratio):
+    """True if the stored close series still jumps by the split ratio at the split date."""
+    s = prices[instrument].dropna()
+    before, after = s.loc[:date - pd.Timedelta(days=1)], s.loc[date:]
+    if before.empty or after.empty:
+        return False
+    jump = before.iloc[-1] / after.iloc[0]
+    return abs(np.log(jump / ratio)) < abs(np.log(jump))
+
+
+def unadjusted_splits(prices, actions=None):
+    """Instrument, Date and Ratio of the actions whose split the close series of a price matrix still show."""
+    actions = read_actions() if actions is None else actions
+    still = [a.Instrument in prices.columns and unadjusted(prices, a.Instrument, a.Date, a.Ratio) for a in actions.itertuples()]
+    return actions.loc[np.array(still, dtype=bool), ['Instrument', 'Date', 'Ratio']].reset_index(drop=True)
+
+
+def apply_splits(prices, splits):
+    """Copy of a Date x Instrument price matrix with the closes before each split divided by its ratio."""
+    factor = pd.DataFrame(1.0, index=prices.index, columns=prices.columns)
+    for a in splits.itertuples():
+        if a.Instrument in prices.columns:
+            factor.loc[factor.index < a.Date, a.Instrument] /= a.Ratio
+    return prices * factor
+
+
+def adjusted_prices(prices, actions=None):
+    """Split adjusted copy of a Date x Instrument price matrix."""
+    return apply_splits(prices, unadjusted_splits(prices, actions))
@@ -0,0 +1,180 @@
+# Concurrent, rate limited download of daily close prices
+# - tickers are fetched in batches (one request for up to BATCH_SIZE symbols) by a thread pool
+# - every request to a host waits for the per-host rate limit, failed tickers are retried with exponential backoff;
+#   a 429 answer holds back all requests to the host for its Retry-After time
+# - a daily bar's timestamp is the session open, its date is taken in the exchange's time zone (an ASX session
+#   opens before midnight UTC)
+# - the base URL is configurable, so the whole path can run against a local stand-in server (see mk.standin)
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import pandas as pd
+
+
+YAHOO_URL = 'https://query1.finance.yahoo.com'
+SPARK_PATH = '/v7/finance/spark'
+BATCH_SIZE = 20 # the spark endpoint returns at most 20 symbols per request
+USER_AGENT = 'Mozilla/5.0 (X11; Linux aarch64) mill_klubben'
+RETRY_AFTER = 30 # seconds to hold back after a 429 without a Retry-After header
+SUMMARY_COLUMNS = ['Ticker', 'Status', 'Attempts', 'Rows', 'Error']
+
+
+class RateLimiter:
+    """Allow at most `rate` requests per second per host, shared by all worker threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, url, seconds):
+        """No request to the host of url for the next `seconds`, e.g. after HTTP 429 Too Many Requests."""
+        host = urlparse(url).netloc
+        with self.lock:
+            self.next_slot[host] = max(self.next_slot.get(host, 0.0), time.monotonic() + seconds)
+
+
+def _retry_after(value, default=RETRY_AFTER):
+    ## Retry-After in seconds (the HTTP date form is not used by Yahoo)
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def session_dates(timestamps, meta):
+    """Dates of the daily bars in the exchange's time zone (meta of the spark response), UTC without it."""
+    t = pd.to_datetime(timestamps, unit='s', utc=True)
+    if meta.get('exchangeTimezoneName'):
+        t = t.tz_convert(meta['exchangeTimezoneName'])
+    elif meta.get('gmtoffset') is not None:
+        t = t + pd.Timedelta(seconds=meta['gmtoffset'])
+    return t.tz_localize(None).normalize()
+
+
+def spark_to_frames(payload):
+    """Parse a Yahoo spark response into {ticker: DataFrame with Date and Close}."""
+    frames = {}
+    for res in (payload.get('spark') or {}).get('result') or []:
+        response = (res.get('response') or [{}])[0]
+        timestamps = response.get('timestamp') or []
+        quote = ((response.get('indicators') or {}).get('quote') or [{}])[0]
+        close = quote.get('close') or []
+        if not timestamps:
+            continue
+        frame = pd.DataFrame({'Date': session_dates(timestamps, response.get('meta') or {}), 'Close': close})
+        frames[res['symbol']] = frame.dropna().drop_duplicates('Date', keep='last').reset_index(drop=True)
+    return frames
+
+
+class YahooFetcher:
+    """Batched close price requests against Yahoo's spark endpoint (or a stand-in with the same API)."""
+
+    def __init__(self, base_url=YAHOO_URL, period='5d', limiter=None, timeout=30):
+        import requests # only needed for the network path
+        self.base_url = base_url.rstrip('/')
+        self.period = period
+        self.limiter = limiter or RateLimiter(None)
+        self.timeout = timeout
+        self.local = threading.local()
+        self.requests = requests
+        self.lock = threading.Lock()
+        self.log = [] # (tickers, bytes, seconds) of every request, see ticker_traffic
+
+    def session(self):
+        ## one pooled session per worker thread
+        if not hasattr(self.local, 'session'):
+            self.local.session = self.requests.Session()
+            self.local.session.headers['User-Agent'] = USER_AGENT
+        return self.local.session
+
+    def __call__(self, tickers, period=None):
+        url = self.base_url + SPARK_PATH
+        params = {'symbols': ','.join(tickers), 'range': period or self.period, 'interval': '1d'}
+        self.limiter.wait(url)
+        t = time.monotonic()
+        r = self.session().get(url, params=params, timeout=self.timeout)
+        with self.lock:
+            self.log.append((list(tickers), len(r.content), time.monotonic() - t))
+        if r.status_code == 429:
+            ## the batch fails and is retried, the other workers wait as well
+            self.limiter.pause(url, _retry_after(r.headers.get('Retry-After')))
+        r.raise_for_status()
+        return spark_to_frames(r.json())
+
+
+def ticker_traffic(log):
+    """Requests, Bytes and Seconds per ticker from a fetcher log; a batch request's bytes are shared by its tickers."""
+    rows = [(t, n / len(tickers), s) for tickers, n, s in log for t in tickers]
+    traffic = pd.DataFrame(rows, columns=['Ticker', 'Bytes', 'Seconds'])
+    return traffic.groupby('Ticker').agg(Requests=('Bytes', 'size'), Bytes=('Bytes', 'sum'), Seconds=('Seconds', 'sum')).reset_index()
+
+
+def batches(tickers, size, periods=None):
+    """Split into (period, batch) pairs; a batch only holds tickers that need the same period."""
+    tickers = list(tickers)
+    groups = {}
+    for t in tickers:
+        groups.setdefault(periods.get(t) if periods else None, []).append(t)
+    return [(p, g[i:i+size]) for p, g in groups.items() for i in range(0, len(g), size)]
+
+
+def period_for(last_date, today=None):
+    """Smallest spark range that reaches back to last_date (None -> whole history)."""
+    if last_date is None or pd.isna(last_date):
+        return 'max'
+    gap = (pd.Timestamp(today or pd.Timestamp.today()).normalize() - pd.Timestamp(last_date)).days
+    for days, period in [(6, '5d'), (28, '1mo'), (88, '3mo'), (180, '6mo'), (360, '1y'), (720, '2y'), (1800, '5y')]:
+        if gap <= days:
+            return period
+    return 'max'
+
+
+def download(tickers, fetch, workers=4, batch_size=BATCH_SIZE, retries=3, backoff=1.0, on_result=None, periods=None):
+    """Fetch all tickers concurrently and return a per-ticker summary.
+
+    fetch(batch, period) returns {ticker: DataFrame}; `periods` maps a ticker to the range it needs,
+    without it the fetcher's default is used. Tickers missing in the answer or in a failed batch
+    are retried up to `retries` times after backoff, 2*backoff, ... seconds.
+    on_result(ticker, frame) is called in the calling thread, so a single writer can store the results.
+    """
+    summary = {t: {'Ticker': t, 'Status': 'failed', 'Attempts': 0, 'Rows': 0, 'Error': ''} for t in tickers}
+    pending = list(summary)
+    attempt = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending and attempt <= retries:
+            if attempt:
+                time.sleep(backoff * 2**(attempt-1))
+            futures = {pool.submit(fetch, b, p): b for p, b in batches(pending, batch_size, periods)}
+            pending = []
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    frames = future.result()
+                    error = 'no data returned'
+                except Exception as e:
+                    frames = {}
+                    error = type(e).__name__+': '+str(e)
+                for t in batch:
+                    summary[t]['Attempts'] += 1
+                    if t in frames:
+                        summary[t].update(Status='ok', Rows=len(frames[t]), Error='')
+                        if on_result is not None:
+                            on_result(t, frames[t])
+                    else:
+                        summary[t]['Error'] = error
+                        pending.append(t)
+            attempt += 1
+    return pd.DataFrame(list(summary.values()), columns=SUMMARY_COLUMNS)
@@ -0,0 +1,56 @@
+# Holding episodes: the runs of consecutive snapshots in which an investor holds an instrument
+# - a position that is sold and later bought back gives two episodes, each with its own buy date and return
+# - "consecutive" counts the snapshot dates of the investor, so a day on which the investor's whole table is
+#   missing from the page does not end an episode
+# - run-length encoding over the rows sorted by investor, instrument and date: a new episode starts where the
+#   pair changes or the investor's day number jumps by more than one; within an episode a new quantity segment
+#   starts where the quantity changes (partial buys and sells)
+
+import numpy as np
+
+
+KEY = ['Investor', 'Instrument']
+
+
+def _runs(m):
+    ## the rows of m sorted by pair and date, with the episode and quantity segment starts
+    x = m[KEY + ['Date', 'Quantity']].copy()
+    x['Day'] = x.groupby('Investor').Date.rank(method='dense').astype(int)
+    x = x.sort_values(KEY + ['Date'], kind='stable')
+    new_pair = (x.Investor != x.Investor.shift()) | (x.Instrument != x.Instrument.shift())
+    ## same-day duplicates (diff 0) stay in the episode
+    start = (new_pair | (x.Day.diff() > 1)).to_numpy()
+    change = start | (x.Quantity != x.Quantity.shift()).to_numpy()
+    ## episode number per pair, 0, 1, ... from the cumulative count of starts
+    n = np.cumsum(start)
+    first_of_pair = np.maximum.accumulate(np.where(new_pair.to_numpy(), n, 0))
+    x['Episode'] = n - first_of_pair
+    x['Segment'] = np.cumsum(change)
+    x['Start'] = start
+    return x
+
+
+def label(m):
+    """m with the Episode number (0, 1, ... per investor and instrument) of every row."""
+    return m.assign(Episode=_runs(m).Episode.reindex(m.index))
+
+
+def episodes(m):
+    """One row per holding episode: BuyDate, LastSeen, the number of Snapshots and the quantity changes."""
+    x = _runs(m)
+    change = np.where(x.Start, 0, x.Quantity.diff().fillna(0))
+    x['Increases'], x['Decreases'] = change > 0, change < 0
+    g = x.groupby(KEY + ['Episode'], sort=True)
+    return g.agg(BuyDate=('Date', 'min'), LastSeen=('Date', 'max'), Snapshots=('Day', 'nunique'),
+                 FirstQuantity=('Quantity', 'first'), LastQuantity=('Quantity', 'last'), MaxQuantity=('Quantity', 'max'),
+                 Increases=('Increases', 'sum'), Decreases=('Decreases', 'sum')).reset_index()
+
+
+def segments(m):
+    """One row per run of the same quantity within an episode (Start, End, Quantity, Change to the run before)."""
+    x = _runs(m)
+    s = x.groupby('Segment', sort=True).agg(Investor=('Investor', 'first'), Instrument=('Instrument', 'first'),
+                                           Episode=('Episode', 'first'), Start=('Date', 'min'), End=('Date', 'max'),
+                                           Quantity=('Quantity', 'first'), First=('Start', 'first'))
+    s['Change'] = np.where(s.First, s.Quantity, s.Quantity.diff())
+    return s.drop(columns='First').reset_index(drop=True)
@@ -0,0 +1,132 @@
+# Trade events derived from the daily portfolio snapshots
+# - BUY / SELL when a position appears / disappears, INCREASE / DECREASE when the quantity changes
+# - Price is the opening price (Åbningspris) shown on the website, for a SELL the last one seen
+# - quantities and prices are split adjusted (mk.corporate_actions), a split is no trade
+# - the scraper appends the events of each new day to data/trade_events.csv
+# - the whole log can be rebuilt from the snapshot history with `python -m mk.events`
+
+import datetime as dt
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from mk import store, instruments, corporate_actions
+
+
+EVENTS_FILE = 'trade_events.csv'
+KEY = ['Investor', 'Instrument']
+EVENT_COLUMNS = ['Date', 'Investor', 'Instrument', 'Ticker', 'Event', 'Quantity', 'PrevQuantity', 'NewQuantity', 'Price', 'Currency']
+
+
+def events_path(data_path):
+    return Path(data_path) / EVENTS_FILE
+
+
+def derive_events(snapshots, initial=True):
+    """Diff consecutive snapshots per (Investor, Instrument) and return the trade events.
+
+    `snapshots` needs the columns Date, Investor, Instrument, Antal, Åbningspris, Currency and Ticker.
+    With initial=True the holdings of the first snapshot are reported as BUY events,
+    otherwise the first snapshot is only used as the starting point of the diff.
+    """
+    snapshots = snapshots.loc[:, ['Date'] + KEY + ['Antal', 'Åbningspris', 'Currency', 'Ticker']].copy()
+    snapshots['Date'] = pd.to_datetime(snapshots.Date)
+    dates = np.sort(snapshots.Date.unique())
+    if len(dates) == 0:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+
+    ## one row per snapshot date, one column per position; a missing position has quantity 0
+    grid = snapshots.groupby(['Date'] + KEY)
+    qty = grid.Antal.sum().unstack(KEY).reindex(dates).fillna(0)
+    prev = qty.shift(1).fillna(0)
+    if not initial:
+        prev.iloc[0] = qty.iloc[0]
+
+    ## the last known price, currency and ticker also describe a sold position
+    last = grid[['Åbningspris', 'Currency', 'Ticker']].last()
+    attrs = {c: last[c].unstack(KEY).reindex(dates).ffill() for c in last.columns}
+
+    changed = (qty != prev).stack(KEY, future_stack=True)
+    changed = changed[changed].index
+    if len(changed) == 0:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+
+    def lookup(frame):
+        return frame.stack(KEY, future_stack=True).reindex(changed).values
+
+    ev = changed.to_frame(index=False)
+    ev['NewQuantity'] = lookup(qty)
+    ev['PrevQuantity'] = lookup(prev)
+    ev['Quantity'] = ev.NewQuantity - ev.PrevQuantity
+    ev['Price'] = lookup(attrs['Åbningspris'])
+    ev['Currency'] = lookup(attrs['Currency'])
+    ev['Ticker'] = lookup(attrs['Ticker'])
+    ev['Event'] = np.select(
+        [ev.PrevQuantity == 0, ev.NewQuantity == 0, ev.Quantity > 0],
+        ['BUY', 'SELL', 'INCREASE'], default='DECREASE')
+
+    return ev[EVENT_COLUMNS].sort_values(['Date'] + KEY).reset_index(drop=True)
+
+
+def load_events(data_path, start_date=None):
+    file = events_path(data_path)
+    if not file.exists():
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+    ev = pd.read_csv(file, sep=';', parse_dates=['Date'])
+    if start_date is not None:
+        ev = ev.loc[ev.Date >= pd.Timestamp(start_date)]
+    return ev.reset_index(drop=True)
+
+
+def append_events(ev, data_path, dates=None):
+    """Add events to the log; the logged events of `dates` (default: the dates in `ev`) are replaced.
+
+    Pass the snapshot date, so a rerun of the day that finds no events also drops the earlier run's events.
+    """
+    dates = pd.to_datetime(ev.Date).unique() if dates is None else pd.to_datetime(pd.Series(dates)).unique()
+    old = load_events(data_path)
+    old = old.loc[~old.Date.isin(dates)]
+    write_events(pd.concat([old, ev], axis=0), data_path)
+
+
+def write_events(ev, data_path):
+    ev = ev.sort_values(['Date'] + KEY, kind='stable').reset_index(drop=True)
+    ev = ev.assign(Date=pd.to_datetime(ev.Date).dt.strftime('%Y-%m-%d'))
+    ev[EVENT_COLUMNS].to_csv(events_path(data_path), sep=';', index=False)
+
+
+def events_for_snapshot(today_df, date, data_path):
+    """Events of a freshly scraped day against the previous stored snapshot."""
+    dates = [d for d in store.snapshot_dates(data_path) if d < pd.Timestamp(date)]
+    today_df = today_df.assign(Date=pd.Timestamp(date))
+    if not dates:
+        return derive_events(today_df)
+    prev_df = instruments.normalize(store.load_snapshots(data_path, start_date=dates[-1], end_date=dates[-1]))
+    ## a split is not a trade, both days are compared in post-split shares
+    both = corporate_actions.adjust_quantities(pd.concat([prev_df, today_df], axis=0))
+    ev = derive_events(both, initial=False)
+    return ev.loc[ev.Date == pd.Timestamp(date)].reset_index(drop=True)
+
+
+def rebuild_events(data_path):
+    """Backfill the event log from the complete snapshot history."""
+    ## unchanged days have no events, the stored days are enough
+    snapshots = store.load_snapshots(data_path, expand=False)
+    if snapshots.empty:
+        ## store not migrated yet, use the old daily CSV files
+        csv_files = sorted(Path(data_path).glob(store.CSV_PATTERN))
+        snapshots = pd.concat([store.read_csv_snapshot(f) for f in csv_files], axis=0, ignore_index=True)
+    ## older snapshots still hold the website's naming errors
+    snapshots = instruments.normalize(snapshots, drop_delisted=True)
+    ev = derive_events(corporate_actions.adjust_quantities(snapshots))
+    write_events(ev, data_path)
+    return ev
+
+
+if __name__ == '__main__':
+    ## python -m mk.events [data path]  -> rebuild data/trade_events.csv from all snapshots
+    import sys
+    data_path = sys.argv[1] if len(sys.argv) > 1 else Path(__file__).parent.parent / 'data'
+    ev = rebuild_events(data_path)
+    print(len(ev), 'trade events written to', events_path(data_path), 'at', dt.datetime.now().isoformat(timespec='seconds'))
@@ -0,0 +1,73 @@
+# Daily FX rates to DKK and the conversion of price matrices
+# - the rates are downloaded with the prices (Yahoo tickers like USDDKK=X) and stored in the `prices` table
+#   of MK_PRICES.db as instruments FX_USD, FX_EUR, ..., so watermarks and WAL reads work the same way
+# - conversion is an as-of join on labels: every price gets the rate of its own date (or the last one before)
+
+import numpy as np
+import pandas as pd
+
+from mk import pricedb
+
+
+BASE = 'DKK'
+PREFIX = 'FX_'
+## only used for currencies without any stored rate yet
+FALLBACK = {'USD':7.058, 'EUR':7.456, 'DKK':1, 'SEK':0.645, 'AUD':4.49, 'CAD':5.19, 'NOK':0.657}
+
+
+def fx_ticker(currency):
+    return currency + BASE + '=X'
+
+
+def fx_instrument(currency):
+    return PREFIX + currency
+
+
+def fx_instruments(currencies):
+    """{Yahoo ticker: instrument name in MK_PRICES.db} for all currencies except DKK."""
+    return {fx_ticker(c): fx_instrument(c) for c in sorted(set(currencies)) if c != BASE}
+
+
+def load_rates(con, currencies, start=None, end=None):
+    """Date x Currency matrix of DKK per unit, every calendar day; DKK is 1 and missing series use FALLBACK."""
+    currencies = sorted(set(currencies))
+    wide = pricedb.query(con, [fx_instrument(c) for c in currencies], start, end)
+    wide.columns = currencies
+    if wide.empty and start is not None and end is not None:
+        wide = wide.reindex(pd.date_range(start, end, name='Date'))
+    for c in currencies:
+        if c == BASE:
+            wide[c] = 1.0
+        elif wide[c].isna().all():
+            wide[c] = FALLBACK.get(c, np.nan)
+    ## the first days of a window may lie before the first stored rate
+    return wide.bfill()
+
+
+def asof(rates, dates):
+    """Rates of the last date <= each date (label based, `rates` must be sorted by date)."""
+    return rates.reindex(pd.DatetimeIndex(dates), method='ffill')
+
+
+def lookup_rates(rates, dates, currencies):
+    """Rate for many (date, currency) pairs at once, e.g. the FX of each snapshot row."""
+    dates = pd.DatetimeIndex(pd.to_datetime(pd.Series(dates)))
+    aligned = asof(rates, dates.unique().sort_values())
+    rows = aligned.index.get_indexer(dates)
+    cols = aligned.columns.get_indexer(pd.Series(currencies))
+    values = aligned.to_numpy(dtype=float)[rows, cols]
+    values[cols < 0] = np.nan
+    return values
+
+
+def to_dkk(prices, currency_of, rates):
+    """Convert a Date x Instrument price matrix to DKK in one operation.
+
+    currency_of maps Instrument -> Currency; rows and columns are matched by label, not by position.
+    """
+    currency_of = pd.Series(currency_of).reindex(prices.columns)
+    aligned = asof(rates, prices.index)
+    cols = aligned.columns.get_indexer(currency_of.to_numpy())
+    factor = aligned.to_numpy(dtype=float)[:, cols]
+    factor[:, cols < 0] = np.nan
+    return pd.DataFrame(prices.to_numpy(dtype=float) * factor, index=prices.index, columns=prices.columns)
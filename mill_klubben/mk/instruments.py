@@ -0,0 +1,76 @@
+# Shared normalization of the website's Instrument / Stockexchange names
+# - mk/instruments.csv maps raw website names (optionally per exchange) to the canonical Instrument,
+#   Stockexchange, Yahoo Ticker and the delisted status; mk/exchanges.csv has the Yahoo ticker suffixes
+# - all rules are resolved once for the distinct (Instrument, Stockexchange) pairs and then applied to the
+#   whole frame with a single indexer join, instead of one full column scan per alias
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+ALIASES_FILE = Path(__file__).parent / 'instruments.csv'
+EXCHANGES_FILE = Path(__file__).parent / 'exchanges.csv'
+KEY = ['Instrument', 'Stockexchange']
+
+
+def read_aliases(file=ALIASES_FILE):
+    aliases = pd.read_csv(file, sep=';', dtype=str, keep_default_na=False)
+    aliases['Delisted'] = aliases.Delisted.isin(['1', 'True', 'true'])
+    return aliases
+
+
+def read_exchanges(file=EXCHANGES_FILE):
+    ex = pd.read_csv(file, sep=';', dtype=str, keep_default_na=False)
+    return dict(zip(ex.Stockexchange, ex.Suffix))
+
+
+def yahoo_ticker(instrument, stockexchange, exchanges=None):
+    """Yahoo ticker from instrument and exchange, e.g. NOVO_B / xcse -> NOVO-B.CO (unknown exchanges are appended as is)."""
+    exchanges = read_exchanges() if exchanges is None else exchanges
+    suffix = pd.Series(stockexchange).map(exchanges).fillna(pd.Series(stockexchange)).to_numpy()
+    return pd.Series(np.asarray(instrument, dtype=object) + suffix).str.replace('_', '-').to_numpy()
+
+
+def resolve(pairs, aliases=None, exchanges=None):
+    """Canonical Instrument, Stockexchange, Ticker and Delisted for distinct raw (Instrument, Stockexchange) pairs."""
+    aliases = read_aliases() if aliases is None else aliases
+    exchanges = read_exchanges() if exchanges is None else exchanges
+    pairs = pairs[KEY].reset_index(drop=True)
+
+    ## an alias for the exact exchange wins over an alias for any exchange
+    exact = aliases.loc[aliases.RawExchange != ''].set_index(['RawInstrument', 'RawExchange'])
+    generic = aliases.loc[aliases.RawExchange == ''].drop_duplicates('RawInstrument').set_index('RawInstrument')
+    pos_exact = exact.index.get_indexer(pd.MultiIndex.from_frame(pairs))
+    pos_generic = generic.index.get_indexer(pairs.Instrument)
+
+    def pick(col):
+        value = np.full(len(pairs), '', dtype=object)
+        hit = pos_generic >= 0
+        value[hit] = generic[col].to_numpy()[pos_generic[hit]]
+        hit = pos_exact >= 0
+        value[hit] = exact[col].to_numpy()[pos_exact[hit]]
+        return value
+
+    res = pd.DataFrame({'RawInstrument': pairs.Instrument, 'RawExchange': pairs.Stockexchange})
+    res['Instrument'] = np.where(pick('Instrument') != '', pick('Instrument'), pairs.Instrument)
+    res['Stockexchange'] = np.where(pick('Stockexchange') != '', pick('Stockexchange'), pairs.Stockexchange)
+    derived = yahoo_ticker(res.Instrument, res.Stockexchange, exchanges)
+    res['Ticker'] = np.where(pick('Ticker') != '', pick('Ticker'), derived)
+    res['Delisted'] = pick('Delisted') == True
+    return res
+
+
+def normalize(df, drop_delisted=False, aliases=None, exchanges=None):
+    """Apply the alias table to a snapshot frame; sets Instrument, Stockexchange, Ticker and Delisted."""
+    df = df.copy()
+    df['Stockexchange'] = df.Stockexchange.fillna('')
+    raw = pd.MultiIndex.from_frame(df[KEY])
+    res = resolve(raw.unique().to_frame(index=False), aliases, exchanges)
+    pos = pd.MultiIndex.from_frame(res[['RawInstrument', 'RawExchange']]).get_indexer(raw)
+    for col in ['Instrument', 'Stockexchange', 'Ticker', 'Delisted']:
+        df[col] = res[col].to_numpy()[pos]
+    if drop_delisted:
+        df = df.loc[~df.Delisted]
+    return df
@@ -0,0 +1,183 @@
+# The nightly jobs as functions of the data path, used by the `python -m mk` commands and the scripts
+# - scrape: page -> page archive, events log and snapshot store, prices: MK_PRICES.db, build: data/tables/ and
+#   data/matrix/, render: data/figures/
+# - not part of the nightly run: backtest: data/backtest/, reparse: archived pages -> snapshot store and events log
+# - each job records its stages in data/metrics/ (mk.metrics)
+# - the heavy modules (pandas, lxml, requests, matplotlib) are imported inside the jobs, so a command only pays
+#   for what it runs, and `nightly` imports them once for all jobs
+
+import datetime as dt
+from pathlib import Path
+
+from mk import metrics
+
+
+PRICES_DB = 'MK_PRICES.db'
+WORKERS = 4
+RATE_LIMIT = 2 # requests per second and host
+RETRIES = 3
+
+
+def db_file(data_path):
+    return Path(data_path) / PRICES_DB
+
+
+def scrape(data_path, url=None, today=None):
+    """Fetch the page and store today's snapshot and trade events.
+
+    Returns 'stored', 'unchanged' (same holdings as the day before) or 'not modified' (HTTP 304), and the events.
+    """
+    import pandas as pd
+    from mk import store, events, instruments, saxo, archive
+
+    url = url or saxo.URL
+    today = today or dt.date.today()
+    run = metrics.Run('scrape', data_path)
+    ## None if the page is unchanged since the last stored scrape (HTTP 304)
+    with run.stage('fetch') as s:
+        content, validators = saxo.fetch(url, data_path)
+        s['bytes'] = len(content or b'')
+    ## the raw page, compressed, for a later `reparse`
+    with run.stage('archive') as s:
+        s['bytes'] = archive.save(data_path, today, url, content, validators)
+
+    if content is None:
+        ## the page of the last stored scrape; a second run on the same day keeps what was stored
+        with run.stage('write') as s:
+            if pd.Timestamp(today) not in store.snapshot_dates(data_path):
+                store.mark_unchanged(today, data_path)
+            s['rows'] = 0
+        run.finish()
+        return 'not modified', pd.DataFrame(columns=events.EVENT_COLUMNS)
+
+    ## investor headings and portfolio tables in one pass with lxml (saxo.parse_page_bs4 is the former path)
+    with run.stage('parse') as s:
+        df = saxo.parse_page(content)
+        s['rows'] = len(df)
+    # fix naming errors on website and derive the Yahoo ticker names (shared table in mk/instruments.csv)
+    with run.stage('normalize') as s:
+        df = instruments.normalize(df, drop_delisted=True).drop(columns='Delisted').reset_index(drop=True) # e.g. Voyager got delisted
+        s['rows'] = len(df)
+
+    ## diff against the previous snapshot and log buys and sells before storing today
+    with run.stage('events') as s:
+        new_events = events.events_for_snapshot(df, today, data_path)
+        events.append_events(new_events, data_path, dates=[today])
+        s['rows'] = len(new_events)
+    with run.stage('write') as s:
+        stored = store.write_snapshot(df, today, data_path)
+        s['rows'] = len(df) if stored else 0
+    saxo.save_validators(data_path, validators, url)
+    run.finish()
+    return ('stored' if stored else 'unchanged'), new_events
+
+
+def price_instruments(data_path, run):
+    """Instrument, Stockexchange, Ticker and Currency rows of every instrument ever held, with the Yahoo tickers.
+
+    The stages load and normalize are recorded in run (a metrics.Run).
+    """
+    from mk import store, instruments
+
+    # all snapshots ever stored, but only the columns needed for the ticker list (unchanged days are not expanded)
+    with run.stage('load') as s:
+        df = store.load_snapshots(data_path, columns=['Instrument', 'Stockexchange', 'Ticker', 'Currency'], expand=False)
+        s['rows'] = len(df)
+    # fix naming errors on website and set the Yahoo tickers (shared table in mk/instruments.csv); delisted have no prices
+    with run.stage('normalize') as s:
+        df = instruments.normalize(df, drop_delisted=True)
+        s['rows'] = len(df)
+    return df
+
+
+def prices(data_path, url=None, full_refresh=False, workers=WORKERS, rate_limit=RATE_LIMIT, retries=RETRIES):
+    """Download the closes of every instrument ever held and the FX rates into MK_PRICES.db; the per-ticker summary."""
+    from mk import download, pricedb, fx
+
+    run = metrics.Run('prices', data_path)
+    df = price_instruments(data_path, run)
+    dl = df[['Instrument', 'Ticker']].drop_duplicates()
+    tickers = dict(zip(dl.Ticker, dl.Instrument))
+    ## daily DKK rates of all traded currencies go into the same table, e.g. USDDKK=X as FX_USD
+    tickers.update(fx.fx_instruments(df.Currency.unique()))
+    con = pricedb.connect(db_file(data_path))
+    fetch = download.YahooFetcher(url or download.YAHOO_URL, limiter=download.RateLimiter(rate_limit))
+    with run.stage('download') as s:
+        summary = pricedb.update(con, tickers, fetch, full_refresh=full_refresh, workers=workers, retries=retries)
+        s['rows'], s['bytes'] = summary.Rows.sum(), sum(n for _, n, _ in fetch.log)
+    ## fold the WAL into the DB file now rather than when the last dashboard connection closes
+    pricedb.checkpoint(con)
+    con.close()
+    ## per ticker: the stored rows, and the time and bytes of the batch requests it was part of
+    traffic = summary.merge(download.ticker_traffic(fetch.log), on='Ticker', how='left').fillna({'Bytes': 0, 'Seconds': 0})
+    for t in traffic.itertuples():
+        run.record('download_ticker', t.Seconds, rows=t.Rows, bytes=t.Bytes, status=t.Status, ticker=t.Ticker)
+    run.finish()
+    return summary
+
+
+def reparse(data_path, workers=WORKERS, start=None, end=None):
+    """Regenerate the snapshot store and the events log from the archived pages (mk.archive).
+
+    Returns the days and rows parsed and the days whose page failed to parse (these keep their stored rows).
+    The tables have to be rebuilt afterwards, `build(full=True)`.
+    """
+    from mk import archive, events
+
+    run = metrics.Run('reparse', data_path)
+    with run.stage('reparse') as s:
+        days, rows, failed = archive.reparse(data_path, workers=workers, start=start, end=end)
+        s['rows'] = rows
+    with run.stage('events') as s:
+        s['rows'] = len(events.rebuild_events(data_path)) if days else 0
+    run.finish()
+    return days, rows, failed
+
+
+def build(data_path, full=False):
+    """Bring data/tables/ and the price matrices of data/matrix/ up to date (mk.tables, mk.pricematrix).
+
+    Returns the number of snapshot dates added and whether all was rebuilt.
+    """
+    from mk import tables, pricematrix
+
+    run = metrics.Run('tables', data_path)
+    with run.stage('build') as s:
+        n, full = tables.build(data_path, db_file(data_path), full=full)
+        s['rows'] = n
+    with run.stage('export') as s:
+        s['bytes'] = pricematrix.export_prices(data_path, db_file(data_path))
+    run.finish()
+    return n, full
+
+
+def render(data_path, force=False):
+    """Draw the figures in data/figures/ whose tables changed (mk.render); the names drawn."""
+    from mk import render as figures
+
+    run = metrics.Run('render', data_path)
+    with run.stage('render') as s:
+        drawn = figures.render(data_path, force=force)
+        s['rows'] = len(drawn)
+    run.finish()
+    return drawn
+
+
+def backtest(data_path, delays=None, amount=None, workers=WORKERS):
+    """Copy-trade sweep over all investors and delays (mk.backtest) into data/backtest/; the comparison table."""
+    from mk import backtest as bt
+
+    delays = bt.DELAYS if delays is None else delays
+    sizings = bt.SIZINGS if amount is None else (('mirror', 1), ('fixed', amount))
+    run = metrics.Run('backtest', data_path)
+    with run.stage('load') as s:
+        cube, dkk_prices, sessions = bt.load_inputs(data_path, db_file(data_path))
+        s['rows'] = cube.qty.shape[0]
+    with run.stage('sweep') as s:
+        comparison, curves = bt.sweep(cube, dkk_prices, sessions, delays=delays, sizings=sizings, workers=workers)
+        s['rows'] = len(comparison)
+    with run.stage('write') as s:
+        bt.write_results(comparison, curves, data_path)
+        s['rows'] = len(curves['PnL'])
+    run.finish()
+    return comparison
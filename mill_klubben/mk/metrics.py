@@ -0,0 +1,125 @@
+# Stage metrics of the cronjobs and the dashboard
+# - wall time, peak RSS of the process, rows and network bytes per stage (fetch, parse, normalize, write,
+#   the price download per ticker, load, valuation, render)
+# - every stage is appended as one JSON line to data/metrics/<job>.jsonl when it ends; the dashboard, run again on
+#   every click, appends one line per run with the seconds of its stages (and every failed stage as it fails)
+# - a log that reached MAX_BYTES is moved to <job>.jsonl.1 (replacing the one before), so it never grows past twice that
+# - `finish` writes the last run of a job as data/metrics/mk_<job>.prom in the Prometheus text format; with
+#   MK_TEXTFILE_DIR (e.g. /var/lib/node_exporter/textfile_collector) it also goes there for node_exporter
+
+import os
+import json
+import time
+import resource
+import tempfile
+import datetime as dt
+from pathlib import Path
+from contextlib import contextmanager
+
+
+METRICS_DIR = 'metrics'
+TEXTFILE_DIR = os.environ.get('MK_TEXTFILE_DIR')
+PREFIX = 'mk_stage_'
+MAX_BYTES = 4 * 1024 * 1024
+GAUGES = {'seconds': 'Wall time of the stage', 'peak_rss_bytes': 'Peak resident set size of the process at the end of the stage',
+          'rows': 'Rows processed by the stage', 'bytes': 'Network bytes received by the stage'}
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes (Linux reports kB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+class Run:
+    """The stages of one run of a job, e.g. `run = Run('scrape', data_path)` and `with run.stage('fetch') as s: ...`.
+
+    With per_stage=False only a summary line is logged when the run finishes (the .prom file still has every stage).
+    """
+
+    def __init__(self, job, data_path, textfile_dir=TEXTFILE_DIR, per_stage=True):
+        self.job = job
+        self.per_stage = per_stage
+        self.path = Path(data_path) / METRICS_DIR
+        self.textfile_dir = textfile_dir
+        self.started = dt.datetime.now().isoformat(timespec='seconds')
+        self.t0 = time.perf_counter()
+        self.records = []
+
+    def record(self, stage, seconds, rows=None, bytes=None, status='ok', **labels):
+        """Add a stage that was timed elsewhere, e.g. the tickers of the concurrent price download."""
+        rec = {'job': self.job, 'run': self.started, 'stage': stage, **labels, 'status': status,
+               'seconds': round(float(seconds), 6), 'peak_rss_bytes': peak_rss(),
+               'rows': None if rows is None else int(rows), 'bytes': None if bytes is None else int(bytes)}
+        self.records.append(rec)
+        if self.per_stage or status != 'ok':
+            self._append(rec)
+        return rec
+
+    def _append(self, rec):
+        self.path.mkdir(parents=True, exist_ok=True)
+        file = self.path / (self.job + '.jsonl')
+        if file.exists() and file.stat().st_size >= MAX_BYTES:
+            try:
+                os.replace(file, file.with_name(file.name + '.1'))
+            except FileNotFoundError:
+                pass # rotated by a concurrent run
+        with open(file, 'a') as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+
+    def summary(self):
+        """One record for the whole run: its wall time and the seconds of every stage (labels joined by '/')."""
+        fixed = set(GAUGES) | {'job', 'run', 'stage', 'status'}
+        stages = {'/'.join([rec['stage']] + [str(v) for k, v in rec.items() if k not in fixed]): rec['seconds']
+                  for rec in self.records}
+        return {'job': self.job, 'run': self.started, 'stage': 'run',
+                'status': 'ok' if all(rec['status'] == 'ok' for rec in self.records) else 'error',
+                'seconds': round(time.perf_counter() - self.t0, 6), 'peak_rss_bytes': peak_rss(),
+                'rows': None, 'bytes': None, 'stages': stages}
+
+    @contextmanager
+    def stage(self, stage, **labels):
+        """Time the block; set rows and bytes on the yielded dict. A failing stage is recorded with status error."""
+        counts = {'rows': None, 'bytes': None}
+        t = time.perf_counter()
+        status = 'error'
+        try:
+            yield counts
+            status = 'ok'
+        finally:
+            self.record(stage, time.perf_counter() - t, counts['rows'], counts['bytes'], status, **labels)
+
+    def prometheus(self):
+        """The records of this run in the Prometheus text exposition format."""
+        lines = []
+        for name, help in GAUGES.items():
+            lines += ['# HELP ' + PREFIX + name + ' ' + help, '# TYPE ' + PREFIX + name + ' gauge']
+            for rec in self.records:
+                if rec[name] is None:
+                    continue
+                labels = {k: v for k, v in rec.items() if k not in GAUGES and k != 'run'}
+                lines.append(PREFIX + name + '{' + ','.join(k + '="' + _label(v) + '"' for k, v in labels.items()) + '} ' + str(rec[name]))
+        lines += ['# HELP mk_run_seconds Wall time of the whole run', '# TYPE mk_run_seconds gauge',
+                  'mk_run_seconds{job="' + self.job + '"} ' + str(round(time.perf_counter() - self.t0, 6)),
+                  '# HELP mk_run_timestamp_seconds End of the last run', '# TYPE mk_run_timestamp_seconds gauge',
+                  'mk_run_timestamp_seconds{job="' + self.job + '"} ' + str(int(time.time()))]
+        return '\n'.join(lines) + '\n'
+
+    def finish(self):
+        """Write the .prom file(s) of this run, and its summary line with per_stage=False; the collector never sees a
+        half written file."""
+        if not self.per_stage:
+            self._append(self.summary())
+        text = self.prometheus()
+        for path in [self.path] + ([Path(self.textfile_dir)] if self.textfile_dir else []):
+            path.mkdir(parents=True, exist_ok=True)
+            ## a name of its own per run, concurrent runs (e.g. dashboard sessions) never write into the same file;
+            ## the collector only reads *.prom
+            with tempfile.NamedTemporaryFile('w', dir=path, prefix='mk_' + self.job + '.', suffix='.prom.tmp', delete=False) as f:
+                f.write(text)
+            ## readable by node_exporter like a file written by write_text
+            os.chmod(f.name, 0o644)
+            os.replace(f.name, path / ('mk_' + self.job + '.prom'))
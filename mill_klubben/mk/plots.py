@@ -0,0 +1,107 @@
+# Batched drawing helpers for the matplotlib charts
+# - all bars of a chart go into one PolyCollection instead of one ax.barh call per row
+# - portfolio_movements draws the holding period / invested amount chart of the dashboard (portfolio_movements.png),
+#   value_per_investor the overview of the invested value; both are rendered headless by mk.render
+
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import matplotlib.patches as patches
+from matplotlib.collections import PolyCollection
+
+
+INVESTOR_COLORS = {'Lars Persson': 'c', 'Lau Svenssen': 'm', 'Mads Christiansen': 'y', 'Michael Friis Jørgensen': 'b', 'Anders Bæk': 'orange'}
+
+
+def category_codes(labels):
+    """Integer y position per label in order of first appearance (like matplotlib's categorical axis) and the labels."""
+    codes = {}
+    for label in labels:
+        codes.setdefault(label, len(codes))
+    return np.array([codes[label] for label in labels], dtype=float), list(codes)
+
+
+def barh_collection(ax, y, width, left=0, color='grey', height=0.8, **kwargs):
+    """Draw horizontal bars at numeric positions y as a single collection.
+
+    left and width may be datetimes and timedeltas, they are converted to matplotlib date numbers (days).
+    """
+    y = np.asarray(y, dtype=float)
+    left = np.broadcast_to(_num(left), y.shape)
+    right = left + np.broadcast_to(_num(width), y.shape)
+    bottom, top = y - height/2, y + height/2
+    verts = np.stack([np.column_stack([left, bottom]), np.column_stack([left, top]),
+                      np.column_stack([right, top]), np.column_stack([right, bottom])], axis=1)
+    coll = PolyCollection(verts, facecolors=color, edgecolors='none', **kwargs)
+    ax.add_collection(coll)
+    ax.autoscale_view()
+    return coll
+
+
+def set_categories(ax, labels):
+    ax.set_yticks(np.arange(len(labels)), labels)
+
+
+def _num(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.timedelta64):
+        return values / np.timedelta64(1, 'D')
+    if np.issubdtype(values.dtype, np.datetime64):
+        return mdates.date2num(values)
+    return values.astype(float)
+
+
+def value_per_investor(value):
+    """Overview: DKK value of the holdings of every investor over time."""
+    fig, ax = plt.subplots(figsize=[12,6])
+    ax.plot(value)
+    ax.set_title('Value of investments without Cash')
+    ax.legend(value.columns)
+    ax.set_ylabel('DKK')
+    return fig
+
+
+def portfolio_movements(curr_all, today, investor_colors=INVESTOR_COLORS):
+    """Holding period per position (left) and invested DKK (right), the positions held `today` in colour."""
+    fig = plt.figure(figsize=[14,12])
+    ax0 = plt.subplot(121)
+
+    ## all bars of a chart are drawn as one collection; y positions are the instruments in order of appearance
+    y, instruments = category_codes(curr_all.Instrument)
+    barh_collection(ax0, y, width=curr_all.Days, left=curr_all.BuyDate, color=curr_all.Investor.map(investor_colors))
+    set_categories(ax0, instruments)
+    ax0.xaxis_date()
+
+    # Make ticks on occurrences of each month:
+    ax0.set_title('Holding period')
+    ax0.xaxis.set_major_locator(mdates.MonthLocator())
+    # Get only the month to show in the x-axis:
+    ax0.xaxis.set_major_formatter(mdates.DateFormatter('%b'))
+    ax0.set_xlabel('Timeline')
+    ylim = ax0.get_ylim()
+    ax0.vlines(today, ylim[0], ylim[1], colors='r')
+    ax0.xaxis.grid(True, alpha=0.5)
+
+    #------ second plot
+    ax1 = plt.subplot(122, sharey=ax0)
+
+    ## the trades
+    barh_collection(ax1, y, width=curr_all.InvestedDKK/1000, color='grey', alpha=0.6)
+
+    ## only the currently helt stocks
+    held = (curr_all.LastSeen == today.strftime('%Y-%m-%d')).to_numpy()
+    barh_collection(ax1, y[held], width=curr_all.InvestedDKK[held]/1000, color=curr_all.Investor[held].map(investor_colors), alpha=0.9)
+
+    ax1.set_title("Invested for DKK")
+    ax1.xaxis.grid(True, alpha=0.5)
+    ax1.yaxis.tick_right()
+    ax1.set_xlabel('TDKK')
+
+    ax1.invert_yaxis()
+
+    # Adding a legend
+    patch = []
+    for i in investor_colors:
+        patch.append(patches.Patch(color=investor_colors[i]))
+    ax1.legend(handles=patch, labels=investor_colors.keys(), fontsize=11)
+    return fig
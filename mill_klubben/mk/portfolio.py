@@ -0,0 +1,163 @@
+# Analysis steps from the snapshots to the position table, shared by the dashboard and the nightly table build
+# - cleaned snapshots (instrument names, splits, the Anders fix) and 'm' with my investors only
+# - split adjusted prices, DKK prices and the value per investor
+# - one row per holding episode (mk/episodes.py) with buy date, last seen and return, and the recent buys and sells
+
+import datetime as dt
+
+import pandas as pd
+
+from mk import store, pricedb, valuation, instruments, corporate_actions, fx, holdings, episodes
+
+
+FIRST_DAY = dt.datetime(2024,1,1)
+## Mads Christiansen - since Jan 2024 anyway no longer in MK
+MY_INVESTORS = ['Lars Persson', 'Lau Svenssen', 'Michael Friis Jørgensen', 'Anders Bæk']
+SNAPSHOT_COLUMNS = ['Investor', 'Instrument', 'Antal', 'Åbningspris', 'Amount', 'Currency', 'Stockexchange', 'Ticker']
+RECENT_DAYS = 14
+KEY = ['Investor', 'Instrument', 'Episode'] # one position
+
+
+def load_snapshots(data_path, start=FIRST_DAY, end=None):
+    """Cleaned snapshots of all investors with start <= Date <= end."""
+    ## create dataframe from the daily scraped website snapshots
+    df = store.load_snapshots(data_path, start_date=start, end_date=end, columns=SNAPSHOT_COLUMNS)
+    df = df.drop_duplicates()
+
+    # fix naming errors on website with the shared table in mk/instruments.csv
+    # (e.g. INRG from Milan becomes IQQH, the price in Milan is the same as in Germany)
+    ## Delisted must be removed it is just simpler this way
+    df = instruments.normalize(df, drop_delisted=True).drop(columns='Delisted').dropna()
+    ## remove all Instruments that made it in the df, but actually were not traded and Antal is therefore 0 (aktie bytte)
+    df = df.loc[~( (df.Antal.isna()) | (df.Antal==0) ) ]
+    ## quantities and opening prices in post-split shares (mk/corporate_actions.csv)
+    df = corporate_actions.adjust_quantities(df)
+
+    df = df.sort_values('Date').reset_index(drop=True)
+
+    if pd.Timestamp(start) <= pd.Timestamp(2024,1,4):
+        df = _fix_anders(df)
+    return df
+
+
+def _fix_anders(df):
+    ## Add Anders Bæk (fix)
+    ## From Dec 28 to Jan 4 the webpage was not updated. I make a df adjustment from Jan 1st to Jan 4th to compensate.
+    anders_start_portfolio = df[(df.Investor ==  'Anders Bæk') & (df.Date == '2024-01-05')].sort_values('Ticker')
+
+    ## duplicate Anders' portfolio from the 5th for all dates prior; from 1st to 4th all is the same, dirty fix, but works
+    to_add = pd.DataFrame()
+    for i in range(1,5):
+        df_temp = anders_start_portfolio.drop(columns='Date').reset_index(drop=True)
+        df_temp['Date'] = dt.datetime(2024,1,i)
+        to_add = pd.concat([to_add, df_temp], ignore_index=True)
+
+    return pd.concat([to_add, df], axis=0).reset_index(drop=True).sort_index()
+
+
+def my_portfolios(df, investors=MY_INVESTORS):
+    """Master df 'm' with all dates of my investors and English column names."""
+    m = df.loc[df.Investor.isin(investors)].sort_values('Investor').sort_index()
+    #Investor	Instrument	Quantity	OpeningPrice	Amount	Currency	Stockexchange	Ticker	FX	Date	BuyDate	LastSeen
+    return m.rename(columns={'Åbningspris':'OpeningPrice', 'Antal':'Quantity'})
+
+
+def load_prices(db_file, instruments, start, end):
+    """Calendar-day close price matrix from MK_PRICES.db over a read-only connection (the cronjob may be writing)."""
+    con = pricedb.connect(db_file, readonly=True)
+    ## consecutive calendar days, because I have some Buys that are on weekends (website update)
+    prices = pricedb.query(con, instruments, start, end)
+    con.close()
+    return prices
+
+
+def load_sessions(db_file, instruments, start, end):
+    """The trading sessions of `instruments`, the dates with real closes in the calendar-day price matrix."""
+    con = pricedb.connect(db_file, readonly=True)
+    dates = pricedb.sessions(con, instruments, start, end)
+    con.close()
+    return dates
+
+
+def load_rates(db_file, currencies, start, end):
+    """Daily DKK rates per currency (stored as FX_<currency> in MK_PRICES.db)."""
+    con = pricedb.connect(db_file, readonly=True)
+    rates = fx.load_rates(con, currencies, start, end)
+    con.close()
+    return rates
+
+
+def currencies(m):
+    """Currency per instrument."""
+    return m.drop_duplicates('Instrument').set_index('Instrument').Currency
+
+
+def holdings_cube(m, dkk_prices):
+    """Integer coded date x investor x instrument quantity cube of every snapshot date that has prices."""
+    snapshot_dates = pd.DatetimeIndex(m.Date.unique()).sort_values()
+    return holdings.Holdings.from_snapshots(m, dates=snapshot_dates[snapshot_dates <= dkk_prices.index.max()])
+
+
+def value_per_investor(m, dkk_prices):
+    """Date x Investor value of the holdings on every snapshot date that has prices."""
+    ## the sum of invested stocks per investor per date in one einsum against the DKK prices
+    return holdings_cube(m, dkk_prices).value_per_investor(dkk_prices)
+
+
+def drop_unchanged(value):
+    """Drop the value rows that repeat an earlier one, i.e. days the website was not updated.
+
+    Compared to the øre, the same day valued in builds over different windows differs in the last float digits.
+    """
+    return value.loc[~value.round(2).duplicated()].sort_index()
+
+
+def holding_periods(m):
+    """m with the Episode of every row and its first (BuyDate) and last (LastSeen) date.
+
+    A stock that was sold and bought back later has one episode per holding, not one from the first buy to the last day.
+    """
+    m = episodes.label(m)
+    buy_sell_dates = episodes.episodes(m)[KEY + ['BuyDate', 'LastSeen']]
+    ## add the first and last seen dates of the episode
+    return m.merge(buy_sell_dates, on=KEY, how='left')
+
+
+def positions(mbs, prices):
+    """curr_all: one row per holding episode with buy date, last seen and the return in between."""
+    ## Now with all investors
+    curr_all = mbs.groupby(KEY).last()
+    curr_all['InvestedDKK'] = curr_all.Amount * curr_all.FX
+
+    curr_all = curr_all.loc[curr_all.Date == curr_all['LastSeen']].reset_index()
+
+    ## buy price at BuyDate, last price at LastSeen and the return in one lookup into the price matrix
+    curr_all = valuation.add_returns(curr_all, prices)
+    return add_afkast(curr_all)
+
+
+def add_afkast(curr_all):
+    curr_all['AfkastDKK'] = curr_all.InvestedDKK * curr_all.Return
+    curr_all['Days'] = curr_all.LastSeen - curr_all.BuyDate
+    return curr_all
+
+
+def recent_trades(bs, days=RECENT_DAYS):
+    """Positions sold and bought during the last `days` days (rec_sold, rec_buy)."""
+    # get first and last datetime for final week of data
+    range_max = bs['LastSeen'].max()# - dt.timedelta(days=1) # that should be today, or yesterday, if the cronjob runs as expected and I run this in the evening or during the day, respectively
+    range_min = range_max - dt.timedelta(days=days)
+
+    # take slice with final week of data
+    rec_sold = bs[(bs['LastSeen'] >= range_min) &
+                  (bs['LastSeen'] <= range_max) &
+                  (bs['Quantity'] == 0)].reset_index(drop=True)
+
+    range_max = bs['BuyDate'].max() # that should be today, or yesterday, if the cronjob runs as expected and I run this in the evening or during the day, respectively
+    range_min = range_max - dt.timedelta(days=days)
+
+    # take slice with final week of data
+    rec_buy = bs[(bs['BuyDate'] >= range_min) &
+                 (bs['BuyDate'] <= range_max) &
+                 (bs['Quantity'] > 0)].reset_index(drop=True)
+    return rec_sold, rec_buy
@@ -0,0 +1,235 @@
+# Daily close prices in MK_PRICES.db
+# - long table `prices` with one row per (Instrument, Date), clustered on that composite key
+# - the DB runs in WAL mode, so the dashboard can read while the cronjob writes; every write of closes also stamps
+#   the table `versions` ('closes', and 'histories' when a whole history is replaced), `version` tells the readers
+#   when that was (the modification time of the files is no use: a reader recreates the -wal and -shm files)
+# - `query` returns the aligned wide matrix (calendar days x instruments) for a date range
+# - `price_watermarks` keeps the last stored trading date and close per instrument, so the nightly run
+#   only fetches the missing tail; a full history is fetched when asked for or when the overlapping
+#   day's close changed (split or other adjustment by the provider)
+
+import sqlite3
+import datetime as dt
+from pathlib import Path
+
+import pandas as pd
+
+from mk import download
+
+
+TABLE = 'prices'
+WATERMARKS = 'price_watermarks'
+VERSIONS = 'versions'
+CLOSES, HISTORIES = 'closes', 'histories' # the stamps of every write and of replaced histories
+ADJUST_TOLERANCE = 0.1 # relative change of an already stored close that counts as an adjustment
+
+
+def db_file(sql_db_path):
+    """File name of a 'sqlite:///...' URL as used by mystocks."""
+    return sql_db_path.replace('sqlite:///', '', 1)
+
+
+def connect(db_file, readonly=False):
+    """Connection for the writer (creates the tables) or a read-only one for the dashboard."""
+    if readonly:
+        return sqlite3.connect('file:'+str(db_file)+'?mode=ro', uri=True, timeout=30, check_same_thread=False)
+    con = sqlite3.connect(db_file, timeout=30)
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('PRAGMA synchronous=NORMAL')
+    con.execute('CREATE TABLE IF NOT EXISTS '+TABLE+' (Instrument TEXT NOT NULL, Date TEXT NOT NULL, Close REAL, '
+                'PRIMARY KEY (Instrument, Date)) WITHOUT ROWID')
+    con.execute('CREATE TABLE IF NOT EXISTS '+WATERMARKS+' (Instrument TEXT PRIMARY KEY, LastDate TEXT, '
+                'LastClose REAL, Updated TEXT)')
+    con.execute('CREATE TABLE IF NOT EXISTS '+VERSIONS+' (Name TEXT PRIMARY KEY, Written TEXT)')
+    return con
+
+
+def _stamp(con, *names):
+    ## in the transaction of the write, so a reader never sees new closes with the old version
+    now = dt.datetime.now().isoformat()
+    con.executemany('INSERT OR REPLACE INTO '+VERSIONS+' (Name, Written) VALUES (?, ?)', [(n, now) for n in names])
+
+
+def version(db_file, name=CLOSES):
+    """Time of the last write of closes (or with name=HISTORIES of a replaced history), '' if there was none.
+
+    Only writers change it.
+    """
+    if not Path(db_file).exists():
+        return ''
+    con = connect(db_file, readonly=True)
+    try:
+        row = con.execute('SELECT Written FROM '+VERSIONS+' WHERE Name = ?', (name,)).fetchone()
+    except sqlite3.OperationalError:
+        ## written before the table existed
+        row = None
+    con.close()
+    return '' if row is None else row[0]
+
+
+def checkpoint(con):
+    """Move the WAL into the DB file and truncate it, e.g. at the end of the download job."""
+    return con.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+
+
+def write_closes(con, instrument, frame):
+    """Insert or overwrite the Date/Close rows of one instrument."""
+    rows = [(instrument, d.strftime('%Y-%m-%d'), float(c)) for d, c in zip(pd.to_datetime(frame.Date), frame.Close)]
+    with con:
+        con.executemany('INSERT OR REPLACE INTO '+TABLE+' (Instrument, Date, Close) VALUES (?, ?, ?)', rows)
+        _stamp(con, CLOSES)
+    return len(rows)
+
+
+def watermarks(con):
+    """Last stored Date and Close per instrument, indexed by Instrument."""
+    wm = pd.read_sql_query('SELECT Instrument, LastDate, LastClose FROM '+WATERMARKS, con, parse_dates=['LastDate'])
+    return wm.set_index('Instrument')
+
+
+def set_watermark(con, instrument):
+    with con:
+        con.execute('INSERT OR REPLACE INTO '+WATERMARKS+' (Instrument, LastDate, LastClose, Updated) '
+                    'SELECT Instrument, Date, Close, ? FROM '+TABLE+' WHERE Instrument = ? ORDER BY Date DESC LIMIT 1',
+                    (dt.datetime.now().isoformat(timespec='seconds'), instrument))
+
+
+def adjusted(mark, frame, tolerance=ADJUST_TOLERANCE):
+    """True if the fetched close of the watermark day differs from the stored one."""
+    if mark is None:
+        return False
+    same_day = frame.loc[pd.to_datetime(frame.Date) == mark.LastDate, 'Close']
+    if same_day.empty or not mark.LastClose:
+        return False
+    return abs(same_day.iloc[-1] / mark.LastClose - 1) > tolerance
+
+
+def append_tail(con, instrument, frame, mark=None):
+    """Store the rows from the watermark day on (the overlap day's close may have been intraday) and move the mark."""
+    if mark is not None:
+        frame = frame.loc[pd.to_datetime(frame.Date) >= mark.LastDate]
+    n = write_closes(con, instrument, frame)
+    set_watermark(con, instrument)
+    return n
+
+
+def replace_history(con, instrument, frame):
+    with con:
+        con.execute('DELETE FROM '+TABLE+' WHERE Instrument = ?', (instrument,))
+        _stamp(con, CLOSES, HISTORIES)
+    n = write_closes(con, instrument, frame)
+    set_watermark(con, instrument)
+    return n
+
+
+def update(con, instruments, fetch, full_refresh=False, today=None, **kwargs):
+    """Bring the `prices` table up to date for {ticker: instrument}.
+
+    Every ticker is fetched from its watermark on; tickers without a watermark, all of them with
+    full_refresh=True, and tickers whose stored history was adjusted get the whole history instead.
+    kwargs go to download.download. Returns the per-ticker summary with the stored Rows and a Refreshed flag.
+    """
+    marks = watermarks(con)
+    mark = {t: (None if full_refresh or i not in marks.index else marks.loc[i]) for t, i in instruments.items()}
+    periods = {t: download.period_for(None if m is None else m.LastDate, today) for t, m in mark.items()}
+    stored = {}
+    refresh = []
+
+    def store_tail(ticker, frame):
+        if periods[ticker] == 'max':
+            stored[ticker] = replace_history(con, instruments[ticker], frame)
+        elif adjusted(mark[ticker], frame):
+            refresh.append(ticker)
+        else:
+            stored[ticker] = append_tail(con, instruments[ticker], frame, mark[ticker])
+
+    def store_full(ticker, frame):
+        stored[ticker] = replace_history(con, instruments[ticker], frame)
+
+    summary = download.download(list(instruments), fetch, on_result=store_tail, periods=periods, **kwargs)
+    if refresh:
+        again = download.download(refresh, fetch, on_result=store_full, periods={t: 'max' for t in refresh}, **kwargs)
+        summary = pd.concat([summary.loc[~summary.Ticker.isin(refresh)], again], ignore_index=True)
+
+    summary['Rows'] = summary.Ticker.map(stored).fillna(0).astype(int)
+    summary['Refreshed'] = summary.Ticker.isin(refresh) | summary.Ticker.map(periods).eq('max')
+    return summary
+
+
+def first_closes(con):
+    """Close of the first stored day per instrument; it changes when a history is replaced by an adjusted one."""
+    return pd.read_sql_query('SELECT Instrument, MIN(Date) AS Date, Close FROM '+TABLE+' GROUP BY Instrument', con)
+
+
+def last_date(con):
+    """The newest stored close date of any instrument, None if nothing is stored."""
+    date = con.execute('SELECT MAX(Date) FROM '+TABLE).fetchone()[0]
+    return None if date is None else pd.Timestamp(date)
+
+
+def query(con, instruments, start=None, end=None, full_dates=True):
+    """Close prices of `instruments` with start <= Date <= end as a wide frame (Date x Instrument).
+
+    With full_dates=True every calendar day is present and gaps (weekends, holidays) are forward filled,
+    also from the last close before `start`, because some website buys happen on weekends.
+    """
+    instruments = list(instruments)
+    marks = ','.join('?'*len(instruments))
+    start = None if start is None else pd.Timestamp(start).strftime('%Y-%m-%d')
+    end = None if end is None else pd.Timestamp(end).strftime('%Y-%m-%d')
+
+    sql = 'SELECT Instrument, Date, Close FROM '+TABLE+' WHERE Instrument IN ('+marks+')'
+    params = instruments
+    if start is not None:
+        sql += ' AND Date >= ?'
+        params = params + [start]
+    if end is not None:
+        sql += ' AND Date <= ?'
+        params = params + [end]
+    long = pd.read_sql_query(sql, con, params=params)
+
+    if start is not None and full_dates:
+        ## the last close before the window, as start value for the forward fill
+        before = pd.read_sql_query('SELECT Instrument, MAX(Date) AS Date, Close FROM '+TABLE+' WHERE Instrument IN ('
+                                   +marks+') AND Date < ? GROUP BY Instrument', con, params=instruments+[start])
+        long = pd.concat([before, long], ignore_index=True)
+
+    long['Date'] = pd.to_datetime(long.Date)
+    wide = long.pivot(index='Date', columns='Instrument', values='Close').reindex(columns=instruments)
+    wide.columns.name = None
+    if full_dates and not wide.empty:
+        first = wide.index.min() if start is None else min(wide.index.min(), pd.Timestamp(start))
+        last = wide.index.max() if end is None else pd.Timestamp(end)
+        wide = wide.reindex(pd.date_range(first, last, name='Date')).ffill()
+        if start is not None:
+            wide = wide.loc[start:]
+    return wide
+
+
+def sessions(con, instruments, start=None, end=None):
+    """Trading sessions: the dates with a stored close of at least one of `instruments` (no forward filled days)."""
+    instruments = list(instruments)
+    sql = 'SELECT DISTINCT Date FROM '+TABLE+' WHERE Instrument IN ('+','.join('?'*len(instruments))+')'
+    params = instruments
+    if start is not None:
+        sql += ' AND Date >= ?'
+        params = params + [pd.Timestamp(start).strftime('%Y-%m-%d')]
+    if end is not None:
+        sql += ' AND Date <= ?'
+        params = params + [pd.Timestamp(end).strftime('%Y-%m-%d')]
+    dates = pd.read_sql_query(sql, con, params=params).Date
+    return pd.DatetimeIndex(pd.to_datetime(dates), name='Date').sort_values()
+
+
+def import_legacy(con, sql_db_path, instruments):
+    """Copy the per-instrument histories read by mystocks' retrievals.sql_price into the long table."""
+    from mystocks import retrievals
+    legacy = retrievals.sql_price(list(instruments), sql_db_path).sort_index()
+    legacy.index.name = 'Date'
+    n = 0
+    for instrument in legacy.columns:
+        frame = legacy[instrument].dropna().reset_index().rename(columns={instrument: 'Close'})
+        n += write_closes(con, instrument, frame)
+        set_watermark(con, instrument)
+    return n
+
@@ -0,0 +1,115 @@
+# Memory-mapped price matrices shared by all dashboard sessions
+# - the nightly build exports the split adjusted closes, the DKK closes and the FX rates as aligned Date x column
+#   float64 matrices (NumPy .npy, row-major so a date range is one contiguous slice) plus meta.json with the
+#   index, the columns and the key of the data they were built from
+# - every export is a new directory data/matrix/<version>/; the CURRENT file names the current one and is
+#   swapped atomically, so a reader sees either the old or the new export; older versions are removed,
+#   mappings that are still open keep their pages until they are dropped
+# - readers map the files read-only (np.load(mmap_mode='r')) and wrap them in DataFrames without copying, so
+#   every session and process reads the same pages of the page cache instead of its own copy from SQLite
+
+import os
+import json
+import shutil
+import datetime as dt
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from mk import cache, corporate_actions, fx, portfolio
+
+
+MATRIX_DIR = 'matrix'
+CURRENT = 'CURRENT'
+META = 'meta.json'
+KEEP = 2 # versions kept on disk, the current one and the one before
+
+
+def matrix_path(data_path):
+    return Path(data_path) / MATRIX_DIR
+
+
+def data_key(newest_snapshot, db_version, actions_version):
+    """The inputs an export is valid for: the newest snapshot, the price DB's version (pricedb.version) and the actions."""
+    return {'newest_snapshot': str(pd.Timestamp(newest_snapshot).date()), 'db_version': db_version,
+            'actions_version': actions_version}
+
+
+def read_meta(data_path, version):
+    return json.loads((matrix_path(data_path) / version / META).read_text())
+
+
+def current(data_path, key=None):
+    """Version of the current export, None if there is none or (with key) it was exported for other data."""
+    file = matrix_path(data_path) / CURRENT
+    if not file.exists():
+        return None
+    version = file.read_text().strip()
+    if key is not None and read_meta(data_path, version)['key'] != key:
+        return None
+    return version
+
+
+def export(data_path, frames, key):
+    """Write {name: Date x column frame} as a new version, make it the current one; the bytes written."""
+    path = matrix_path(data_path)
+    version = dt.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    tmp = path / (version + '.tmp')
+    tmp.mkdir(parents=True)
+    meta = {'key': key, 'frames': {}}
+    size = 0
+    for name, frame in frames.items():
+        file = tmp / (name + '.npy')
+        np.save(file, np.ascontiguousarray(frame.to_numpy(dtype=np.float64)))
+        size += file.stat().st_size
+        meta['frames'][name] = {'index': [d.strftime('%Y-%m-%d') for d in frame.index],
+                                'columns': [str(c) for c in frame.columns]}
+    (tmp / META).write_text(json.dumps(meta))
+    tmp.rename(path / version)
+
+    pointer = path / (CURRENT + '.tmp')
+    pointer.write_text(version)
+    os.replace(pointer, path / CURRENT)
+    ## the version names sort by time
+    for old in sorted(p for p in path.iterdir() if p.is_dir() and not p.name.endswith('.tmp'))[:-KEEP]:
+        shutil.rmtree(old, ignore_errors=True)
+    return size
+
+
+def open_matrix(data_path, version):
+    """{name: DataFrame} of an export as read-only views into the mapped files, no data is copied."""
+    meta = read_meta(data_path, version)
+    frames = {}
+    for name, m in meta['frames'].items():
+        values = np.load(matrix_path(data_path) / version / (name + '.npy'), mmap_mode='r')
+        frames[name] = pd.DataFrame(values, index=pd.DatetimeIndex(m['index'], name='Date'),
+                                    columns=pd.Index(m['columns']), copy=False)
+    return frames
+
+
+def build_frames(data_path, db_file):
+    """prices (split adjusted), dkk_prices and rates of every instrument held since FIRST_DAY, as the dashboard uses them."""
+    m = portfolio.my_portfolios(portfolio.load_snapshots(data_path))
+    end = m.Date.max()
+    held = sorted(m.Instrument.unique())
+    prices = corporate_actions.adjusted_prices(portfolio.load_prices(db_file, held, portfolio.FIRST_DAY, end))
+    currency_of = portfolio.currencies(m)
+    rates = portfolio.load_rates(db_file, tuple(sorted(currency_of.unique())), portfolio.FIRST_DAY, end)
+    dkk_prices = fx.to_dkk(prices, currency_of, rates).dropna(how='all')
+    return {'prices': prices, 'dkk_prices': dkk_prices, 'rates': rates}
+
+
+def export_prices(data_path, db_file):
+    """Export the price matrices unless the current export is already for the stored data; the bytes written."""
+    key = data_key(*cache.data_version(data_path, db_file), corporate_actions.version())
+    if current(data_path, key) is not None:
+        return 0
+    return export(data_path, build_frames(data_path, db_file), key)
+
+
+def load(data_path, db_file):
+    """The mapped frames of the current export if it matches the stored data, else None."""
+    key = data_key(*cache.data_version(data_path, db_file), corporate_actions.version())
+    version = current(data_path, key)
+    return None if version is None else open_matrix(data_path, version)
@@ -0,0 +1,105 @@
+# Headless rendering of the dashboard's matplotlib figures from the materialized tables (mk.tables)
+# - Agg backend, no display and no Streamlit needed, e.g. from cron after `python -m mk.tables`
+# - every figure is keyed by a content hash of its input tables and the day it shows; an image is only drawn
+#   again when that key changes, i.e. when the holdings or the prices changed
+# - the images and their keys are kept in data/figures/, the dashboard shows them instead of plotting
+# - run `python -m mk.render [data path] [--force]` (or `python -m mk render`)
+
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from mk import tables, plots
+
+
+FIGURES_DIR = 'figures'
+KEYS = 'figures.json'
+DPI = 150
+VERSION = 1 # increase when a figure is drawn differently, all images are rendered again
+
+
+def _movements(t, day):
+    return plots.portfolio_movements(t['positions'], day)
+
+
+def _value(t, day):
+    return plots.value_per_investor(t['value_per_investor'])
+
+
+## figure name -> (tables it is drawn from, function of the tables and the day)
+FIGURES = {'portfolio_movements': (['positions'], _movements),
+           'value_per_investor': (['value_per_investor'], _value)}
+
+
+def figures_path(data_path):
+    return Path(data_path) / FIGURES_DIR
+
+
+def figure_file(data_path, name):
+    return figures_path(data_path) / (name + '.png')
+
+
+def read_keys(data_path):
+    file = figures_path(data_path) / KEYS
+    return json.loads(file.read_text()) if file.exists() else {}
+
+
+def figure_key(name, t, day):
+    """Hash of the input tables of a figure and the day it shows."""
+    h = hashlib.sha1(('%s %d %s' % (name, VERSION, pd.Timestamp(day).date())).encode())
+    for table in FIGURES[name][0]:
+        h.update(pd.util.hash_pandas_object(t[table], index=True).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+def render(data_path, t=None, force=False):
+    """Draw the figures whose inputs changed since their image was rendered; returns the names drawn.
+
+    t are the tables of tables.read_tables (read here if not given); the day shown is the last built snapshot date.
+    """
+    state = tables.read_state(data_path)
+    if state is None:
+        return []
+    t = tables.read_tables(data_path) if t is None else t
+    day = pd.Timestamp(state['last_date'])
+    path = figures_path(data_path)
+    path.mkdir(parents=True, exist_ok=True)
+    keys = read_keys(data_path)
+    drawn = []
+    for name, (_, draw) in FIGURES.items():
+        key = figure_key(name, t, day)
+        file = figure_file(data_path, name)
+        if not force and keys.get(name) == key and file.exists():
+            continue
+        fig = draw(t, day)
+        ## a temporary name of its own, sessions rendering at the same time never write into the same file
+        with tempfile.NamedTemporaryFile(dir=path, prefix=file.name + '.', suffix='.tmp', delete=False) as f:
+            fig.savefig(f, format='png', dpi=DPI)
+        plt.close(fig)
+        os.replace(f.name, file)
+        keys[name] = key
+        drawn.append(name)
+    if drawn:
+        with tempfile.NamedTemporaryFile('w', dir=path, prefix=KEYS + '.', suffix='.tmp', delete=False) as f:
+            f.write(json.dumps(keys, indent=1))
+        os.replace(f.name, path / KEYS)
+    return drawn
+
+
+if __name__ == '__main__':
+    ## python -m mk.render [data path] [--force]
+    import sys
+    import datetime as dt
+    args = [a for a in sys.argv[1:] if a != '--force']
+    data_path = args[0] if args else Path(__file__).parent.parent / 'data'
+    from mk import jobs
+    drawn = jobs.render(data_path, force='--force' in sys.argv)
+    print(len(drawn), 'figures rendered to', figures_path(data_path), drawn,
+          'at', dt.datetime.now().isoformat(timespec='seconds'))
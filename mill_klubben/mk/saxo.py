@@ -0,0 +1,161 @@
+# Download and parsing of the Millionærklubben page on home.saxo
+# - one pooled requests session with retries for the requests of a run
+# - conditional requests: the ETag / Last-Modified of the last stored scrape are sent back, an unchanged page
+#   answers 304 Not Modified and is neither downloaded nor parsed again
+# - the validators of the last stored scrape are kept in data/page_validators.json
+# - `parse_page` reads the portfolio tables and investor headings in one pass with lxml (libxml2) and builds the
+#   table directly; `parse_page_bs4` is the former BeautifulSoup + pd.read_html path, kept as reference
+#   (benchmarks/bench_parse.py compares both on the saved pages in benchmarks/fixtures/)
+
+import os
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+import lxml.html
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from mk import download
+
+
+URL = 'https://www.home.saxo/da-dk/campaigns/millionaerklubben'
+VALIDATORS_FILE = 'page_validators.json'
+TABLE_CLASS = 'v2-show-sm inspiration-table' # the mobile variant of every portfolio table, one row per position
+NAME_CLASS = 'instrument__description-name' # the long stock name inside the Instrument cell, not used
+UTF8_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+
+
+def pooled_session(retries=3, pool=4):
+    """requests session with a connection pool and retries with backoff on connection errors and 5xx answers."""
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=pool, max_retries=Retry(total=retries, backoff_factor=1, status_forcelist=[500, 502, 503, 504]))
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    s.headers['User-Agent'] = download.USER_AGENT
+    return s
+
+
+def read_validators(data_path, url=URL):
+    file = Path(data_path) / VALIDATORS_FILE
+    if not file.exists():
+        return {}
+    return json.loads(file.read_text()).get(url, {})
+
+
+def save_validators(data_path, validators, url=URL):
+    """Remember the validators of a scrape, call it after the snapshot was stored."""
+    file = Path(data_path) / VALIDATORS_FILE
+    stored = json.loads(file.read_text()) if file.exists() else {}
+    stored[url] = validators
+    ## a temporary file of its own and a swap, a stopped run never leaves a truncated file that breaks every later scrape
+    with tempfile.NamedTemporaryFile('w', dir=file.parent, prefix=file.name + '.', suffix='.tmp', delete=False) as f:
+        f.write(json.dumps(stored, indent=1))
+    os.replace(f.name, file)
+
+
+def fetch(url=URL, data_path=None, session=None, timeout=30, validators=None):
+    """Page content and its validators; the content is None if the page is unchanged since the last stored scrape.
+
+    Instead of the stored validators of data_path, those of an earlier fetch can be given (e.g. kept in memory).
+    """
+    session = session or pooled_session()
+    headers = {}
+    if validators is None:
+        validators = read_validators(data_path, url) if data_path is not None else {}
+    if validators.get('ETag'):
+        headers['If-None-Match'] = validators['ETag']
+    if validators.get('Last-Modified'):
+        headers['If-Modified-Since'] = validators['Last-Modified']
+    r = session.get(url, headers=headers, timeout=timeout)
+    if r.status_code == 304:
+        return None, validators
+    r.raise_for_status()
+    return r.content, {k: r.headers[k] for k in ['ETag', 'Last-Modified'] if k in r.headers}
+
+
+def _instrument_text(td):
+    ## text of the Instrument cell without the long stock name
+    parts = [td.text or '']
+    for child in td:
+        if NAME_CLASS not in (child.get('class') or '').split():
+            parts.append(child.text_content())
+        parts.append(child.tail or '')
+    return ' '.join(''.join(parts).split())
+
+
+def _danish_number(values):
+    ## 1.234,56 -> 1234.56
+    values = pd.Series(values, dtype='string').str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return pd.to_numeric(values, errors='coerce')
+
+
+def parse_page(content):
+    """Portfolio table of all investors from the page, in one pass over the document.
+
+    Every table is paired with the `h2.highlight` investor heading right before it; a heading without a table
+    (another highlighted title, an investor with an empty portfolio) is skipped. Raises ValueError for a table
+    without a heading before it, so a changed page layout never attributes a portfolio to the wrong investor.
+    """
+    doc = lxml.html.fromstring(content, parser=UTF8_PARSER if isinstance(content, bytes) else None)
+    rows = []
+    tables = 0
+    investor = None
+    for el in doc.iter('h2', 'table'):
+        if el.tag == 'h2':
+            if 'highlight' in (el.get('class') or '').split():
+                investor = el.text_content().strip()
+        elif el.get('class') == TABLE_CLASS:
+            if investor is None:
+                raise ValueError('portfolio table %d without an investor heading before it' % (tables + 1))
+            tables += 1
+            for tr in el.iter('tr'):
+                cells = tr.findall('td')
+                if len(cells) >= 3:
+                    rows.append((_instrument_text(cells[0]), cells[1].text_content(), cells[2].text_content(), investor))
+            investor = None
+
+    df = pd.DataFrame(rows, columns=['Instrument', 'Antal', 'Åbningspris', 'Investor'])
+    df['Antal'] = _danish_number(df.Antal)
+    df['Åbningspris'] = _danish_number(df.Åbningspris)
+    return tidy(df)
+
+
+def parse_page_bs4(content):
+    """The former parser: BeautifulSoup's html.parser, the tables re-parsed by pd.read_html, headings paired by position."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, "html.parser")
+
+    # find correct table:
+    ## this was not working between 2024 Feb7 to 15th !!
+    tbl = soup.find_all(class_ = TABLE_CLASS)
+    for i in range(0, len(tbl)):
+        for tag in tbl[i].find_all('div', class_ = NAME_CLASS): # delete the stock name
+            tag.clear()
+    investor = soup.find_all('h2', class_ = "highlight")
+    raw_df = pd.read_html(StringIO(str(tbl)), decimal=',', thousands='.') # list of all tables dfs
+
+    df = pd.DataFrame()
+    for i in range(0, len(raw_df)):
+        raw_df[i]['Investor'] = investor[i].get_text()
+        df = pd.concat([df,raw_df[i]], axis=0)
+
+    df = df.drop(labels='Unnamed: 3', axis=1) # the "Handel" button field
+    return tidy(df)
+
+
+def tidy(df):
+    """Amount, Currency and Stockexchange from the parsed columns Instrument, Antal, Åbningspris and Investor."""
+    df['Amount'] = df.Antal * df.Åbningspris
+
+    ## clean up Instrument
+    df['Currency'] = df['Instrument'].str[-3:] # make a new Currency column
+
+    df["Instrument"]= [x.replace('. '+str(y), '' ) for x, y in df[['Instrument','Currency']].to_numpy()]
+
+    df[['Instrument', 'Stockexchange']] = df.Instrument.str.split(':', expand=True)
+    df.Stockexchange = df.Stockexchange.replace(' ', '', regex=True)
+    return df.reset_index(drop=True)
@@ -0,0 +1,218 @@
+# Local stand-in HTTP servers for offline testing of the network paths
+# - PriceServer answers Yahoo spark requests from a dict of close price frames
+#   e.g. `with PriceServer(frames) as url: download.YahooFetcher(url)`
+# - PageServer serves an HTML page like the Millionærklubben page, with ETag / Last-Modified and 304 answers;
+#   render_page builds such a page from a stored snapshot
+# - HookServer receives webhook POSTs (JSON) and keeps them in `requests`
+
+import json
+import hashlib
+import threading
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+
+
+SESSION_OPEN = 10 # hour of the bar timestamps of tickers with a time zone
+RANGE_DAYS = {'1d': 1, '5d': 7, '1mo': 31, '3mo': 92, '6mo': 183, '1y': 366, '2y': 731, '5y': 1827, '10y': 3653}
+
+def _number(x, decimals):
+    text = '{:,.{}f}'.format(x, decimals)
+    return text.replace(',', '_').replace('.', ',').replace('_', '.') # Danish: 1.234,56
+
+
+def render_page(snapshot, filler=0):
+    """HTML in the layout of the Millionærklubben page for one day's snapshot (Investor, Instrument, Antal, ...).
+
+    Like the real page every portfolio comes as mobile table (the one that is scraped) and as desktop table;
+    filler adds that many blocks of unrelated page content (navigation, articles) around them.
+    """
+    block = ('<div class="article"><h2>Artikel</h2><p>' + 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 8
+             + '</p><ul>' + '<li><a href="/da-dk/link">Link</a></li>' * 10 + '</ul></div>')
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>Millionærklubben</title></head><body>', block * (filler // 2)]
+    for investor, rows in snapshot.groupby('Investor', sort=False):
+        parts.append('<section><h2 class="highlight">' + investor + '</h2>')
+        parts.append('<table class="v2-show-sm inspiration-table"><thead><tr><th>Instrument</th><th>Antal</th>'
+                     '<th>Åbningspris</th><th></th></tr></thead><tbody>')
+        for r in rows.itertuples():
+            parts.append('<tr><td><div class="instrument__description-name">' + r.Instrument + ' long name</div>'
+                         + r.Instrument + ':' + r.Stockexchange + '. ' + r.Currency + '</td>'
+                         '<td>' + _number(r.Antal, 0) + '</td><td>' + _number(r.Åbningspris, 2) + '</td>'
+                         '<td><a class="button">Handel</a></td></tr>')
+        parts.append('</tbody></table>')
+        parts.append('<table class="v2-hide-sm inspiration-table"><thead><tr><th>Instrument</th><th>Børs</th><th>Antal</th>'
+                     '<th>Åbningspris</th><th>Valuta</th></tr></thead><tbody>')
+        for r in rows.itertuples():
+            parts.append('<tr><td>' + r.Instrument + '</td><td>' + r.Stockexchange + '</td><td>' + _number(r.Antal, 0)
+                         + '</td><td>' + _number(r.Åbningspris, 2) + '</td><td>' + r.Currency + '</td></tr>')
+        parts.append('</tbody></table></section>')
+    parts.append(block * (filler - filler // 2))
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _PriceHandler(_Handler):
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        symbols = query.get('symbols', [''])[0].split(',')
+        days = RANGE_DAYS.get(query.get('range', ['max'])[0])
+        since = pd.Timestamp(server.today) - pd.Timedelta(days=days) if days else None
+        with server.lock:
+            server.requests.append(symbols)
+            fail = server.fail_next > 0
+            server.fail_next -= fail
+        if fail:
+            headers = {} if server.retry_after is None else {'Retry-After': str(server.retry_after)}
+            return self.send_json({'error': 'stand-in failure'}, status=server.fail_status, headers=headers)
+        result = []
+        for s in symbols:
+            frame = server.frames.get(s)
+            if frame is None:
+                continue
+            if since is not None:
+                frame = frame.loc[pd.to_datetime(frame.Date) >= since]
+            ## like Yahoo, a bar is stamped with the session open in the exchange's time zone
+            tz = server.timezones.get(s, 'UTC')
+            opens = pd.to_datetime(frame.Date).dt.tz_localize(tz) + pd.Timedelta(hours=0 if tz == 'UTC' else SESSION_OPEN)
+            result.append({'symbol': s, 'response': [{
+                'meta': {'exchangeTimezoneName': tz, 'gmtoffset': int(opens.iloc[-1].utcoffset().total_seconds()) if len(opens) else 0},
+                'timestamp': [int(t.timestamp()) for t in opens],
+                'indicators': {'quote': [{'close': [float(c) for c in frame.Close]}]}}]})
+        self.send_json({'spark': {'result': result, 'error': None}})
+
+
+class _PageHandler(_Handler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            body, etag, modified = server.body, server.etag, server.modified
+            not_modified = (self.headers.get('If-None-Match') == etag
+                            or (self.headers.get('If-None-Match') is None and self.headers.get('If-Modified-Since') == modified))
+            server.requests.append(304 if not_modified else 200)
+        self.send_response(304 if not_modified else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', modified)
+        if not_modified:
+            return self.end_headers()
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _HookHandler(_Handler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            fail = self.server.fail_next > 0
+            self.server.fail_next -= fail
+            if not fail:
+                self.server.requests.append(json.loads(body or b'null'))
+        if fail:
+            return self.send_json({'error': 'stand-in failure'}, status=500)
+        self.send_response(204)
+        self.end_headers()
+
+
+class _StandIn:
+
+    handler = None
+
+    def __init__(self):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self.handler)
+        self.httpd.requests = []
+        self.httpd.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.httpd.server_port
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def __enter__(self):
+        self.thread.start()
+        return self.url
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class PriceServer(_StandIn):
+    """Serve {ticker: DataFrame(Date, Close)} on 127.0.0.1 with Yahoo's spark JSON layout.
+
+    The `range` parameter is honoured relative to `today`. fail_next makes the next n requests
+    answer with HTTP fail_status (with a Retry-After header if retry_after is given) to exercise the retries;
+    `requests` records the symbols of every request. timezones {ticker: time zone name} stamps the bars of a
+    ticker with the session open in its exchange's time zone, like the ASX bars that start the day before in UTC.
+    """
+
+    handler = _PriceHandler
+
+    def __init__(self, frames, fail_next=0, today=None, fail_status=503, retry_after=None, timezones=None):
+        super().__init__()
+        self.httpd.frames = frames
+        self.httpd.today = pd.Timestamp(today or pd.Timestamp.today()).normalize()
+        self.httpd.fail_next = fail_next
+        self.httpd.fail_status = fail_status
+        self.httpd.retry_after = retry_after
+        self.httpd.timezones = timezones or {}
+
+
+class PageServer(_StandIn):
+    """Serve one HTML page on 127.0.0.1 and answer conditional requests with 304 while it is unchanged.
+
+    set_page() replaces the page (new ETag and Last-Modified); `requests` records the status of every answer.
+    """
+
+    handler = _PageHandler
+
+    def __init__(self, html):
+        super().__init__()
+        self.set_page(html)
+
+    def set_page(self, html):
+        body = html.encode() if isinstance(html, str) else html
+        with self.httpd.lock:
+            self.httpd.body = body
+            self.httpd.etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            self.httpd.modified = formatdate(usegmt=True)
+
+
+class HookServer(_StandIn):
+    """Accept JSON POSTs on 127.0.0.1, e.g. from mk.watch.WebhookSink; `requests` holds the decoded bodies.
+
+    fail_next makes the next n POSTs fail with HTTP 500, they are not recorded.
+    """
+
+    handler = _HookHandler
+
+    def __init__(self, fail_next=0):
+        super().__init__()
+        self.httpd.fail_next = fail_next
@@ -0,0 +1,251 @@
+# Columnar snapshot store for the daily scraped Millionærklubben portfolios
+# - one Parquet file per month in data/snapshots/, e.g. data/snapshots/2024-01.parquet
+# - manifest.csv records every snapshot date, its partition and row count
+# - loaders only open the partitions inside the requested date window and only the needed columns
+# - a day whose holdings equal the day before is not stored again, the manifest records it as "unchanged since"
+#   the last stored day (content hash of the table) and the loaders expand it to full rows
+
+import os
+import re
+import glob
+import hashlib
+import datetime as dt
+from pathlib import Path
+
+import pandas as pd
+
+
+STORE_DIR = 'snapshots'
+MANIFEST = 'manifest.csv'
+COLUMNS = ['Date', 'Investor', 'Instrument', 'Antal', 'Åbningspris', 'Amount', 'Currency', 'Stockexchange', 'Ticker']
+MANIFEST_COLUMNS = ['Date', 'Partition', 'Rows', 'Hash', 'UnchangedSince']
+
+CSV_PATTERN = 'mill_klubben_portf-*.csv'
+CSV_DATE = re.compile(r'mill_klubben_portf-(\d{4}-\d{2}-\d{2})\.csv$')
+
+
+def store_path(data_path):
+    return Path(data_path) / STORE_DIR
+
+
+def read_manifest(data_path):
+    """All snapshot dates, sorted, as a DataFrame with Date, Partition, Rows, Hash and UnchangedSince.
+
+    UnchangedSince is the stored day with the same holdings, such days have no Partition.
+    """
+    file = store_path(data_path) / MANIFEST
+    if not file.exists():
+        return pd.DataFrame(columns=MANIFEST_COLUMNS).astype({'Date': 'datetime64[ns]', 'UnchangedSince': 'datetime64[ns]'})
+    manifest = pd.read_csv(file, sep=';', parse_dates=['Date'], dtype={'Partition': str, 'Hash': str})
+    manifest = manifest.reindex(columns=MANIFEST_COLUMNS) # manifests written before the content hash
+    manifest['UnchangedSince'] = pd.to_datetime(manifest.UnchangedSince)
+    return manifest.sort_values('Date').reset_index(drop=True)
+
+
+def snapshot_dates(data_path):
+    return list(read_manifest(data_path).Date)
+
+
+def write_atomic(df, file, **kwargs):
+    ## write next to the target and swap, so a reading dashboard never sees a half written file
+    tmp = file.with_name(file.name + '.tmp')
+    if file.suffix == '.parquet':
+        df.to_parquet(tmp, index=False, **kwargs)
+    else:
+        df.to_csv(tmp, sep=';', index=False, **kwargs)
+    os.replace(tmp, file)
+
+
+def _write_manifest(manifest, data_path):
+    manifest = manifest.sort_values('Date').reset_index(drop=True)
+    manifest = manifest.assign(Date=pd.to_datetime(manifest.Date).dt.strftime('%Y-%m-%d'),
+                               UnchangedSince=pd.to_datetime(manifest.UnchangedSince).dt.strftime('%Y-%m-%d'))
+    write_atomic(manifest[MANIFEST_COLUMNS], store_path(data_path) / MANIFEST)
+
+
+def content_hash(df):
+    """Hash of a day's holdings table, independent of the date and the row order."""
+    x = df[[c for c in COLUMNS if c != 'Date' and c in df.columns]]
+    ## int or float after a NaN, and Amount = Antal * Åbningspris with float noise
+    x = x.astype({c: float for c in x.columns if pd.api.types.is_numeric_dtype(x[c])}).round(6)
+    x = x.sort_values(list(x.columns)).reset_index(drop=True)
+    return hashlib.sha1(x.to_csv(sep=';', index=False).encode()).hexdigest()[:16]
+
+
+def _prepare(df, date=None):
+    df = df.copy()
+    if date is not None:
+        df['Date'] = pd.Timestamp(date)
+    df['Date'] = pd.to_datetime(df['Date']).astype('datetime64[ns]')
+    return df[[c for c in COLUMNS if c in df.columns]].reset_index(drop=True)
+
+
+def write_snapshots(df, data_path):
+    """Append one or more daily snapshots (a frame with a Date column) to the store.
+
+    Dates that are already stored are replaced, so re-running the scraper on the same day is safe.
+    Only the touched monthly partitions are rewritten. All rows are stored, see `write_snapshot` and `compact`.
+    """
+    df = _prepare(df)
+    if df.empty:
+        return
+    path = store_path(data_path)
+    path.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(data_path)
+
+    df['Partition'] = df.Date.dt.strftime('%Y-%m')
+    for partition, new in df.groupby('Partition'):
+        new = new.drop(columns='Partition')
+        file = path / (partition + '.parquet')
+        if file.exists():
+            old = pd.read_parquet(file)
+            old = old.loc[~old.Date.isin(new.Date.unique())]
+            new = pd.concat([old, new], axis=0)
+        new = new.sort_values('Date', kind='stable').reset_index(drop=True)
+        write_atomic(new, file)
+
+        days = new.groupby('Date')
+        rows = days.size()
+        hashes = [content_hash(day) for _, day in days]
+        manifest = manifest.loc[(manifest.Partition != partition) & ~manifest.Date.isin(rows.index)]
+        manifest = pd.concat([manifest, pd.DataFrame({'Date': rows.index, 'Partition': partition, 'Rows': rows.values,
+                                                      'Hash': hashes})])
+
+    _write_manifest(manifest, data_path)
+
+
+def write_snapshot(df, date, data_path):
+    """Store the scraped portfolio table of a single day.
+
+    If the holdings equal the previous day's, only the manifest entry is added. Returns True if rows were stored.
+    """
+    df = _prepare(df, date)
+    before = read_manifest(data_path)
+    before = before.loc[before.Date < pd.Timestamp(date)]
+    if not before.empty and before.Hash.iloc[-1] == content_hash(df):
+        mark_unchanged(date, data_path)
+        return False
+    write_snapshots(df, data_path)
+    return True
+
+
+def _drop_dates(dates, partition, data_path):
+    file = store_path(data_path) / (partition + '.parquet')
+    old = pd.read_parquet(file)
+    write_atomic(old.loc[~old.Date.isin(dates)], file)
+
+
+def mark_unchanged(date, data_path):
+    """Record `date` as unchanged since the last stored day before it, without storing rows."""
+    date = pd.Timestamp(date)
+    manifest = read_manifest(data_path)
+    before = manifest.loc[manifest.Date < date]
+    if before.empty:
+        raise ValueError('no snapshot before '+str(date.date())+' to refer to')
+    last = before.iloc[-1]
+    since = last.Date if pd.isna(last.UnchangedSince) else last.UnchangedSince
+
+    ## a stored run of the same day is replaced by the entry
+    same = manifest.loc[(manifest.Date == date) & manifest.Partition.notna()]
+    for partition in same.Partition:
+        _drop_dates([date], partition, data_path)
+    manifest = manifest.loc[manifest.Date != date]
+    entry = pd.DataFrame({'Date': [date], 'Rows': [last.Rows], 'Hash': [last.Hash], 'UnchangedSince': [since]})
+    _write_manifest(pd.concat([manifest, entry]), data_path)
+
+
+def load_snapshots(data_path, start_date=None, end_date=None, columns=None, expand=True):
+    """Read all snapshots with start_date <= Date <= end_date.
+
+    Partitions outside the window are not opened and only `columns` (plus Date) are read.
+    Unchanged days are filled with the rows of their stored day; with expand=False only the stored days
+    are returned, enough for everything that only needs the distinct holdings (e.g. the ticker list).
+    """
+    full = read_manifest(data_path)
+    manifest = full
+    if start_date is not None:
+        manifest = manifest.loc[manifest.Date >= pd.Timestamp(start_date)]
+    if end_date is not None:
+        manifest = manifest.loc[manifest.Date <= pd.Timestamp(end_date)]
+    unchanged = manifest.loc[manifest.UnchangedSince.notna()] if expand else manifest.iloc[:0]
+
+    if columns is not None:
+        columns = ['Date'] + [c for c in columns if c != 'Date']
+
+    ## the stored days of the window plus the stored days the unchanged ones refer to (may lie before the window)
+    dates = manifest.loc[manifest.UnchangedSince.isna(), 'Date']
+    dates = pd.concat([dates, unchanged.UnchangedSince]).drop_duplicates()
+    windowed = start_date is not None or end_date is not None or not unchanged.empty
+    filters = [('Date', 'in', list(dates))] if windowed else None
+
+    path = store_path(data_path)
+    parts = [pd.read_parquet(path / (p + '.parquet'), columns=columns, filters=filters)
+             for p in full.loc[full.Date.isin(dates), 'Partition'].dropna().unique()]
+    if not parts:
+        return pd.DataFrame(columns=columns or COLUMNS)
+    df = pd.concat(parts, axis=0, ignore_index=True)
+
+    if not unchanged.empty:
+        ## one copy of the stored day per unchanged day, with that day's date
+        refs = unchanged[['Date', 'UnchangedSince']].rename(columns={'Date': 'Day', 'UnchangedSince': 'Date'})
+        copies = df.merge(refs, on='Date').drop(columns='Date').rename(columns={'Day': 'Date'})[df.columns]
+        df = pd.concat([df.loc[df.Date.isin(manifest.Date)], copies], axis=0, ignore_index=True)
+    return df.sort_values('Date', kind='stable').reset_index(drop=True)
+
+
+def read_csv_snapshot(file):
+    """Read one of the old daily CSV files, taking the date from the file name."""
+    x = pd.read_csv(file, sep=';', index_col=[0])
+    x['Date'] = pd.Timestamp(CSV_DATE.search(str(file)).group(1))
+    return x
+
+
+def compact(data_path):
+    """Replace stored days that repeat the day before by "unchanged since" entries (once for the history)."""
+    manifest = read_manifest(data_path)
+    path = store_path(data_path)
+    frames = {p: pd.read_parquet(path / (p + '.parquet')) for p in manifest.Partition.dropna().unique()}
+    hashes = {d: content_hash(day) for frame in frames.values() for d, day in frame.groupby('Date')}
+    manifest['Hash'] = manifest.Date.map(hashes).fillna(manifest.Hash)
+
+    since = []
+    prev_hash, prev_source = None, None
+    for day in manifest.itertuples():
+        source = day.Date if pd.isna(day.UnchangedSince) else day.UnchangedSince
+        if pd.isna(day.UnchangedSince) and day.Hash == prev_hash:
+            source = prev_source
+        since.append(pd.NaT if source == day.Date else source)
+        prev_hash, prev_source = day.Hash, source
+    manifest['UnchangedSince'] = pd.to_datetime(pd.Series(since, index=manifest.index, dtype='datetime64[ns]'))
+
+    drop = manifest.loc[manifest.UnchangedSince.notna() & manifest.Partition.notna()]
+    for partition, days in drop.groupby('Partition'):
+        frame = frames[partition]
+        write_atomic(frame.loc[~frame.Date.isin(days.Date)], path / (partition + '.parquet'))
+    manifest.loc[manifest.UnchangedSince.notna(), 'Partition'] = None
+    _write_manifest(manifest, data_path)
+    return len(drop)
+
+
+def migrate_csv(data_path):
+    """One-shot import of the old data/mill_klubben_portf-<date>.csv files into the store."""
+    csv_files = sorted(glob.glob(os.path.join(data_path, CSV_PATTERN)))
+    csv_files = [f for f in csv_files if CSV_DATE.search(f)]
+    if not csv_files:
+        return 0
+    df = pd.concat([read_csv_snapshot(f) for f in csv_files], axis=0, ignore_index=True)
+    write_snapshots(df, data_path)
+    return len(csv_files)
+
+
+if __name__ == '__main__':
+    ## python -m mk.store [data path] [--compact]  -> migrate the CSV history once, then store repeated days as entries
+    import sys
+    args = [a for a in sys.argv[1:] if a != '--compact']
+    data_path = args[0] if args else Path(__file__).parent.parent / 'data'
+    if '--compact' in sys.argv:
+        n = compact(data_path)
+        print(n, 'unchanged days removed from', store_path(data_path), 'at', dt.datetime.now().isoformat(timespec='seconds'))
+    else:
+        n = migrate_csv(data_path)
+        print(n, 'CSV snapshots migrated into', store_path(data_path), 'at', dt.datetime.now().isoformat(timespec='seconds'))
@@ -0,0 +1,209 @@
+# Materialized result tables of the nightly build, read by the dashboard
+# - data/tables/ holds value_per_investor, positions (curr_all since FIRST_DAY), recent_sold, recent_bought,
+#   daily_performance and investor_metrics (mk.analytics), consensus, overlap and consensus_events (mk.consensus)
+#   as Parquet
+# - state.json records the last built snapshot date, the newest stored close, the table layout and corporate actions
+#   versions and the first close of every stored price history
+# - each night only the snapshot dates after the last build are valued and merged into the position table, plus the
+#   days from the last build's newest close on: the download stores the closes from each watermark day on again
+#   (the close of the evening before may have been intraday), so those days are valued again and their rows replaced
+# - a changed actions table or a replaced history of an instrument already covered rebuilds everything; a newly
+#   bought instrument (its first history) does not
+# - the daily performance and consensus rows of the new days are appended, the per investor metrics are computed
+#   again from the whole daily table
+# - run `python -m mk.tables [data path] [--full]` (or `python -m mk build`) after the price download
+
+import json
+import datetime as dt
+from pathlib import Path
+
+import pandas as pd
+
+from mk import store, pricedb, valuation, corporate_actions, fx, portfolio, analytics, consensus
+
+
+TABLES_DIR = 'tables'
+STATE = 'state.json'
+TABLES = ['value_per_investor', 'positions', 'recent_sold', 'recent_bought', 'daily_performance', 'investor_metrics',
+          'consensus', 'overlap', 'consensus_events']
+PAIR = ['Investor', 'Instrument']
+LOOKBACK = pd.Timedelta(days=14) # older snapshots loaded with the new days, for the split detection around them
+VERSION = 4 # layout of the tables, a build with another version rebuilds everything (2: one position per holding episode,
+            # 3: performance tables, 4: consensus tables)
+
+
+def tables_path(data_path):
+    return Path(data_path) / TABLES_DIR
+
+
+def read_state(data_path):
+    file = tables_path(data_path) / STATE
+    if not file.exists():
+        return None
+    return json.loads(file.read_text())
+
+
+def write_state(state, data_path):
+    file = tables_path(data_path) / STATE
+    tmp = file.with_name(file.name + '.tmp')
+    tmp.write_text(json.dumps(state, indent=1))
+    tmp.replace(file)
+
+
+def price_state(db_file):
+    """{instrument: [first date, first close]} of the stored histories (see pricedb.first_closes) and the newest close date."""
+    con = pricedb.connect(db_file, readonly=True)
+    first = pricedb.first_closes(con)
+    newest = pricedb.last_date(con)
+    con.close()
+    firsts = {r.Instrument: [r.Date, None if pd.isna(r.Close) else round(r.Close, 6)] for r in first.itertuples()}
+    return firsts, None if newest is None else newest.strftime('%Y-%m-%d')
+
+
+def replaced_histories(old, new):
+    """Instruments of an earlier build whose history was replaced since (their first close changed)."""
+    return sorted(i for i in old if i in new and old[i] != new[i])
+
+
+def read_tables(data_path):
+    """{name: DataFrame} of all materialized tables, value_per_investor indexed by Date, investor_metrics by Investor."""
+    path = tables_path(data_path)
+    tables = {name: pd.read_parquet(path / (name + '.parquet')) for name in TABLES}
+    tables['value_per_investor'] = tables['value_per_investor'].set_index('Date')
+    tables['investor_metrics'] = tables['investor_metrics'].set_index('Investor')
+    return tables
+
+
+def write_tables(tables, data_path):
+    path = tables_path(data_path)
+    path.mkdir(parents=True, exist_ok=True)
+    for name in TABLES:
+        frame = tables[name]
+        if name == 'value_per_investor':
+            frame = frame.rename_axis('Date').reset_index()
+        elif name == 'investor_metrics':
+            frame = frame.reset_index()
+        store.write_atomic(frame, path / (name + '.parquet'))
+
+
+def is_fresh(state, newest_snapshot, actions_version):
+    """True if the tables were built from the newest snapshot with the current corporate actions."""
+    return (state is not None and newest_snapshot is not None
+            and pd.Timestamp(state['last_date']) == pd.Timestamp(newest_snapshot)
+            and state['actions_version'] == actions_version)
+
+
+def merge_positions(old, new, prices, last, since=None, rates=None):
+    """Position table updated with the holding episodes of the window loaded after the build of `last`.
+
+    Episodes that ended by `last` are already in old; their buy and last prices from `since` (default `last`) on
+    are looked up again, with rates also the FX rate of the last seen day. An episode running over `last` continues the pair's
+    old episode held on `last` and keeps its Episode number, BuyDate and BuyPrice; episodes that started
+    later are numbered after the pair's old ones. Everything else comes from the newest row.
+    """
+    last = pd.Timestamp(last)
+    new = new.loc[new.LastSeen > last].sort_values(portfolio.KEY).reset_index(drop=True)
+    pair = pd.MultiIndex.from_frame(new[PAIR])
+    held = old.loc[old.LastSeen == last].set_index(PAIR)
+    pos = held.index.get_indexer(pair)
+    cont = (new.BuyDate <= last).to_numpy() & (pos >= 0)
+    for col in ['Episode', 'BuyDate', 'BuyPrice']:
+        new.loc[cont, col] = held[col].to_numpy()[pos[cont]]
+    first = old.groupby(PAIR).Episode.max().add(1).reindex(pair).fillna(0).to_numpy()
+    rank = new.loc[~cont].groupby(PAIR).cumcount().reindex(new.index).fillna(0).to_numpy()
+    new.loc[~cont, 'Episode'] = (first + rank)[~cont]
+    new['Episode'] = new.Episode.astype(int)
+
+    old, new = old.set_index(portfolio.KEY), new.set_index(portfolio.KEY)
+    curr_all = pd.concat([old.drop(new.index.intersection(old.index)), new], axis=0).sort_index().reset_index()
+
+    ## prices that were missing at an earlier build or stored again since
+    since = last if since is None else pd.Timestamp(since)
+    if rates is not None:
+        again = curr_all.LastSeen >= since
+        curr_all.loc[again, 'FX'] = fx.lookup_rates(rates, curr_all.loc[again, 'LastSeen'], curr_all.loc[again, 'Currency'])
+        curr_all['InvestedDKK'] = curr_all.Amount * curr_all.FX
+    for col, date in [('BuyPrice', 'BuyDate'), ('LastPrice', 'LastSeen')]:
+        missing = curr_all[col].isna() | (curr_all[date] >= since)
+        curr_all.loc[missing, col] = valuation.lookup_prices(prices, curr_all.loc[missing, date], curr_all.loc[missing, 'Instrument'])
+    curr_all['Return'] = (curr_all.LastPrice - curr_all.BuyPrice) / curr_all.BuyPrice
+    return portfolio.add_afkast(curr_all)
+
+
+def build(data_path, db_file, full=False):
+    """Bring the tables up to date with the stored snapshots and prices.
+
+    Returns the number of snapshot dates added and whether everything was rebuilt.
+    """
+    dates = [d for d in store.snapshot_dates(data_path) if d >= portfolio.FIRST_DAY]
+    if not dates:
+        return 0, False
+    newest = dates[-1]
+    key = {'tables_version': VERSION, 'actions_version': corporate_actions.version()}
+    firsts, prices_through = price_state(db_file)
+    state = read_state(data_path)
+    full = (full or state is None or any(state.get(k) != v for k, v in key.items())
+            or 'first_closes' not in state or replaced_histories(state['first_closes'], firsts)
+            or not all((tables_path(data_path) / (n + '.parquet')).exists() for n in TABLES))
+    last = None if full else pd.Timestamp(state['last_date'])
+    if last is not None and last >= newest:
+        return 0, False
+
+    ## valued again from the last build's newest close (or its last snapshot date, if earlier) on
+    since = None if full else min(last, pd.Timestamp(state.get('prices_through') or last))
+    ## the days from `since` plus a few before them; a full build starts at the first day
+    start = portfolio.FIRST_DAY if full else since - LOOKBACK
+    old = None if full else read_tables(data_path)
+    m = portfolio.my_portfolios(portfolio.load_snapshots(data_path, start, newest))
+    price_start = start
+    if old is not None:
+        stale = old['positions'].BuyPrice.isna() | old['positions'].LastPrice.isna()
+        price_start = min(start, old['positions'].loc[stale, 'BuyDate'].min()) if stale.any() else start
+
+    held = sorted(m.Instrument.unique())
+    prices = corporate_actions.adjusted_prices(portfolio.load_prices(db_file, held, price_start, newest))
+    currency_of = portfolio.currencies(m)
+    rates = portfolio.load_rates(db_file, tuple(sorted(currency_of.unique())), price_start, newest)
+    dkk_prices = fx.to_dkk(prices, currency_of, rates).dropna(how='all')
+    m['FX'] = fx.lookup_rates(rates, m.Date, m.Currency)
+
+    new_m = m if full else m.loc[m.Date >= since]
+    value = portfolio.value_per_investor(new_m, dkk_prices)
+    ## daily value, gain and flow of the window; the lookback days give the holdings the day before the first new day
+    perf = analytics.daily(portfolio.holdings_cube(m, dkk_prices), dkk_prices)
+    ## overlap and consensus per date; the lookback days give the holders of the snapshot before the first new day
+    cons = consensus.compute(m, dkk_prices)
+    ## the episodes of the whole window, so that those running over the last build can be continued
+    curr_all = portfolio.positions(portfolio.holding_periods(m), prices)
+    if old is not None:
+        ## the rows from `since` on are replaced
+        old_value = old['value_per_investor']
+        value = pd.concat([old_value.loc[old_value.index < since], value], axis=0).fillna(0)
+        value = value[sorted(value.columns)]
+        curr_all = merge_positions(old['positions'], curr_all, prices, last, since, rates)
+        old_perf = old['daily_performance']
+        perf = pd.concat([old_perf.loc[old_perf.Date < since], perf.loc[perf.Date >= since]], ignore_index=True)
+        cons = {k: pd.concat([old[k].loc[old[k].Date < since], v.loc[v.Date >= since]], ignore_index=True)
+                for k, v in cons.items()}
+    value = portfolio.drop_unchanged(value)
+    curr_all = analytics.position_metrics(curr_all, newest)
+    rec_sold, rec_buy = portfolio.recent_trades(curr_all)
+    metrics = analytics.summary(perf, curr_all)
+
+    write_tables({'value_per_investor': value, 'positions': curr_all,
+                  'recent_sold': rec_sold, 'recent_bought': rec_buy,
+                  'daily_performance': perf, 'investor_metrics': metrics, **cons}, data_path)
+    write_state(dict(key, last_date=newest.strftime('%Y-%m-%d'), prices_through=prices_through, first_closes=firsts, full_build=full,
+                     built=dt.datetime.now().isoformat(timespec='seconds')), data_path)
+    return len([d for d in dates if last is None or d > last]), full
+
+
+if __name__ == '__main__':
+    ## python -m mk.tables [data path] [--full]
+    import sys
+    args = [a for a in sys.argv[1:] if a != '--full']
+    data_path = args[0] if args else Path(__file__).parent.parent / 'data'
+    from mk import jobs
+    n, full = jobs.build(data_path, full='--full' in sys.argv)
+    print(n, 'snapshot dates added to', tables_path(data_path), '(full build)' if full else '',
+          'at', dt.datetime.now().isoformat(timespec='seconds'))
@@ -0,0 +1,22 @@
+# Vectorized price lookups and returns for the position tables
+# - one fancy-indexing lookup into the Date x Instrument price matrix instead of a .loc per row
+
+import numpy as np
+import pandas as pd
+
+
+def lookup_prices(prices, dates, instruments):
+    """prices.loc[date, instrument] for many (date, instrument) pairs at once; NaN where a pair is missing."""
+    rows = prices.index.get_indexer(pd.to_datetime(pd.Series(dates)).to_numpy())
+    cols = prices.columns.get_indexer(pd.Series(instruments).to_numpy())
+    values = prices.to_numpy(dtype=float)[rows, cols]
+    values[(rows < 0) | (cols < 0)] = np.nan
+    return values
+
+
+def add_returns(positions, prices):
+    """Add BuyPrice (at BuyDate), LastPrice (at LastSeen) and Return to a position table."""
+    positions['BuyPrice'] = lookup_prices(prices, positions.BuyDate, positions.Instrument)
+    positions['LastPrice'] = lookup_prices(prices, positions.LastSeen, positions.Instrument)
+    positions['Return'] = (positions.LastPrice - positions.BuyPrice) / positions.BuyPrice
+    return positions
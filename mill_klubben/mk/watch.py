@@ -0,0 +1,187 @@
+# Change detection daemon for the Millionærklubben page
+# - polls the page with conditional requests (mk.saxo); the interval adapts to the time of day: short while the
+#   exchanges are open, long overnight and at weekends (Copenhagen time), never sleeping past the next open
+# - a changed page is parsed and diffed against the last known holdings in memory (mk.events), the
+#   BUY / SELL / INCREASE / DECREASE events go to all sinks at once: stdout, a JSON lines file, a webhook
+# - a sink that fails keeps its events and gets them again, before the new ones, at the next poll; the other sinks
+#   are not held up and get every event once
+# - the daily snapshot is still stored by the cronjob, the daemon only notifies
+# - run with `python -m mk.watch [--file events.jsonl] [--webhook URL] [--url PAGE_URL]`
+
+import sys
+import json
+import asyncio
+import datetime as dt
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+from mk import saxo, store, events, instruments, corporate_actions
+
+
+TZ = ZoneInfo('Europe/Copenhagen')
+MARKET_HOURS = (9, 22) # from the Copenhagen open to the New York close, local time
+MARKET_INTERVAL = 5*60 # seconds between polls on weekdays during MARKET_HOURS
+OFF_HOURS_INTERVAL = 60*60
+WEEKEND_INTERVAL = 4*60*60
+ERROR_INTERVAL = 60 # first retry after a failed poll, doubled for every further failure
+SHOW_COLUMNS = ['Date', 'Investor', 'Instrument', 'Event', 'Quantity', 'Price', 'Currency']
+
+
+def next_open(now):
+    """Start of the next weekday market session after `now`."""
+    day = now.replace(hour=MARKET_HOURS[0], minute=0, second=0, microsecond=0)
+    if day <= now:
+        day += dt.timedelta(days=1)
+    while day.weekday() >= 5:
+        day += dt.timedelta(days=1)
+    return day
+
+
+def interval(now=None):
+    """Seconds until the next poll."""
+    now = now or dt.datetime.now(TZ)
+    if now.weekday() < 5 and MARKET_HOURS[0] <= now.hour < MARKET_HOURS[1]:
+        return MARKET_INTERVAL
+    wait = WEEKEND_INTERVAL if now.weekday() >= 5 else OFF_HOURS_INTERVAL
+    return min(wait, (next_open(now) - now).total_seconds())
+
+
+def diff(prev, current, when):
+    """Trade events between the last known holdings and the current page, dated `when`."""
+    if prev is None:
+        return pd.DataFrame(columns=events.EVENT_COLUMNS)
+    current = current.assign(Date=pd.Timestamp(when))
+    ## a split is not a trade, both are compared in post-split shares
+    both = corporate_actions.adjust_quantities(pd.concat([prev, current], axis=0, ignore_index=True))
+    ev = events.derive_events(both, initial=False)
+    return ev.loc[ev.Date == pd.Timestamp(when)].reset_index(drop=True)
+
+
+def to_records(ev):
+    return json.loads(ev.to_json(orient='records', date_format='iso'))
+
+
+class StdoutSink:
+
+    def __call__(self, ev):
+        print(ev[SHOW_COLUMNS].to_string(index=False), flush=True)
+
+
+class FileSink:
+    """Append every event as one JSON line."""
+
+    def __init__(self, file):
+        self.file = Path(file)
+
+    def __call__(self, ev):
+        with open(self.file, 'a') as f:
+            for record in to_records(ev):
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class WebhookSink:
+    """POST {"events": [...]} to a URL, e.g. a local notification service."""
+
+    def __init__(self, url, session=None, timeout=10):
+        self.url = url
+        self.session = session or saxo.pooled_session()
+        self.timeout = timeout
+
+    def __call__(self, ev):
+        self.session.post(self.url, json={'events': to_records(ev)}, timeout=self.timeout).raise_for_status()
+
+
+class Watcher:
+    """Poll the page and send the changes against the last known holdings to the sinks.
+
+    holdings are the normalized rows of the last known state (e.g. the newest stored snapshot), None means the
+    first successful poll only sets the state. `interval` is called for the seconds to the next poll.
+    """
+
+    def __init__(self, sinks, url=saxo.URL, holdings=None, interval=interval, session=None):
+        self.sinks = list(sinks)
+        self.url = url
+        self.holdings = holdings
+        self.interval = interval
+        self.session = session or saxo.pooled_session()
+        self.validators = {}
+        self.undelivered = [None] * len(self.sinks) # per sink the events of failed deliveries
+
+    def check(self, when=None):
+        """One blocking fetch and diff; the events since the last check."""
+        content, validators = saxo.fetch(self.url, session=self.session, validators=self.validators)
+        if content is None:
+            return pd.DataFrame(columns=events.EVENT_COLUMNS)
+        when = pd.Timestamp(when or dt.datetime.now(TZ).replace(tzinfo=None))
+        current = instruments.normalize(saxo.parse_page(content), drop_delisted=True).drop(columns='Delisted')
+        ev = diff(self.holdings, current, when)
+        self.holdings, self.validators = current.assign(Date=when), validators
+        return ev
+
+    async def deliver(self, ev):
+        """Send ev, after the events a sink missed before, to every sink; a sink that fails keeps them for the next call.
+
+        Raises RuntimeError naming the failed sinks once all sinks ran.
+        """
+        batches = [ev if kept is None else pd.concat([kept, ev], ignore_index=True) for kept in self.undelivered]
+        send = [i for i, b in enumerate(batches) if len(b)]
+        results = await asyncio.gather(*[asyncio.to_thread(self.sinks[i], batches[i]) for i in send], return_exceptions=True)
+        failed = []
+        for i, result in zip(send, results):
+            self.undelivered[i] = batches[i] if isinstance(result, Exception) else None
+            if isinstance(result, Exception):
+                failed.append('%s (%d events kept): %s: %s' % (type(self.sinks[i]).__name__, len(batches[i]), type(result).__name__, result))
+        if failed:
+            raise RuntimeError('delivery failed: ' + '; '.join(failed))
+
+    async def poll(self):
+        ev = await asyncio.to_thread(self.check)
+        await self.deliver(ev)
+        return ev
+
+    async def run(self, polls=None):
+        """Poll until cancelled (or `polls` times)."""
+        n, errors = 0, 0
+        while polls is None or n < polls:
+            try:
+                await self.poll()
+                errors = 0
+            except Exception as e:
+                errors += 1
+                print(dt.datetime.now().isoformat(timespec='seconds'), 'poll failed:', type(e).__name__, e, file=sys.stderr)
+            n += 1
+            if polls is None or n < polls:
+                wait = self.interval()
+                await asyncio.sleep(min(wait, ERROR_INTERVAL * 2**(errors-1)) if errors else wait)
+
+
+def stored_holdings(data_path):
+    """Normalized rows of the newest stored snapshot, the starting state of the daemon."""
+    dates = store.snapshot_dates(data_path)
+    if not dates:
+        return None
+    last = store.load_snapshots(data_path, start_date=dates[-1], end_date=dates[-1])
+    return instruments.normalize(last, drop_delisted=True).drop(columns='Delisted')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Notify about changes of the Millionærklubben portfolios.')
+    parser.add_argument('--url', default=saxo.URL)
+    parser.add_argument('--data', default=Path(__file__).parent.parent / 'data', help='snapshot store for the starting state')
+    parser.add_argument('--file', help='append the events as JSON lines')
+    parser.add_argument('--webhook', help='POST the events to this URL')
+    args = parser.parse_args()
+
+    sinks = [StdoutSink()]
+    if args.file:
+        sinks.append(FileSink(args.file))
+    if args.webhook:
+        sinks.append(WebhookSink(args.webhook))
+    watcher = Watcher(sinks, url=args.url, holdings=stored_holdings(args.data))
+    try:
+        asyncio.run(watcher.run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,6 @@
+# Tests of the mk package, run with `python -m pytest tests` from mill_klubben/
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from mk import analytics, holdings
+
+
+DATES = pd.date_range('2024-01-01', periods=4, name='Date')
+
+
+def cube(rows):
+    m = pd.DataFrame(rows, columns=['Date', 'Investor', 'Instrument', 'Quantity'])
+    return holdings.Holdings.from_snapshots(m.assign(Date=DATES[m.Date]))
+
+
+def wide(flows, final, dates):
+    ## the Flow and Value matrices mwr needs, one column per investor
+    flow = pd.DataFrame(flows, index=dates)
+    value = flow * 0
+    value.iloc[-1] = final
+    return pd.concat({'Value': value, 'Base': value * 0, 'Gain': value * 0, 'Flow': flow}, axis=1)
+
+
+def test_twr_does_not_count_a_purchase_as_performance():
+    ## Anna buys 10 at 100, the price rises to 110, she buys 10 more and the price falls to 99
+    prices = pd.DataFrame({'NOVO': [100.0, 110.0, 110.0, 99.0]}, index=DATES)
+    c = cube([(0, 'Anna', 'NOVO', 10), (1, 'Anna', 'NOVO', 10), (2, 'Anna', 'NOVO', 20), (3, 'Anna', 'NOVO', 20)])
+    d = analytics.daily(c, prices)
+    assert list(d.Flow) == [1000.0, 0.0, 1100.0, 0.0]
+    assert list(d.Gain) == [0.0, 100.0, 0.0, -220.0]
+
+    s = analytics.series(d)
+    assert np.allclose(s['TWR'].Anna, [1.0, 1.1, 1.1, 0.99])
+    assert np.isclose(s['Drawdown'].Anna.min(), -0.1)
+    res = analytics.performance(d)
+    assert np.isclose(res.loc['Anna', 'TWR'], -0.01) and np.isclose(res.loc['Anna', 'MaxDrawdown'], -0.1)
+
+
+def test_an_instrument_without_a_price_on_both_days_has_no_gain():
+    prices = pd.DataFrame({'NOVO': [100.0, 110.0, 120.0, 130.0], 'GN': [np.nan, 10.0, 12.0, 12.0]}, index=DATES)
+    d = analytics.daily(cube([(i, 'Bo', 'NOVO', 1) for i in range(4)] + [(i, 'Bo', 'GN', 5) for i in range(4)]), prices)
+    assert list(d.Gain) == [0.0, 10.0, 20.0, 10.0]
+    assert list(d.Base) == [0.0, 100.0, 160.0, 180.0]
+
+
+def test_mwr_converges_for_all_investors_at_once():
+    year = pd.DatetimeIndex(['2024-01-01', '2024-12-31'])
+    r = analytics.mwr(wide({'A': [100.0, 0], 'B': [100.0, 0], 'C': [0.0, 0]}, [150.0, 60.0, 0.0], year))
+    assert np.allclose(r[['A', 'B']], [0.5, -0.4]) and np.isnan(r.C)
+
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2024-01-01', periods=120, freq='3D')
+    flows = np.where(rng.random((120, 50)) < 0.1, rng.uniform(-50, 150, (120, 50)), 0)
+    flows[0] = rng.uniform(50, 150, 50)
+    final = flows.sum(axis=0) * rng.uniform(0.5, 2.0, 50)
+    r = analytics.mwr(wide(flows, final, dates)).to_numpy()
+    ## the net present value of the flows at the found rate is zero
+    t = ((dates - dates[0]).days / analytics.DAYS_PER_YEAR).to_numpy()[:, None]
+    cf = -flows
+    cf[-1] += final
+    assert np.abs((cf * (1 + r) ** -t).sum(axis=0)).max() < 1e-9 * np.abs(cf).sum(axis=0).min()
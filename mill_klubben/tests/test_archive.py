@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from mk import archive, standin, store
+
+
+URL = 'http://saxo.example/mk'
+DAYS = ['2024-01-15', '2024-01-16', '2024-01-17']
+
+
+def snapshot(qty):
+    return pd.DataFrame({'Investor': ['Anna', 'Bo'], 'Instrument': ['NOVO B', 'DSV'], 'Stockexchange': 'xcse',
+                         'Currency': 'DKK', 'Antal': [qty, 3], 'Åbningspris': [700.5, 1500.0]})
+
+
+def archived(path):
+    """A store with the rows of an older parser (Antal 1) and the archived pages of the same days."""
+    store.write_snapshots(pd.concat([snapshot(1).assign(Date=d) for d in DAYS]), path)
+    for i, d in enumerate(DAYS):
+        page = standin.render_page(snapshot(10 + i))
+        if d == '2024-01-16':
+            ## a table without its investor heading
+            page = page.replace('<h2 class="highlight">Bo</h2>', '')
+        archive.save(path, d, URL, page.encode(), fetched=d + 'T08:00')
+    return path
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_a_page_that_fails_keeps_its_stored_rows(tmp_path, workers):
+    path = archived(tmp_path)
+    days, rows, failed = archive.reparse(path, workers=workers)
+    assert (days, rows) == (2, 4)
+    assert list(failed.Date) == [pd.Timestamp('2024-01-16')] and failed.Error.str.startswith('ValueError').all()
+
+    df = store.load_snapshots(path)
+    anna = df.loc[df.Investor == 'Anna'].set_index('Date').Antal
+    assert anna.to_dict() == {pd.Timestamp('2024-01-15'): 10, pd.Timestamp('2024-01-16'): 1, pd.Timestamp('2024-01-17'): 12}
+
+
+def test_the_store_is_swapped_by_one_link(tmp_path):
+    path = archived(tmp_path)
+    archive.reparse(path, workers=1)
+    current = store.store_path(path)
+    first = current.resolve()
+    assert current.is_symlink() and archive._versions(path) == [first]
+
+    archive.reparse(path, workers=1)
+    assert archive._versions(path) == [current.resolve()] and current.resolve() != first
+    assert not (path / 'reparse.tmp').exists()
+
+    ## stopped after the new version was complete, before the link: the next run starts from it
+    current.unlink()
+    archive.recover(path)
+    assert current.resolve() == archive._versions(path)[-1]
+    assert len(store.load_snapshots(path)) == 6
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from mk import backtest, holdings
+
+
+def calendar_prices():
+    ## Thu 2024-01-04 .. Tue 2024-01-09, forward filled over the weekend like pricedb.query(full_dates=True)
+    dates = pd.date_range('2024-01-04', '2024-01-09', name='Date')
+    prices = pd.DataFrame({'AAA': [10.0, 11.0, 11.0, 11.0, 12.0, 13.0]}, index=dates)
+    sessions = pd.DatetimeIndex(['2024-01-04', '2024-01-05', '2024-01-08', '2024-01-09'])
+    return prices, sessions
+
+
+def test_trading_days_skip_the_weekend():
+    prices, sessions = calendar_prices()
+    days = backtest.trading_days(prices, sessions, '2024-01-04')
+    assert list(days.day_name()) == ['Thursday', 'Friday', 'Monday', 'Tuesday']
+
+
+def test_one_day_delay_over_the_weekend_lands_on_monday():
+    prices, sessions = calendar_prices()
+    ## bought on Friday's snapshot, the snapshots are calendar days
+    snaps = pd.date_range('2024-01-04', '2024-01-09')
+    snapshots = pd.DataFrame({'Date': snaps[1:], 'Investor': 'A', 'Instrument': 'AAA', 'Quantity': 5.0})
+    cube = holdings.Holdings.from_snapshots(snapshots, dates=snaps)
+
+    days = backtest.trading_days(prices, sessions, cube.dates[0])
+    obs = backtest.observed(cube.dates, days, 1)
+    q = backtest.follower_holdings(cube.qty[:, 0, :], prices.loc[days].to_numpy(), obs, ('mirror', 1))
+    held = pd.Series(q[:, 0], index=days)
+    assert held.loc['2024-01-05'] == 0
+    assert held.idxmax() == pd.Timestamp('2024-01-08')
+
+    comparison, curves = backtest.sweep(cube, prices, sessions, delays=[1], sizings=[('mirror', 1)], workers=1)
+    assert not curves['PnL'].index.dayofweek.isin([5, 6]).any()
+    ## bought at Monday's close of 12, valued at Tuesday's 13
+    assert np.isclose(comparison.PnL.iloc[0], 5 * (13 - 12))
+    assert comparison.Trades.iloc[0] == 1
@@ -0,0 +1,40 @@
+import threading
+
+import pandas as pd
+
+from mk import cache
+
+
+def frame(key):
+    return pd.DataFrame({'Key': [key] * 1000, 'Value': range(1000)})
+
+
+def test_cached_frame_is_recomputed_for_a_new_key(tmp_path):
+    file = tmp_path / 'cache' / 'prices.parquet'
+    calls = []
+    compute = lambda key: lambda: calls.append(key) or frame(key)
+    for key in ['a', 'a', 'b', 'b']:
+        pd.testing.assert_frame_equal(cache.cached_frame(file, key, compute(key)), frame(key))
+    assert calls == ['a', 'b']
+    assert sorted(p.name for p in file.parent.iterdir()) == ['prices.parquet', 'prices.parquet.key']
+
+
+def test_concurrent_sessions_never_read_a_torn_file(tmp_path):
+    file = tmp_path / 'prices.parquet'
+    errors = []
+
+    def session(key):
+        try:
+            for _ in range(30):
+                got = cache.cached_frame(file, key, lambda: frame(key))
+                assert len(got) == 1000 and got.Key.nunique() == 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(k,)) for k in 'abab']
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['prices.parquet', 'prices.parquet.key']
@@ -0,0 +1,62 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from mk import consensus
+
+
+D1, D2 = pd.Timestamp('2024-01-15'), pd.Timestamp('2024-01-16')
+PRICES = pd.DataFrame({'NOVO': [100.0, 100.0], 'DSV': [50.0, 50.0], 'GN': [10.0, 10.0]}, index=pd.DatetimeIndex([D1, D2]))
+
+
+def holdings(rows):
+    return pd.DataFrame(rows, columns=['Date', 'Investor', 'Instrument', 'Quantity'])
+
+
+M = holdings([(D1, 'Anna', 'NOVO', 3), (D1, 'Anna', 'DSV', 2), (D1, 'Bo', 'DSV', 4), (D1, 'Carl', 'GN', 5),
+              (D2, 'Anna', 'NOVO', 3), (D2, 'Anna', 'DSV', 2), (D2, 'Bo', 'DSV', 4), (D2, 'Bo', 'NOVO', 1),
+              (D2, 'Carl', 'GN', 5), (D2, 'Carl', 'NOVO', 0)])
+
+
+def test_consensus_and_new_consensus():
+    h = consensus.sparse_holdings(M, PRICES)
+    ## the sold position (quantity 0) is no holding
+    assert len(h) == 9
+    assert h.groupby(['Date', 'Investor']).Weight.sum().round(12).eq(1).all()
+
+    c = consensus.consensus(h).set_index(['Date', 'Instrument'])
+    assert c.loc[(D2, 'NOVO'), ['Holders', 'Investors', 'Value']].tolist() == [2, 'Anna, Bo', 400.0]
+    assert c.loc[(D1, 'NOVO'), 'Holders'] == 1
+
+    ev = consensus.new_consensus(c.reset_index(), [D1, D2])
+    assert list(zip(ev.Date, ev.Instrument, ev.PrevHolders, ev.Holders)) == [(D2, 'NOVO', 1, 2)]
+
+
+def test_overlap_of_every_pair():
+    o = consensus.overlap(consensus.sparse_holdings(M, PRICES)).set_index(['Date', 'InvestorA', 'InvestorB'])
+    ## all pairs, also those without a shared instrument
+    assert len(o.loc[D1]) == 3 and o.loc[(D1, 'Anna', 'Carl'), ['Shared', 'Jaccard', 'ValueOverlap']].tolist() == [0, 0.0, 0.0]
+    ## Anna 300 NOVO + 100 DSV, Bo 200 DSV: shared DSV, min(0.25, 1)
+    assert o.loc[(D1, 'Anna', 'Bo'), ['HeldA', 'HeldB', 'Shared', 'Jaccard', 'ValueOverlap']].tolist() == [2, 1, 1, 0.5, 0.25]
+    ## Bo 200 DSV + 100 NOVO: both shared, min(0.75, 1/3) + min(0.25, 2/3)
+    assert o.loc[(D2, 'Anna', 'Bo'), 'Jaccard'] == 1.0
+    assert np.isclose(o.loc[(D2, 'Anna', 'Bo'), 'ValueOverlap'], 1 / 3 + 0.25)
+
+
+def test_overlap_equals_the_dense_cube():
+    rng = np.random.default_rng(1)
+    investors, instruments = ['I%d' % i for i in range(5)], list(PRICES.columns)
+    m = holdings([(d, i, s, rng.integers(1, 5)) for d in PRICES.index for i in investors for s in instruments if rng.random() < 0.5])
+    o = consensus.overlap(consensus.sparse_holdings(m, PRICES)).set_index(['Date', 'InvestorA', 'InvestorB'])
+
+    value = m.assign(V=m.Quantity * PRICES.stack().reindex(pd.MultiIndex.from_frame(m[['Date', 'Instrument']])).to_numpy())
+    cube = value.pivot_table(index=['Date', 'Investor'], columns='Instrument', values='V', aggfunc='sum', fill_value=0)
+    for (d, a), (d2, b) in itertools.combinations(cube.index, 2):
+        if d != d2:
+            continue
+        x, y = cube.loc[(d, a)].to_numpy(), cube.loc[(d, b)].to_numpy()
+        shared, either = ((x > 0) & (y > 0)).sum(), ((x > 0) | (y > 0)).sum()
+        row = o.loc[(d, a, b)]
+        assert row.Shared == shared and np.isclose(row.Jaccard, shared / either)
+        assert np.isclose(row.ValueOverlap, np.minimum(x / x.sum(), y / y.sum()).sum())
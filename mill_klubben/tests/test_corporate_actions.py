@@ -0,0 +1,47 @@
+import pandas as pd
+
+from mk import corporate_actions
+
+
+def rows(investor, instrument, days, antal, price):
+    dates = pd.date_range(*days) if isinstance(days, tuple) else pd.DatetimeIndex(days)
+    return pd.DataFrame({'Date': dates, 'Investor': investor, 'Instrument': instrument, 'Antal': antal, 'Åbningspris': price})
+
+
+def nvda_snapshots():
+    return pd.concat([
+        ## the website switched A's position two days after the split, B's three days before it
+        rows('A', 'NVDA', ('2024-06-03', '2024-06-11'), 10, 1200.0), rows('A', 'NVDA', ('2024-06-12', '2024-06-17'), 100, 120.0),
+        rows('B', 'NVDA', ('2024-06-03', '2024-06-06'), 5, 1000.0), rows('B', 'NVDA', ('2024-06-07', '2024-06-17'), 50, 100.0),
+        ## C bought after the split, A's other stock is not touched
+        rows('C', 'NVDA', ('2024-06-14', '2024-06-17'), 30, 130.0), rows('A', 'AAPL', ('2024-06-03', '2024-06-17'), 7, 190.0),
+    ], ignore_index=True)
+
+
+def test_nvda_split_switch_is_detected_per_investor():
+    snapshots = nvda_snapshots()
+    actions = corporate_actions.read_actions()
+    factor = pd.Series(corporate_actions.quantity_factors(snapshots, actions))
+    switch = {'A': '2024-06-12', 'B': '2024-06-07', 'C': '2024-06-10'}
+    nvda = snapshots.Instrument == 'NVDA'
+    expected = (nvda & (snapshots.Date < snapshots.Investor.map(switch).astype('datetime64[ns]'))).map({True: 10.0, False: 1.0})
+    pd.testing.assert_series_equal(factor, expected, check_names=False)
+
+    adjusted = corporate_actions.adjust_quantities(snapshots, actions)
+    last = adjusted.groupby(['Investor', 'Instrument']).agg(Antal=('Antal', 'unique'), Price=('Åbningspris', 'unique'))
+    assert last.Antal.map(list).to_dict() == {('A', 'AAPL'): [7], ('A', 'NVDA'): [100], ('B', 'NVDA'): [50], ('C', 'NVDA'): [30]}
+    assert last.Price.map(list).to_dict() == {('A', 'AAPL'): [190.0], ('A', 'NVDA'): [120.0], ('B', 'NVDA'): [100.0], ('C', 'NVDA'): [130.0]}
+
+
+def test_only_unadjusted_histories_are_divided():
+    dates = pd.bdate_range('2024-06-03', '2024-06-14', name='Date')
+    before = dates < '2024-06-10'
+    prices = pd.DataFrame({'NVDA': [1200.0 if b else 121.0 for b in before], 'AAPL': 190.0}, index=dates)
+    splits = corporate_actions.unadjusted_splits(prices)
+    assert list(splits.Instrument) == ['NVDA']
+    adjusted = corporate_actions.apply_splits(prices, splits)
+    assert list(adjusted.NVDA) == [120.0 if b else 121.0 for b in before]
+    pd.testing.assert_series_equal(adjusted.AAPL, prices.AAPL)
+    ## a history the provider already adjusted is left as it is
+    assert corporate_actions.unadjusted_splits(adjusted).empty
+    pd.testing.assert_frame_equal(corporate_actions.adjusted_prices(adjusted), adjusted)
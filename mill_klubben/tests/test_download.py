@@ -0,0 +1,70 @@
+import time
+
+import pandas as pd
+
+from mk import download, standin
+
+
+def closes(n=5, start='2024-01-15'):
+    return pd.DataFrame({'Date': pd.bdate_range(start, periods=n), 'Close': [10.0 + i for i in range(n)]})
+
+
+def test_asx_bars_get_the_exchange_date():
+    ## the session of 15 January opens at 10:00 in Sydney, 23:00 UTC on the 14th
+    opens = pd.Timestamp('2024-01-15 10:00', tz='Australia/Sydney')
+    response = {'timestamp': [int(opens.timestamp())], 'indicators': {'quote': [{'close': [4.2]}]}}
+    payload = lambda meta: {'spark': {'result': [{'symbol': 'MMM.AX', 'response': [dict(response, meta=meta)]}]}}
+
+    frame = download.spark_to_frames(payload({'exchangeTimezoneName': 'Australia/Sydney', 'gmtoffset': 39600}))['MMM.AX']
+    assert list(frame.Date) == [pd.Timestamp('2024-01-15')]
+    assert download.spark_to_frames(payload({'gmtoffset': 39600}))['MMM.AX'].Date.iloc[0] == pd.Timestamp('2024-01-15')
+    assert download.spark_to_frames(payload({}))['MMM.AX'].Date.iloc[0] == pd.Timestamp('2024-01-14')
+
+
+def test_download_from_the_stand_in_in_batches():
+    frames = {'T%02d' % i: closes() for i in range(45)}
+    frames['MMM.AX'] = closes()
+    got = {}
+    srv = standin.PriceServer(frames, today='2024-01-19', timezones={'MMM.AX': 'Australia/Sydney'})
+    with srv as url:
+        summary = download.download(list(frames), download.YahooFetcher(url), workers=3, on_result=got.__setitem__)
+    assert (summary.Status == 'ok').all() and (summary.Attempts == 1).all()
+    assert sorted(len(r) for r in srv.requests) == [6, 20, 20]
+    for t, frame in frames.items():
+        pd.testing.assert_frame_equal(got[t], frame, check_dtype=False, check_index_type=False)
+
+
+def test_failed_batches_are_retried():
+    frames = {'AAA': closes(), 'BBB': closes()}
+    srv = standin.PriceServer(frames, fail_next=2, today='2024-01-19')
+    with srv as url:
+        summary = download.download(list(frames), download.YahooFetcher(url), retries=3, backoff=0.01)
+    assert (summary.Status == 'ok').all()
+    assert list(summary.Attempts) == [3, 3]
+
+    srv = standin.PriceServer(frames, fail_next=5, today='2024-01-19')
+    with srv as url:
+        summary = download.download(list(frames), download.YahooFetcher(url), retries=2, backoff=0.01)
+    assert (summary.Status == 'failed').all()
+    assert summary.Error.str.contains('503').all()
+    assert len(srv.requests) == 3
+
+
+def test_429_holds_back_the_host_for_retry_after():
+    frames = {'AAA': closes()}
+    srv = standin.PriceServer(frames, fail_next=1, fail_status=429, retry_after=1, today='2024-01-19')
+    with srv as url:
+        t = time.monotonic()
+        summary = download.download(list(frames), download.YahooFetcher(url), backoff=0)
+        elapsed = time.monotonic() - t
+    assert summary.Status.iloc[0] == 'ok' and summary.Attempts.iloc[0] == 2
+    assert elapsed >= 0.9
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = download.RateLimiter(20)
+    t = time.monotonic()
+    for _ in range(5):
+        limiter.wait('http://a.example/x')
+    limiter.wait('http://b.example/x')
+    assert 0.18 <= time.monotonic() - t < 1.0
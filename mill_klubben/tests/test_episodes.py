@@ -0,0 +1,48 @@
+import pandas as pd
+
+from mk import episodes
+
+
+def holdings(rows):
+    return pd.DataFrame(rows, columns=['Date', 'Investor', 'Instrument', 'Quantity']).assign(Date=lambda x: pd.to_datetime(x.Date))
+
+
+## Anna sells NOVO on the 17th and buys it back on the 18th; Bo's table is missing from the page on the 17th
+M = holdings([
+    ('2024-01-15', 'Anna', 'NOVO', 10), ('2024-01-15', 'Anna', 'DSV', 1), ('2024-01-15', 'Bo', 'GN', 20),
+    ('2024-01-16', 'Anna', 'NOVO', 15), ('2024-01-16', 'Anna', 'DSV', 1), ('2024-01-16', 'Bo', 'GN', 20),
+    ('2024-01-17', 'Anna', 'DSV', 1),
+    ('2024-01-18', 'Anna', 'NOVO', 5), ('2024-01-18', 'Anna', 'DSV', 1), ('2024-01-18', 'Bo', 'GN', 10),
+    ('2024-01-19', 'Anna', 'NOVO', 5), ('2024-01-19', 'Bo', 'GN', 10),
+]).sample(frac=1, random_state=0)
+
+
+def test_a_sell_out_and_buy_back_gives_two_episodes():
+    x = episodes._runs(M)
+    day = x.set_index(['Investor', 'Date']).Day.groupby(level=[0, 1]).first()
+    assert list(day['Anna']) == [1, 2, 3, 4, 5]
+    ## the days are counted per investor, Bo's missing table does not make a gap
+    assert list(day['Bo']) == [1, 2, 3, 4]
+
+    labelled = episodes.label(M)
+    assert labelled.index.equals(M.index)
+    novo = labelled.loc[labelled.Instrument == 'NOVO'].sort_values('Date')
+    assert list(novo.Episode) == [0, 0, 1, 1]
+    assert (labelled.loc[labelled.Instrument != 'NOVO', 'Episode'] == 0).all()
+
+    ep = episodes.episodes(M).set_index(['Investor', 'Instrument', 'Episode'])
+    assert list(ep.index) == [('Anna', 'DSV', 0), ('Anna', 'NOVO', 0), ('Anna', 'NOVO', 1), ('Bo', 'GN', 0)]
+    assert ep.loc[('Anna', 'NOVO', 0), ['BuyDate', 'LastSeen']].tolist() == [pd.Timestamp('2024-01-15'), pd.Timestamp('2024-01-16')]
+    assert ep.loc[('Anna', 'NOVO', 1), ['BuyDate', 'LastSeen']].tolist() == [pd.Timestamp('2024-01-18'), pd.Timestamp('2024-01-19')]
+    ## the buy back is no decrease of the first episode
+    assert ep.loc[('Anna', 'NOVO', 0), ['Increases', 'Decreases']].tolist() == [1, 0]
+    assert ep.loc[('Anna', 'NOVO', 1), ['FirstQuantity', 'Increases', 'Decreases']].tolist() == [5, 0, 0]
+    assert ep.loc[('Bo', 'GN', 0), ['Snapshots', 'Decreases']].tolist() == [4, 1]
+
+
+def test_segments_follow_the_quantity_within_an_episode():
+    s = episodes.segments(M)
+    novo = s.loc[s.Instrument == 'NOVO']
+    assert list(zip(novo.Episode, novo.Quantity, novo.Change)) == [(0, 10, 10), (0, 15, 5), (1, 5, 5)]
+    gn = s.loc[s.Instrument == 'GN']
+    assert list(zip(gn.Start.dt.day, gn.End.dt.day, gn.Change)) == [(15, 16, 20), (18, 19, -10)]
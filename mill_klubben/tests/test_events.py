@@ -0,0 +1,47 @@
+import pandas as pd
+
+from mk import store, events
+
+
+def day(rows):
+    return pd.DataFrame(rows, columns=['Investor', 'Instrument', 'Antal', 'Åbningspris']).assign(
+        Stockexchange='xcse', Currency='DKK', Ticker=lambda x: x.Instrument)
+
+
+MON = day([('Anna', 'NOVO B', 10, 700.5), ('Anna', 'VWS', 5, 150.0), ('Bo', 'DSV', 3, 1500.0)])
+TUE = day([('Anna', 'NOVO B', 15, 710.0), ('Bo', 'DSV', 1, 1500.0), ('Bo', 'GN', 20, 120.0)])
+
+
+def test_derive_events_from_consecutive_days():
+    snapshots = pd.concat([MON.assign(Date='2024-01-15'), TUE.assign(Date='2024-01-16')])
+    ev = events.derive_events(snapshots)
+    assert list(ev.columns) == events.EVENT_COLUMNS
+    got = [(str(r.Date.date()), r.Investor, r.Instrument, r.Event, r.Quantity) for r in ev.itertuples()]
+    assert got == [('2024-01-15', 'Anna', 'NOVO B', 'BUY', 10), ('2024-01-15', 'Anna', 'VWS', 'BUY', 5),
+                   ('2024-01-15', 'Bo', 'DSV', 'BUY', 3),
+                   ('2024-01-16', 'Anna', 'NOVO B', 'INCREASE', 5), ('2024-01-16', 'Anna', 'VWS', 'SELL', -5),
+                   ('2024-01-16', 'Bo', 'DSV', 'DECREASE', -2), ('2024-01-16', 'Bo', 'GN', 'BUY', 20)]
+    ## a sold position keeps its last price
+    assert ev.loc[ev.Event == 'SELL', 'Price'].item() == 150.0
+    assert events.derive_events(snapshots, initial=False).Date.nunique() == 1
+
+
+def test_log_round_trip_and_same_day_rerun(tmp_path):
+    store.write_snapshot(MON, '2024-01-15', tmp_path)
+    ev = events.events_for_snapshot(TUE, '2024-01-16', tmp_path)
+    events.append_events(ev, tmp_path, dates=['2024-01-16'])
+    logged = events.load_events(tmp_path)
+    pd.testing.assert_frame_equal(logged[['Investor', 'Instrument', 'Event', 'Quantity']],
+                                  ev[['Investor', 'Instrument', 'Event', 'Quantity']], check_dtype=False)
+    assert list(logged.Date.unique()) == [pd.Timestamp('2024-01-16')]
+
+    ## a rerun of the day shows the page unchanged after all: no events, and none of the first run's left
+    ev = events.events_for_snapshot(MON, '2024-01-16', tmp_path)
+    assert ev.empty
+    events.append_events(ev, tmp_path, dates=['2024-01-16'])
+    assert events.load_events(tmp_path).empty
+
+    ## other days are kept
+    events.append_events(events.derive_events(MON.assign(Date='2024-01-15')), tmp_path)
+    events.append_events(ev, tmp_path, dates=['2024-01-16'])
+    assert list(events.load_events(tmp_path).Date.unique()) == [pd.Timestamp('2024-01-15')]
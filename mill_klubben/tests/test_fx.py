@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from mk import fx, pricedb
+
+
+def rates():
+    ## Friday and Monday, no rates at the weekend
+    return pd.DataFrame({'USD': [7.0, 7.2], 'DKK': 1.0}, index=pd.to_datetime(['2024-01-12', '2024-01-15']))
+
+
+def test_asof_takes_the_last_rate_on_or_before_each_date():
+    got = fx.asof(rates(), pd.to_datetime(['2024-01-15', '2024-01-13', '2024-01-12', '2024-01-20']))
+    assert list(got.USD) == [7.2, 7.0, 7.0, 7.2]
+    ## before the first rate there is none
+    assert fx.asof(rates(), pd.to_datetime(['2024-01-11'])).USD.isna().all()
+
+
+def test_lookup_rates_of_rows_in_any_order():
+    dates = ['2024-01-14', '2024-01-15', '2024-01-12', '2024-01-14']
+    got = fx.lookup_rates(rates(), dates, ['USD', 'USD', 'DKK', 'SEK'])
+    np.testing.assert_array_equal(got[:3], [7.0, 7.2, 1.0])
+    ## no column for the currency
+    assert np.isnan(got[3])
+
+
+def test_to_dkk_matches_columns_by_label():
+    prices = pd.DataFrame({'NOVO': [700.0, 710.0], 'AAPL': [180.0, 185.0]}, index=pd.to_datetime(['2024-01-13', '2024-01-15']))
+    got = fx.to_dkk(prices, {'AAPL': 'USD', 'NOVO': 'DKK'}, rates())
+    assert list(got.NOVO) == [700.0, 710.0]
+    assert list(got.AAPL) == [180.0 * 7.0, 185.0 * 7.2]
+
+
+def test_load_rates_from_the_price_db(tmp_path):
+    con = pricedb.connect(tmp_path / 'MK_PRICES.db')
+    pricedb.write_closes(con, fx.fx_instrument('USD'), pd.DataFrame({'Date': pd.to_datetime(['2024-01-12', '2024-01-15']), 'Close': [7.0, 7.2]}))
+    got = fx.load_rates(con, ['USD', 'DKK', 'EUR'], start='2024-01-10', end='2024-01-16')
+    con.close()
+    assert list(got.columns) == ['DKK', 'EUR', 'USD']
+    assert list(got.index) == list(pd.date_range('2024-01-10', '2024-01-16', name='Date'))
+    assert (got.DKK == 1).all() and (got.EUR == fx.FALLBACK['EUR']).all()
+    ## the weekend is forward filled, the days before the first rate take it
+    assert list(got.USD) == [7.0, 7.0, 7.0, 7.0, 7.0, 7.2, 7.2]
+    assert fx.fx_instruments(['USD', 'DKK', 'EUR']) == {'EURDKK=X': 'FX_EUR', 'USDDKK=X': 'FX_USD'}
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from mk import holdings
+
+
+D1, D2 = pd.Timestamp('2024-01-15'), pd.Timestamp('2024-01-16')
+PRICES = pd.DataFrame({'NOVO': [100.0, 110.0], 'GN': [10.0, np.nan]}, index=pd.DatetimeIndex([D1, D2]))
+
+
+def snapshots(rows):
+    return pd.DataFrame(rows, columns=['Date', 'Investor', 'Instrument', 'Quantity'])
+
+
+def test_cube_axes_and_values():
+    m = snapshots([(D1, 'Bo', 'GN', 5), (D1, 'Anna', 'NOVO', 2), (D2, 'Anna', 'NOVO', 3), (D2, 'Bo', 'GN', 5)])
+    c = holdings.Holdings.from_snapshots(m)
+    assert list(c.investors) == ['Anna', 'Bo'] and list(c.instruments) == ['GN', 'NOVO'] and c.qty.shape == (2, 2, 2)
+    assert c.qty[1, 0, 1] == 3 and c.qty[0, 0, 0] == 0
+    ## a missing price counts as 0
+    value = c.value_per_investor(PRICES)
+    assert value.loc[D1].tolist() == [200.0, 50.0] and value.loc[D2].tolist() == [330.0, 0.0]
+
+    ## rows outside the given axes are left out
+    c = holdings.Holdings.from_snapshots(m, dates=[D2], instruments=['NOVO'])
+    assert c.qty.shape == (1, 2, 1) and c.qty.sum() == 3
+
+
+def test_duplicate_rows_are_summed_like_their_amounts():
+    ## two website rows normalized to the same instrument, bought at different times
+    m = snapshots([(D1, 'Anna', 'NOVO', 2), (D1, 'Anna', 'NOVO', 4), (D1, 'Bo', 'GN', 5)])
+    c = holdings.Holdings.from_snapshots(m)
+    assert c.qty[0, 0, 1] == 6
+    per_row = (m.Quantity * m.Instrument.map(PRICES.loc[D1])).groupby(m.Investor).sum()
+    pd.testing.assert_series_equal(c.value_per_investor(PRICES).loc[D1], per_row, check_names=False, check_index_type=False)
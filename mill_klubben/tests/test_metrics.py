@@ -0,0 +1,64 @@
+import json
+import threading
+
+import pytest
+
+from mk import metrics
+
+
+def test_concurrent_runs_write_whole_prom_files(tmp_path):
+    errors = []
+
+    def job(i):
+        try:
+            run = metrics.Run('dashboard', tmp_path, textfile_dir=None)
+            run.record('load', 0.1 * i, rows=i)
+            for _ in range(20):
+                run.finish()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=job, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    path = tmp_path / metrics.METRICS_DIR
+    assert sorted(p.name for p in path.iterdir()) == ['dashboard.jsonl', 'mk_dashboard.prom']
+    assert (path / 'mk_dashboard.prom').read_text().endswith('\n')
+    assert (path / 'mk_dashboard.prom').stat().st_mode & 0o777 == 0o644
+
+
+def test_dashboard_runs_log_one_line(tmp_path):
+    run = metrics.Run('dashboard', tmp_path, textfile_dir=None, per_stage=False)
+    with run.stage('load', source='tables') as s:
+        s['rows'] = 3
+    with run.stage('render', figure='cached'):
+        pass
+    log = tmp_path / metrics.METRICS_DIR / 'dashboard.jsonl'
+    assert not log.exists()
+    run.finish()
+    lines = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [(r['stage'], r['status'], sorted(r['stages'])) for r in lines] == [('run', 'ok', ['load/tables', 'render/cached'])]
+    assert 'stage="load"' in (tmp_path / metrics.METRICS_DIR / 'mk_dashboard.prom').read_text()
+
+    ## a failing stage is logged when it fails
+    run = metrics.Run('dashboard', tmp_path, textfile_dir=None, per_stage=False)
+    with pytest.raises(KeyError):
+        with run.stage('valuation'):
+            raise KeyError('x')
+    assert json.loads(log.read_text().splitlines()[-1])['status'] == 'error'
+
+
+def test_a_full_log_is_rotated(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'MAX_BYTES', 1000)
+    run = metrics.Run('scrape', tmp_path, textfile_dir=None)
+    for i in range(30):
+        run.record('fetch', 0.1, rows=i)
+    path = tmp_path / metrics.METRICS_DIR
+    assert sorted(p.name for p in path.iterdir()) == ['scrape.jsonl', 'scrape.jsonl.1']
+    assert (path / 'scrape.jsonl.1').stat().st_size >= 1000
+    assert (path / 'scrape.jsonl').stat().st_size < 1000 + 200
+    last = [json.loads(line)['rows'] for line in (path / 'scrape.jsonl').read_text().splitlines()]
+    assert last[-1] == 29
@@ -0,0 +1,98 @@
+import time
+
+import pandas as pd
+
+from mk import pricedb, cache, download, standin
+
+
+def closes(dates, close):
+    return pd.DataFrame({'Date': pd.to_datetime(dates), 'Close': close})
+
+
+def test_data_version_changes_while_a_reader_is_open(tmp_path):
+    db = tmp_path / 'MK_PRICES.db'
+    con = pricedb.connect(db)
+    pricedb.write_closes(con, 'AAA', closes(['2024-01-02'], 10.0))
+    reader = pricedb.connect(db, readonly=True)
+    assert len(pricedb.query(reader, ['AAA'])) == 1
+    _, before = cache.data_version(tmp_path, db)
+
+    pricedb.write_closes(con, 'AAA', closes(['2024-01-03'], 11.0))
+    _, after = cache.data_version(tmp_path, db)
+    assert after > before
+    assert len(pricedb.query(reader, ['AAA'])) == 2
+    reader.close()
+    con.close()
+
+
+def test_data_version_ignores_readers(tmp_path):
+    db = tmp_path / 'MK_PRICES.db'
+    con = pricedb.connect(db)
+    pricedb.write_closes(con, 'AAA', closes(['2024-01-02'], 10.0))
+    pricedb.checkpoint(con)
+    con.close()
+    _, before = cache.data_version(tmp_path, db)
+
+    time.sleep(0.05)
+    ## a read-only session after the writer closed creates the -wal and -shm files again
+    reader = pricedb.connect(db, readonly=True)
+    assert len(pricedb.query(reader, ['AAA'])) == 1
+    reader.close()
+    assert cache.data_version(tmp_path, db)[1] == before
+    assert pricedb.version(tmp_path / 'missing.db') == ''
+
+
+def test_checkpoint_truncates_the_wal(tmp_path):
+    db = tmp_path / 'MK_PRICES.db'
+    con = pricedb.connect(db)
+    pricedb.write_closes(con, 'AAA', closes(['2024-01-02', '2024-01-03'], [10.0, 11.0]))
+    reader = pricedb.connect(db, readonly=True)
+    busy, _, _ = pricedb.checkpoint(con)
+    assert busy == 0
+    assert (tmp_path / 'MK_PRICES.db-wal').stat().st_size == 0
+    assert len(pricedb.query(reader, ['AAA'])) == 2
+    reader.close()
+    con.close()
+
+
+def test_watermark_tail_and_adjusted_history(tmp_path):
+    con = pricedb.connect(tmp_path / 'MK_PRICES.db')
+    days = pd.bdate_range('2024-01-01', '2024-01-31')
+    history = pd.DataFrame({'Date': days, 'Close': [100.0 + i for i in range(len(days))]})
+    ## the last close of the first download was fetched intraday
+    intraday = history.loc[history.Date <= '2024-01-19'].copy()
+    intraday.loc[intraday.index[-1], 'Close'] += 1
+    srv = standin.PriceServer({'AAA': intraday}, today='2024-01-19')
+    with srv as url:
+        summary = pricedb.update(con, {'AAA': 'AAA'}, download.YahooFetcher(url), today='2024-01-19', backoff=0)
+        assert summary.Refreshed.item() and summary.Rows.item() == len(intraday)
+        mark = pricedb.watermarks(con).loc['AAA']
+        assert mark.LastDate == pd.Timestamp('2024-01-19') and mark.LastClose == intraday.Close.iloc[-1]
+
+        ## the next run fetches from the watermark day on and overwrites its close
+        srv.httpd.frames, srv.httpd.today = {'AAA': history}, pd.Timestamp('2024-01-31')
+        summary = pricedb.update(con, {'AAA': 'AAA'}, download.YahooFetcher(url), today='2024-01-31', backoff=0)
+        assert not summary.Refreshed.item() and summary.Rows.item() == 9
+        pd.testing.assert_series_equal(pricedb.query(con, ['AAA'], full_dates=False).AAA, history.set_index('Date').Close,
+                                       check_names=False, check_freq=False)
+        assert pricedb.watermarks(con).loc['AAA'].LastDate == pd.Timestamp('2024-01-31')
+
+        ## a split: the stored closes are halved at the source, the whole history is fetched again
+        replaced_before = pricedb.version(tmp_path / 'MK_PRICES.db', pricedb.HISTORIES)
+        split = history.assign(Close=history.Close / 2)
+        srv.httpd.frames = {'AAA': split}
+        summary = pricedb.update(con, {'AAA': 'AAA'}, download.YahooFetcher(url), today='2024-01-31', backoff=0)
+        assert summary.Refreshed.item() and summary.Rows.item() == len(split)
+        assert list(pricedb.query(con, ['AAA'], full_dates=False).AAA) == list(split.Close)
+        assert pricedb.version(tmp_path / 'MK_PRICES.db', pricedb.HISTORIES) != replaced_before
+    con.close()
+
+
+def test_adjusted_compares_the_watermark_day():
+    mark = pd.Series({'LastDate': pd.Timestamp('2024-01-19'), 'LastClose': 100.0})
+    frame = closes(['2024-01-18', '2024-01-19', '2024-01-22'], [99.0, 105.0, 106.0])
+    assert not pricedb.adjusted(mark, frame)
+    assert pricedb.adjusted(mark, frame.assign(Close=frame.Close / 2))
+    assert not pricedb.adjusted(None, frame)
+    ## no close of the watermark day in the answer
+    assert not pricedb.adjusted(mark, frame.iloc[[0, 2]])
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from mk import saxo, standin
+
+
+def snapshot():
+    return pd.DataFrame({'Investor': ['Anna', 'Anna', 'Bo'], 'Instrument': ['Novo Nordisk B', 'Vestas', 'Apple'],
+                         'Stockexchange': ['CSE', 'CSE', 'NASDAQ'], 'Currency': ['DKK', 'DKK', 'USD'],
+                         'Antal': [10, 5, 3], 'Åbningspris': [700.5, 150.0, 180.25]})
+
+
+def test_tables_are_paired_with_their_heading():
+    df = saxo.parse_page(standin.render_page(snapshot()).encode())
+    assert list(df.Investor) == ['Anna', 'Anna', 'Bo']
+    assert list(df.Instrument) == ['Novo Nordisk B', 'Vestas', 'Apple']
+
+
+def test_missing_heading_raises_instead_of_misattributing():
+    page = standin.render_page(snapshot()).replace('<h2 class="highlight">Bo</h2>', '')
+    with pytest.raises(ValueError):
+        saxo.parse_page(page.encode())
+
+
+def test_heading_without_table_is_skipped():
+    page = standin.render_page(snapshot()).replace('<h2 class="highlight">Bo</h2>',
+                                                   '<h2 class="highlight">Carl</h2><h2 class="highlight">Bo</h2>')
+    page += '<h2 class="highlight">Nyheder</h2>'
+    df = saxo.parse_page(page.encode())
+    assert list(df.Investor) == ['Anna', 'Anna', 'Bo']
+
+
+def test_validators_are_kept_per_url(tmp_path):
+    saxo.save_validators(tmp_path, {'ETag': '"a"'}, url='http://a.example/')
+    saxo.save_validators(tmp_path, {'ETag': '"b"', 'Last-Modified': 'Mon, 15 Jan 2024 08:00:00 GMT'}, url='http://b.example/')
+    saxo.save_validators(tmp_path, {'ETag': '"a2"'}, url='http://a.example/')
+    assert saxo.read_validators(tmp_path, url='http://a.example/') == {'ETag': '"a2"'}
+    assert saxo.read_validators(tmp_path, url='http://b.example/')['ETag'] == '"b"'
+    assert saxo.read_validators(tmp_path, url='http://c.example/') == {}
+    assert [f.name for f in tmp_path.iterdir()] == [saxo.VALIDATORS_FILE]
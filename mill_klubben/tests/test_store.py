@@ -0,0 +1,60 @@
+import pandas as pd
+
+from mk import store
+
+
+def day(rows):
+    return pd.DataFrame(rows, columns=['Investor', 'Instrument', 'Antal', 'Åbningspris', 'Currency'])
+
+
+MON = day([('Anna', 'NOVO B', 10, 700.5, 'DKK'), ('Bo', 'DSV', 3, 1500.0, 'DKK')])
+WED = day([('Anna', 'NOVO B', 10, 700.5, 'DKK'), ('Bo', 'GN', 20, 120.0, 'DKK')])
+
+
+def test_a_repeated_day_is_only_a_manifest_entry(tmp_path):
+    assert store.write_snapshot(MON, '2024-01-15', tmp_path)
+    ## same holdings in another row order
+    assert not store.write_snapshot(MON.iloc[::-1], '2024-01-16', tmp_path)
+    assert store.write_snapshot(WED, '2024-01-17', tmp_path)
+    assert not store.write_snapshot(WED, '2024-01-18', tmp_path)
+
+    manifest = store.read_manifest(tmp_path)
+    assert list(manifest.Partition.isna()) == [False, True, False, True]
+    assert list(manifest.UnchangedSince.dropna()) == [pd.Timestamp('2024-01-15'), pd.Timestamp('2024-01-17')]
+    assert manifest.Hash.iloc[0] == manifest.Hash.iloc[1] == store.content_hash(MON)
+    assert list(pd.read_parquet(store.store_path(tmp_path) / '2024-01.parquet').Date.unique()) == \
+        [pd.Timestamp('2024-01-15'), pd.Timestamp('2024-01-17')]
+
+
+def test_unchanged_days_are_expanded_with_their_own_date(tmp_path):
+    store.write_snapshot(MON, '2024-01-15', tmp_path)
+    store.write_snapshot(MON, '2024-01-16', tmp_path)
+    store.write_snapshot(WED, '2024-01-17', tmp_path)
+
+    df = store.load_snapshots(tmp_path)
+    assert df.groupby('Date').size().to_dict() == {pd.Timestamp(d): 2 for d in ['2024-01-15', '2024-01-16', '2024-01-17']}
+    tue = df.loc[df.Date == '2024-01-16'].drop(columns='Date').reset_index(drop=True)
+    pd.testing.assert_frame_equal(tue, df.loc[df.Date == '2024-01-15'].drop(columns='Date').reset_index(drop=True))
+    assert list(store.load_snapshots(tmp_path, expand=False).Date.unique()) == \
+        [pd.Timestamp('2024-01-15'), pd.Timestamp('2024-01-17')]
+
+    ## the stored day of an unchanged one may lie before the window
+    one = store.load_snapshots(tmp_path, start_date='2024-01-16', end_date='2024-01-16', columns=['Instrument'])
+    assert list(one.columns) == ['Date', 'Instrument']
+    assert list(one.Date.unique()) == [pd.Timestamp('2024-01-16')] and sorted(one.Instrument) == ['DSV', 'NOVO B']
+
+
+def test_a_rerun_of_the_same_day_replaces_it(tmp_path):
+    store.write_snapshot(MON, '2024-01-15', tmp_path)
+    store.write_snapshot(WED, '2024-01-16', tmp_path)
+    ## the page changed back later that day: stored rows give way to an entry
+    assert not store.write_snapshot(MON, '2024-01-16', tmp_path)
+    manifest = store.read_manifest(tmp_path)
+    assert len(manifest) == 2 and manifest.UnchangedSince.iloc[1] == pd.Timestamp('2024-01-15')
+    assert list(pd.read_parquet(store.store_path(tmp_path) / '2024-01.parquet').Date.unique()) == [pd.Timestamp('2024-01-15')]
+
+    ## and the other way round
+    assert store.write_snapshot(WED, '2024-01-16', tmp_path)
+    manifest = store.read_manifest(tmp_path)
+    assert len(manifest) == 2 and manifest.UnchangedSince.isna().all()
+    assert sorted(store.load_snapshots(tmp_path, start_date='2024-01-16').Instrument) == ['GN', 'NOVO B']
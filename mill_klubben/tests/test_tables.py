@@ -0,0 +1,92 @@
+import pandas as pd
+
+from benchmarks import synthetic
+from mk import store, tables, jobs, pricedb
+
+
+def history(n_days=31):
+    """Instruments, closes and snapshots of a synthetic history that ends on a day with trades."""
+    ins = synthetic.make_instruments(16)
+    dates = pd.date_range(synthetic.portfolio.FIRST_DAY, periods=n_days, name='Date')
+    closes = synthetic.make_closes(ins, dates)
+    snapshots = synthetic.make_snapshots(ins, closes, dates, 3, positions=6, trade_rate=0.5)
+    ## end on a day with trades, so the new snapshot brings new rows
+    hashes = snapshots.groupby('Date').apply(store.content_hash)
+    last = hashes.index[hashes.ne(hashes.shift())][-1]
+    return closes, snapshots.loc[snapshots.Date <= last], last
+
+
+def data_dir(path, snapshots, closes):
+    path.mkdir()
+    synthetic.write_prices(closes, jobs.db_file(path))
+    store.write_snapshots(snapshots, path)
+    store.compact(path)
+    return path
+
+
+def add_snapshot(path, snapshots, date):
+    ## as the scraper stores it
+    assert store.write_snapshot(snapshots.loc[snapshots.Date == date].drop(columns='Date'), date, path)
+
+
+def assert_tables_equal(inc, full):
+    a, b = tables.read_tables(full), tables.read_tables(inc)
+    assert not a['consensus_events'].empty
+    for name in tables.TABLES:
+        pd.testing.assert_frame_equal(b[name], a[name], obj=name)
+
+
+def test_incremental_build_equals_full_build(tmp_path):
+    closes, snapshots, last = history()
+    n = snapshots.Date.nunique()
+
+    ## N snapshots, then the N+1th and an incremental build
+    inc = data_dir(tmp_path / 'inc', snapshots.loc[snapshots.Date < last], closes)
+    assert tables.build(inc, jobs.db_file(inc)) == (n - 1, True)
+    add_snapshot(inc, snapshots, last)
+    assert tables.build(inc, jobs.db_file(inc)) == (1, False)
+
+    full = data_dir(tmp_path / 'full', snapshots, closes)
+    assert tables.build(full, jobs.db_file(full), full=True) == (n, True)
+    assert_tables_equal(inc, full)
+
+
+def test_rewritten_last_close_is_valued_again(tmp_path):
+    closes, snapshots, last = history()
+    before = snapshots.loc[snapshots.Date < last]
+    ## the newest close of the first build was fetched intraday
+    known = closes.loc[:before.Date.max()].copy()
+    close_day = known.index[-1]
+    known.loc[close_day] *= 1.05
+
+    inc = data_dir(tmp_path / 'inc', before, known)
+    tables.build(inc, jobs.db_file(inc))
+    ## the next download stores the closes from the watermark day on, the final close of that day included
+    synthetic.write_prices(closes.loc[close_day:], jobs.db_file(inc))
+    add_snapshot(inc, snapshots, last)
+    assert tables.build(inc, jobs.db_file(inc)) == (1, False)
+
+    full = data_dir(tmp_path / 'full', snapshots, closes)
+    tables.build(full, jobs.db_file(full), full=True)
+    assert_tables_equal(inc, full)
+
+
+def test_only_a_replaced_history_rebuilds_everything(tmp_path):
+    closes, snapshots, last = history()
+    inc = data_dir(tmp_path / 'inc', snapshots.loc[snapshots.Date < last], closes)
+    db = jobs.db_file(inc)
+    tables.build(inc, db)
+
+    ## a newly bought instrument gets its first history
+    con = pricedb.connect(db)
+    pricedb.write_closes(con, 'NEW', pd.DataFrame({'Date': closes.index, 'Close': 10.0}))
+    con.close()
+    add_snapshot(inc, snapshots, last)
+    assert tables.build(inc, db) == (1, False)
+
+    ## the history of a covered instrument replaced by an adjusted one
+    con = pricedb.connect(db)
+    pricedb.replace_history(con, 'SYN000', pd.DataFrame({'Date': closes.index, 'Close': closes.SYN000 / 2}))
+    con.close()
+    add_snapshot(inc, snapshots.assign(Date=last + pd.Timedelta(days=1)), last + pd.Timedelta(days=1))
+    assert tables.build(inc, db)[1]
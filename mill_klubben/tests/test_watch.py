@@ -0,0 +1,50 @@
+import json
+import asyncio
+
+import pandas as pd
+import pytest
+
+from mk import standin, watch
+
+
+def page(rows):
+    snapshot = pd.DataFrame(rows, columns=['Investor', 'Instrument', 'Antal', 'Åbningspris'])
+    return standin.render_page(snapshot.assign(Stockexchange='xcse', Currency='DKK'))
+
+
+BEFORE = [('Anna', 'NOVO B', 10, 700.5), ('Anna', 'VWS', 5, 150.0), ('Bo', 'DSV', 3, 1500.0)]
+AFTER = [('Anna', 'NOVO B', 10, 700.5), ('Bo', 'DSV', 3, 1500.0), ('Bo', 'GN', 20, 120.0)]
+
+
+def test_a_failed_webhook_gets_its_events_at_the_next_poll(tmp_path):
+    file = tmp_path / 'events.jsonl'
+    pages, hook = standin.PageServer(page(BEFORE)), standin.HookServer()
+    with pages as page_url, hook as hook_url:
+        watcher = watch.Watcher([watch.FileSink(file), watch.WebhookSink(hook_url)], url=page_url)
+        assert asyncio.run(watcher.poll()).empty
+
+        pages.set_page(page(AFTER))
+        hook.httpd.fail_next = 1
+        with pytest.raises(RuntimeError, match='WebhookSink'):
+            asyncio.run(watcher.poll())
+        ## the file sink is not held up by the webhook
+        lines = [json.loads(line) for line in file.read_text().splitlines()]
+        assert sorted((r['Investor'], r['Instrument'], r['Event']) for r in lines) == [('Anna', 'VWS', 'SELL'), ('Bo', 'GN', 'BUY')]
+        assert hook.requests == []
+
+        ## unchanged page (304): only the kept events go out, to the webhook only
+        assert asyncio.run(watcher.poll()).empty
+        assert [len(r['events']) for r in hook.requests] == [2]
+        assert len(file.read_text().splitlines()) == 2
+        assert pages.requests[-1] == 304
+
+
+def test_run_keeps_polling_after_a_failed_delivery(tmp_path, capsys):
+    pages, hook = standin.PageServer(page(BEFORE)), standin.HookServer(fail_next=1)
+    with pages as page_url, hook as hook_url:
+        watcher = watch.Watcher([watch.WebhookSink(hook_url)], url=page_url, interval=lambda: 0)
+        asyncio.run(watcher.poll())
+        pages.set_page(page(AFTER))
+        asyncio.run(watcher.run(polls=2))
+    assert 'delivery failed' in capsys.readouterr().err
+    assert [len(r['events']) for r in hook.requests] == [2]